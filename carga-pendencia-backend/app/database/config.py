@@ -2,6 +2,7 @@
 Configuração centralizada para conexões com Supabase e PostgreSQL
 """
 import os
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, List
 import logging
 from supabase import create_client, Client
@@ -153,20 +154,54 @@ def delete_cnpj(fila_id: int, user_id: Optional[int] = None) -> bool:
         logger.error(f"Erro ao excluir CNPJ com ID {fila_id}: {e}")
         return False
 
-def update_queue_item(fila_id: int, data: Dict[str, Any]) -> bool:
+def delete_cnpjs(fila_ids: List[int], user_id: Optional[int] = None) -> List[int]:
+    """
+    Remove vários registros de CNPJ numa única requisição, com a mesma
+    verificação de permissão de delete_cnpj
+
+    Args:
+        fila_ids: IDs dos registros na fila
+        user_id: ID do usuário opcional para verificação de permissão
+
+    Returns:
+        IDs efetivamente removidos
+    """
+    if not fila_ids:
+        return []
+    try:
+        supabase = get_supabase_client()
+        query = supabase.table("fila_cnpj").delete().in_("id", list(fila_ids))
+
+        if user_id is not None:
+            query = query.or_(f"user_id.eq.{user_id},user_id.is.null")
+
+        response = query.execute()
+        removidos = [row["id"] for row in (response.data or [])]
+        logger.info(f"{len(removidos)} de {len(fila_ids)} CNPJs removidos em lote")
+        return removidos
+    except Exception as e:
+        logger.error(f"Erro ao excluir CNPJs em lote: {e}")
+        return []
+
+def update_queue_item(fila_id: int, data: Dict[str, Any], worker_id: Optional[str] = None) -> bool:
     """
     Atualiza um item da fila pelo ID
     
     Args:
         fila_id: ID do registro na fila
         data: Dados a serem atualizados
+        worker_id: Só atualiza se a tarefa ainda estiver reivindicada por este
+            worker (um worker cuja lease expirou não sobrescreve o novo dono)
         
     Returns:
         True se o registro foi atualizado com sucesso, False caso contrário
     """
     try:
         supabase = get_supabase_client()
-        response = supabase.table("fila_cnpj").update(data).eq("id", fila_id).execute()
+        query = supabase.table("fila_cnpj").update(data).eq("id", fila_id)
+        if worker_id is not None:
+            query = query.eq("worker_id", worker_id)
+        response = query.execute()
         
         if response.data and len(response.data) > 0:
             logger.info(f"CNPJ com ID {fila_id} atualizado com sucesso")
@@ -267,4 +302,184 @@ def count_users() -> int:
         return 0
     except Exception as e:
         logger.error(f"Erro ao contar usuários: {e}")
-        return 0 
\ No newline at end of file
+        return 0
+
+def count_tasks_by_status(status: str) -> int:
+    """
+    Conta as tarefas da fila com o status informado
+    
+    Args:
+        status: Status das tarefas (pendente, processando, ...)
+        
+    Returns:
+        Número de tarefas (0 em caso de erro)
+    """
+    try:
+        supabase = get_supabase_client()
+        response = supabase.table("fila_cnpj").select("id", count="exact").eq("status", status).limit(1).execute()
+        
+        if hasattr(response, "count") and response.count is not None:
+            return response.count
+        return 0
+    except Exception as e:
+        logger.error(f"Erro ao contar tarefas com status {status}: {e}")
+        return 0
+
+# Reivindicação de tarefas da fila com lease
+
+def _utc_iso(offset_seconds: float = 0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).isoformat()
+
+def claim_task(fila_id: int, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Passa a tarefa de 'pendente' para 'processando' em nome do worker, numa
+    única atualização condicional: só um worker consegue reivindicá-la
+    
+    Args:
+        fila_id: ID do registro na fila
+        worker_id: Identificador do worker (host:pid)
+        lease_seconds: Validade da reivindicação; depois dela o reaper devolve a tarefa
+        
+    Returns:
+        O registro da tarefa já reivindicada, ou None se outro worker a pegou ou ela não está pendente
+    """
+    try:
+        supabase = get_supabase_client()
+        response = supabase.table("fila_cnpj").update({
+            "status": "processando",
+            "worker_id": worker_id,
+            "lease_expires_at": _utc_iso(lease_seconds),
+        }).eq("id", fila_id).eq("status", "pendente").execute()
+        
+        if response.data and len(response.data) > 0:
+            return response.data[0]
+        return None
+    except Exception as e:
+        logger.error(f"Erro ao reivindicar tarefa {fila_id}: {e}")
+        return None
+
+def release_for_retry(fila_id: int, worker_id: str, failures: int, error_message: str, delay_seconds: float) -> bool:
+    """
+    Devolve a tarefa deste worker para 'pendente' após uma falha transitória,
+    registrando a contagem de falhas; enqueued_at no fim do atraso impede que
+    a tarefa seja republicada antes da retentativa
+    
+    Returns:
+        False se a tarefa não pertence mais ao worker
+    """
+    try:
+        supabase = get_supabase_client()
+        response = supabase.table("fila_cnpj").update({
+            "status": "pendente",
+            "failures": failures,
+            "error_message": error_message,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "enqueued_at": _utc_iso(delay_seconds),
+        }).eq("id", fila_id).eq("status", "processando").eq("worker_id", worker_id).execute()
+        return bool(response.data)
+    except Exception as e:
+        logger.error(f"Erro ao devolver tarefa {fila_id} para retentativa: {e}")
+        return False
+
+def renew_leases(fila_ids: List[int], worker_id: str, lease_seconds: float) -> List[int]:
+    """
+    Estende a reivindicação das tarefas que este worker ainda está
+    processando, numa única atualização
+    
+    Returns:
+        IDs renovados; os ausentes já não pertencem ao worker
+    """
+    if not fila_ids:
+        return []
+    try:
+        supabase = get_supabase_client()
+        response = supabase.table("fila_cnpj").update({
+            "lease_expires_at": _utc_iso(lease_seconds),
+        }).in_("id", list(fila_ids)).eq("status", "processando").eq("worker_id", worker_id).execute()
+        return [row["id"] for row in (response.data or [])]
+    except Exception as e:
+        logger.error(f"Erro ao renovar reivindicações: {e}")
+        # Sem resposta do banco não dá para saber quais foram perdidas
+        return list(fila_ids)
+
+def reap_expired_leases(limit: int = 50, legacy_grace_seconds: float = 3600) -> List[int]:
+    """
+    Devolve para 'pendente' as tarefas 'processando' cuja reivindicação
+    expirou (worker morto ou travado). Cada devolução também é condicional,
+    então um mesmo registro é devolvido por um único worker.
+    
+    Args:
+        limit: Máximo de tarefas devolvidas por chamada
+        legacy_grace_seconds: Tarefas 'processando' sem lease (marcadas antes
+            das reivindicações) são devolvidas depois deste tempo desde a criação
+        
+    Returns:
+        IDs das tarefas devolvidas por este worker
+    """
+    try:
+        supabase = get_supabase_client()
+        now = _utc_iso()
+        legacy_cutoff = _utc_iso(-legacy_grace_seconds)
+        response = supabase.table("fila_cnpj").select("id, lease_expires_at").eq(
+            "status", "processando"
+        ).or_(
+            f"lease_expires_at.lt.{now},and(lease_expires_at.is.null,created_at.lt.{legacy_cutoff})"
+        ).limit(limit).execute()
+        
+        reaped = []
+        for row in response.data or []:
+            query = supabase.table("fila_cnpj").update({
+                "status": "pendente",
+                "worker_id": None,
+                "lease_expires_at": None,
+                "enqueued_at": now,
+            }).eq("id", row["id"]).eq("status", "processando")
+            # Só devolve se o dono não renovou a lease (renew_leases) desde a leitura
+            if row.get("lease_expires_at") is None:
+                query = query.is_("lease_expires_at", "null")
+            else:
+                query = query.eq("lease_expires_at", row["lease_expires_at"])
+            if query.execute().data:
+                reaped.append(row["id"])
+        if reaped:
+            logger.warning(f"Reivindicações expiradas devolvidas à fila: {reaped}")
+        return reaped
+    except Exception as e:
+        logger.error(f"Erro ao devolver reivindicações expiradas: {e}")
+        return []
+
+def claim_stale_pending(limit: int = 30, stale_seconds: float = 600) -> List[int]:
+    """
+    Tarefas 'pendente' que estão há mais de `stale_seconds` sem serem
+    (re)publicadas no RabbitMQ; cada uma é marcada como republicada por um
+    único worker, que deve publicá-la
+    
+    Returns:
+        IDs que este worker deve republicar
+    """
+    try:
+        supabase = get_supabase_client()
+        now = _utc_iso()
+        cutoff = _utc_iso(-stale_seconds)
+        response = supabase.table("fila_cnpj").select("id, enqueued_at").eq(
+            "status", "pendente"
+        ).or_(
+            f"enqueued_at.lt.{cutoff},and(enqueued_at.is.null,created_at.lt.{cutoff})"
+        ).limit(limit).execute()
+        
+        claimed = []
+        for row in response.data or []:
+            query = supabase.table("fila_cnpj").update({"enqueued_at": now}).eq(
+                "id", row["id"]
+            ).eq("status", "pendente")
+            if row.get("enqueued_at") is None:
+                query = query.is_("enqueued_at", "null")
+            else:
+                query = query.eq("enqueued_at", row["enqueued_at"])
+            if query.execute().data:
+                claimed.append(row["id"])
+        return claimed
+    except Exception as e:
+        logger.error(f"Erro ao buscar tarefas pendentes para republicar: {e}")
+        return []
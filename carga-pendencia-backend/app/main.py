@@ -6,16 +6,15 @@ import os
 import sys
 import time
 import atexit
-import contextlib
 import threading
 import signal
-import psutil
 # Importar apenas o necessário para a rota de processar CNPJ
 from app.routers import cnpj
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.routers import excel
 from app.routers import auth  # Novo roteador de autenticação
+from app.services.chrome_supervisor import ChromeSupervisor
 
 # Configure logging
 logging.basicConfig(
@@ -143,57 +142,18 @@ app.openapi = custom_openapi
 # Cleanup function to kill any hanging chrome processes
 def cleanup_chrome_processes():
     """
-    Kill any hanging Chrome processes to prevent resource leaks
+    Encerra apenas os processos Chrome/chromedriver iniciados por este processo
+    (rastreados pelo ChromeSupervisor), sem afetar os workers da mesma máquina
     """
     try:
         logger.info("Cleaning up Chrome processes...")
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                proc_name = proc.info['name'].lower()
-                if 'chrome' in proc_name or 'chromedriver' in proc_name:
-                    # Try to check if our script is the parent or grandparent
-                    is_child = False
-                    process = psutil.Process(proc.info['pid'])
-                    
-                    # Check if it's orphaned or if we should terminate it
-                    try:
-                        parent = process.parent()
-                        if parent and parent.pid == os.getpid():
-                            is_child = True
-                        # Also check for grandparent relationship (chromedriver -> chrome)
-                        elif parent:
-                            try:
-                                grandparent = parent.parent()
-                                if grandparent and grandparent.pid == os.getpid():
-                                    is_child = True
-                            except:
-                                pass
-                    except:
-                        pass
-                    
-                    if is_child or 'chromedriver' in proc_name:
-                        logger.info(f"Terminating Chrome process: {proc.info['pid']}")
-                        with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
-                            process.terminate()
-                            
-                        # Wait a short time for graceful termination
-                        try:
-                            process.wait(timeout=2)
-                        except (psutil.TimeoutExpired, psutil.NoSuchProcess):
-                            # Force kill if it didn't terminate gracefully
-                            with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
-                                process.kill()
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
-            except Exception as e:
-                logger.error(f"Error cleaning up Chrome process: {str(e)}")
+        ChromeSupervisor.get_instance().reap_owned()
     except Exception as e:
         logger.error(f"Error in Chrome cleanup: {str(e)}")
-        
     logger.info("Chrome process cleanup completed")
 
-# Clean up on startup 
-cleanup_chrome_processes()
+# Varredura de órfãos (dono já morto) em background, sem bloquear a inicialização
+ChromeSupervisor.get_instance().sweep_in_background(interval=600)
 
 # Register cleanup on shutdown
 atexit.register(cleanup_chrome_processes)
@@ -223,9 +183,6 @@ async def root():
 
 if __name__ == "__main__":
     try:
-        # Try cleaning up any zombie Chrome processes first
-        cleanup_chrome_processes()
-        
         # Start the server
         uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=False)
     except KeyboardInterrupt:
@@ -12,7 +12,7 @@ import re
 from app.services.excel_service import ExcelService
 from app.services.cnpj_service import CNPJService
 from app.schemas.responses import CNPJProcessingResponse, CNPJResponse, ExcelValidationResponse, CNPJValidationItem
-from app.services.queue_service import send_to_queue_and_db, check_cnpj_exists, get_all_cnpjs, delete_from_queue_by_id
+from app.services.queue_service import send_to_queue_and_db, check_cnpj_exists, get_all_cnpjs, delete_from_queue_by_id, delete_batch_from_queue
 from app.models.cnpj import CNPJ
 from app.schemas.requests import GetCNPJRequest, BatchDeleteRequest
 from app.schemas.responses import ListCNPJResponse
@@ -729,9 +729,10 @@ async def batch_delete_cnpjs(
             "failed_ids": []
         }
         
+        # Uma exclusão no banco e um único aviso de cancelamento aos workers
+        deleted_ids = set(delete_batch_from_queue(request.fila_ids, user_id=user_id))
         for fila_id in request.fila_ids:
-            deleted = delete_from_queue_by_id(fila_id, user_id=user_id)
-            if deleted:
+            if fila_id in deleted_ids:
                 results["deleted"] += 1
             else:
                 results["failed"] += 1
@@ -54,6 +54,7 @@ class ListCNPJResponse(BaseModel):
     updated_at: Optional[str] = None
     user_id: Optional[int] = None
     full_result: Optional[str] = None
+    timings: Optional[Dict[str, Any]] = None
     
     class Config:
         from_attributes = True
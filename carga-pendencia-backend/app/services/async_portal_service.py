@@ -0,0 +1,298 @@
+"""
+Backend assíncrono do portal GPI: várias sessões do portal intercaladas em um
+único event loop, sobre o Chromium controlado via CDP pelo Playwright.
+
+Dependência opcional:
+    pip install playwright && playwright install chromium
+"""
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+try:
+    from playwright.async_api import async_playwright
+    from playwright.async_api import Error as PlaywrightError
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+except ImportError:  # pragma: no cover - backend opcional
+    async_playwright = None
+    PlaywrightError = Exception
+    PlaywrightTimeoutError = Exception
+
+from app.services.request_blocking import RequestBlockingPolicy
+from app.services.certidao_extractor import CertidaoExtractor
+from app.services.chrome_supervisor import ChromeSupervisor
+from app.services.step_timer import StepTimer
+from app.services.task_cancellation import CancelledTasks, TaskCancelled, cancelled_result
+from app.services.wait_policy import LOADING_OVERLAY_XPATH
+from app.services.web_service import (
+    WebService,
+    MENU1_XPATH,
+    MENU2_XPATH,
+    FIRST_RADIO_XPATH,
+    CNPJ_RADIO_XPATH,
+    CNPJ_INPUT_XPATH,
+    SUBMIT_BUTTON_XPATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# Mesmo bloqueio de window.print() aplicado pelo fluxo Selenium, mas injetado
+# antes de qualquer script da página (inclusive na aba da certidão)
+DISABLE_PRINT_SCRIPT = """
+window.print = function() {
+    console.log('[Interceptado] window.print() bloqueado');
+};
+"""
+
+TEXT_READY_SCRIPT = """
+() => {
+    const div = document.querySelector('div.texto');
+    return !!div && div.innerText.trim().length > 0;
+}
+"""
+
+# Etapas de clique do fluxo, na ordem: (nome da fase, XPath)
+CLICK_STEPS = (
+    ("menu1_click", MENU1_XPATH),
+    ("menu2_click", MENU2_XPATH),
+    ("radio_selection", FIRST_RADIO_XPATH),
+    ("radio_selection", CNPJ_RADIO_XPATH),
+)
+
+
+class AsyncBackendUnavailable(RuntimeError):
+    """O Playwright não está instalado"""
+
+
+class AsyncPortalService:
+    """
+    Um Chromium compartilhado; cada consulta usa um BrowserContext próprio
+    (cookies e storage isolados) e todas as esperas são awaitables, então um
+    único event loop conduz dezenas de sessões sem uma thread por navegador.
+
+    Exemplo:
+        service = AsyncPortalService(max_sessions=20)
+        await service.start()
+        resultado = await service.fetch_certidao("12345678000190")
+        await service.close()
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10,
+        headless: bool = True,
+        portal_url: Optional[str] = None,
+        step_timeout: float = 30,
+        result_timeout: float = 60,
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.headless = headless
+        self.portal_url = portal_url or WebService.portal_url()
+        self.step_timeout = step_timeout
+        self.result_timeout = result_timeout
+        self.blocking = RequestBlockingPolicy.from_env()
+        self._playwright = None
+        self._browser = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def available() -> bool:
+        """
+        O Playwright está instalado
+        """
+        return async_playwright is not None
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """
+        Inicia o Chromium; deve ser chamado no event loop que fará as consultas
+        """
+        if async_playwright is None:
+            raise AsyncBackendUnavailable(
+                "Backend assíncrono requer o Playwright: "
+                "pip install playwright && playwright install chromium"
+            )
+        self._semaphore = asyncio.Semaphore(self.max_sessions)
+        self._launch_lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        await self._launch()
+        logger.info(
+            f"Backend assíncrono pronto com até {self.max_sessions} sessões simultâneas"
+        )
+
+    async def _launch(self):
+        supervisor = ChromeSupervisor.get_instance()
+        before = supervisor.descendants()
+        self._browser = await self._playwright.chromium.launch(
+            headless=self.headless,
+            # Marca de dono usada pelo ChromeSupervisor para achar órfãos
+            env=supervisor.child_env(),
+            args=[
+                "--disable-dev-shm-usage",
+                "--disable-extensions",
+                "--disable-popup-blocking",
+                "--disable-print-preview",
+                "--kiosk-printing",
+            ],
+        )
+        # Sem o registro, a varredura de órfãos encerraria o Chromium deste
+        # processo, que não passa pelo chromedriver
+        if not supervisor.register_launched(self._browser, before):
+            logger.warning("Processo do Chromium não encontrado para registro no ChromeSupervisor")
+
+    async def _ensure_browser(self):
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            logger.warning("Chromium do backend assíncrono desconectado; reiniciando")
+            await self._launch()
+
+    async def close(self):
+        """
+        Fecha o Chromium e encerra o Playwright
+        """
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except PlaywrightError as e:
+                logger.warning(f"Erro ao fechar o Chromium: {e}")
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Backend assíncrono encerrado")
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    async def fetch_certidao(
+        self,
+        cnpj: str,
+        fila_id: Optional[int] = None,
+        timer: Optional[StepTimer] = None,
+    ) -> Dict[str, Any]:
+        """
+        Consulta um CNPJ em um contexto novo do navegador compartilhado
+
+        Args:
+            cnpj: CNPJ a consultar (apenas dígitos)
+            fila_id: ID da fila, usado no nome do HTML salvo
+            timer: StepTimer da tarefa (opcional)
+
+        Returns:
+            Dicionário no formato de WebService.navigate_to_gpi_portal
+        """
+        timer = timer or StepTimer()
+        timer.start("session_queue_wait")
+        async with self._semaphore:
+            timer.stop("session_queue_wait")
+            await self._ensure_browser()
+            blocking_before = self.blocking.snapshot() if self.blocking else None
+            context = None
+            try:
+                with timer.phase("driver_launch"):
+                    context = await self._browser.new_context(
+                        viewport={"width": 1280, "height": 800}
+                    )
+                    context.set_default_timeout(self.step_timeout * 1000)
+                    await context.add_init_script(DISABLE_PRINT_SCRIPT)
+                    if self.blocking:
+                        await context.route("**/*", self.blocking.intercept_route)
+                    page = await context.new_page()
+                result = await self._run_flow(context, page, cnpj, fila_id, timer)
+            except TaskCancelled as e:
+                logger.info(f"{e}: sessão do CNPJ {cnpj} interrompida no backend assíncrono")
+                result = cancelled_result(fila_id, timer.as_dict())
+            except (PlaywrightError, asyncio.TimeoutError) as e:
+                logger.error(f"Backend assíncrono falhou para CNPJ {cnpj}: {e}")
+                result = {
+                    "status": "error",
+                    "message": f"Error in web navigation: {str(e)}",
+                    "url": self.portal_url,
+                    "screenshots": [],
+                    "error": str(e),
+                    "timings": timer.as_dict(),
+                }
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except PlaywrightError:
+                        pass
+            result["engine"] = "async"
+            if self.blocking:
+                result["request_blocking"] = RequestBlockingPolicy.diff(
+                    self.blocking.snapshot(), blocking_before
+                )
+            return result
+
+    async def _wait_overlay(self, page):
+        try:
+            await page.locator(f"xpath={LOADING_OVERLAY_XPATH}").first.wait_for(
+                state="hidden", timeout=self.step_timeout * 1000
+            )
+        except PlaywrightTimeoutError:
+            logger.warning("Overlay de carregamento não desapareceu; seguindo")
+
+    async def _click(self, page, xpath: str):
+        """
+        Clique nativo no elemento; se algo o cobrir, clique via JavaScript
+        """
+        locator = page.locator(f"xpath={xpath}").first
+        await locator.wait_for(state="attached")
+        await self._wait_overlay(page)
+        try:
+            await locator.click(timeout=5000)
+        except PlaywrightError:
+            await locator.evaluate("el => el.click()")
+
+    async def _run_flow(self, context, page, cnpj, fila_id, timer) -> Dict[str, Any]:
+        # Cancelamentos são verificados entre as etapas (TaskCancelled)
+        cancellations = CancelledTasks.get_instance()
+        with timer.phase("initial_load"):
+            await page.goto(self.portal_url, wait_until="domcontentloaded")
+            await self._wait_overlay(page)
+
+        for phase, xpath in CLICK_STEPS:
+            cancellations.check(fila_id)
+            with timer.phase(phase):
+                await self._click(page, xpath)
+
+        cancellations.check(fila_id)
+        with timer.phase("cnpj_typing"):
+            cnpj_input = page.locator(f"xpath={CNPJ_INPUT_XPATH}").first
+            await cnpj_input.fill(cnpj)
+            await cnpj_input.evaluate(
+                """
+                input => {
+                    input.dispatchEvent(new Event('change', { bubbles: true }));
+                    input.dispatchEvent(new Event('blur', { bubbles: true }));
+                }
+                """
+            )
+
+        with timer.phase("submit"):
+            async with context.expect_page(timeout=self.result_timeout * 1000) as page_info:
+                await self._click(page, SUBMIT_BUTTON_XPATH)
+
+        cancellations.check(fila_id)
+        with timer.phase("new_tab_detection"):
+            result_page = await page_info.value
+            await result_page.wait_for_function(
+                TEXT_READY_SCRIPT, timeout=self.result_timeout * 1000
+            )
+
+        with timer.phase("html_serialization"):
+            extraido = await CertidaoExtractor.extract_async(result_page)
+
+        result = WebService.resultado_from_extracao(extraido, timer=timer)
+        CertidaoExtractor.save_html(
+            result["full_result"], CertidaoExtractor.html_path(fila_id or cnpj)
+        )
+        logger.info(f"CNPJ {cnpj} concluído no backend assíncrono: {result['status_divida']}")
+        return result
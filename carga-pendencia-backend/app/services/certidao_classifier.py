@@ -0,0 +1,72 @@
+"""
+Classificação do texto da certidão em status de dívida
+"""
+import logging
+import re
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_NAO_CONSTAM = "Não constam pendências"
+STATUS_SUSPENSA = "Exigibilidade suspensa"
+STATUS_CONSTAM = "Constam dívidas"
+STATUS_DESCONHECIDO = "Status desconhecido"
+
+# Padrões compilados uma única vez, avaliados na ordem abaixo
+PADRAO_NAO_CONSTAM = re.compile(
+    r"n[ãa]o\s*(constam|há|ha|existem)\s*(pend[êe]ncias|d[íi]vidas|d[ée]bitos)?|(certificado\s+negativo)",
+    re.IGNORECASE,
+)
+PADRAO_SUSPENSA = re.compile(
+    r"(com\s+exigibilidade\s+suspensa|com a exigibilidade suspensa)",
+    re.IGNORECASE,
+)
+PADRAO_CONSTAM = re.compile(
+    r"(constam|h[áa]|existem)\s*(pend[êe]ncias|d[íi]vidas|d[ée]bitos)|que\s+constam\s+d[íi]vidas",
+    re.IGNORECASE,
+)
+
+# "não constam" tem precedência sobre "exigibilidade suspensa", que tem
+# precedência sobre "constam"
+REGRAS = (
+    (PADRAO_NAO_CONSTAM, STATUS_NAO_CONSTAM),
+    (PADRAO_SUSPENSA, STATUS_SUSPENSA),
+    (PADRAO_CONSTAM, STATUS_CONSTAM),
+)
+
+
+class CertidaoClassifier:
+    """
+    Regras de status_divida, independentes do navegador
+
+    Exemplo:
+        CertidaoClassifier.classify(texto_da_div)
+        CertidaoClassifier.classify_many(textos_do_historico)
+    """
+
+    @staticmethod
+    def classify(texto: Optional[str]) -> str:
+        """
+        Classifica o texto da certidão
+
+        Args:
+            texto: Texto da div.texto (ou da página inteira)
+
+        Returns:
+            "Não constam pendências", "Exigibilidade suspensa", "Constam dívidas"
+            ou "Status desconhecido"
+        """
+        if not texto:
+            return STATUS_DESCONHECIDO
+        for padrao, status in REGRAS:
+            if padrao.search(texto):
+                return status
+        return STATUS_DESCONHECIDO
+
+    @staticmethod
+    def classify_many(textos: Iterable[Optional[str]]) -> List[str]:
+        """
+        Classifica vários textos de uma vez (ex.: reclassificação do histórico)
+        """
+        classify = CertidaoClassifier.classify
+        return [classify(texto) for texto in textos]
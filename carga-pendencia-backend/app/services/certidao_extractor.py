@@ -0,0 +1,127 @@
+"""
+Extração rápida do texto da certidão direto na página, sem serializar e
+reparsear o documento inteiro em Python
+"""
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Tuple
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:  # pragma: no cover - lxml é opcional
+    HTML_PARSER = "html.parser"
+
+logger = logging.getLogger(__name__)
+
+# Uma única ida ao navegador: texto da div.texto, texto da página (linhas
+# aparadas, como get_text(separator="\n", strip=True)) e o HTML para full_result
+EXTRACT_FUNCTION = """
+() => {
+    const lines = (el) => {
+        if (!el) { return ''; }
+        return (el.innerText || el.textContent || '')
+            .split('\\n').map((s) => s.trim()).filter(Boolean).join('\\n');
+    };
+    const div = document.querySelector('div.texto');
+    const doctype = document.doctype ? '<!DOCTYPE ' + document.doctype.name + '>' : '';
+    return {
+        texto: lines(div),
+        texto_completo: lines(document.body),
+        html: doctype + document.documentElement.outerHTML,
+    };
+}
+"""
+
+EXTRACT_SCRIPT = "return (" + EXTRACT_FUNCTION.strip() + ")();"
+
+# Script de impressão automática da certidão (removido do full_result)
+PRINT_SCRIPT_RE = re.compile(
+    r"<script\b[^>]*>(?:(?!</script>).)*imprimir\(\)(?:(?!</script>).)*</script>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Gravação dos HTMLs fora das threads das tarefas
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="certidao-html")
+
+
+class CertidaoExtractor:
+    """
+    Lê a certidão aberta no navegador com um único script na página; o HTML
+    completo só é parseado (com lxml, se instalado) quando não há navegador.
+    """
+
+    @staticmethod
+    def extract(driver) -> Dict[str, str]:
+        """
+        Extrai texto e HTML da aba da certidão (Selenium)
+
+        Returns:
+            Dicionário com texto (div.texto), texto_completo e html
+        """
+        try:
+            data = driver.execute_script(EXTRACT_SCRIPT)
+            if data and data.get("html"):
+                return data
+        except Exception as e:
+            logger.warning(f"Extração na página falhou ({e}); usando page_source")
+        html = driver.page_source
+        texto, texto_completo = CertidaoExtractor.texts_from_html(html)
+        return {"texto": texto, "texto_completo": texto_completo, "html": html}
+
+    @staticmethod
+    async def extract_async(page) -> Dict[str, str]:
+        """
+        Mesma extração para uma página do Playwright
+        """
+        return await page.evaluate(EXTRACT_FUNCTION)
+
+    @staticmethod
+    def texts_from_html(html: str) -> Tuple[str, str]:
+        """
+        Texto da div.texto e da página inteira a partir do HTML
+
+        Returns:
+            (texto da div.texto ou "" se não houver, texto completo)
+        """
+        soup = BeautifulSoup(html, HTML_PARSER)
+        for script in soup.find_all(["script", "style"]):
+            script.decompose()
+        texto_div = soup.select_one("div.texto")
+        texto = texto_div.get_text(separator="\n", strip=True) if texto_div else ""
+        return texto, soup.get_text(separator="\n", strip=True)
+
+    @staticmethod
+    def clean_html(html: str) -> str:
+        """
+        HTML da certidão sem o script de impressão automática
+        """
+        return PRINT_SCRIPT_RE.sub("", html)
+
+    @staticmethod
+    def html_path(name, directory: str = "screenshots") -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return os.path.join(directory, f"{timestamp}_{name}_new_tab_html.html")
+
+    @staticmethod
+    def save_html(html: str, path: str):
+        """
+        Agenda a gravação do HTML em background
+        """
+
+        def _write():
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(html)
+                logger.info(f"HTML da certidão salvo em {path}")
+            except OSError as e:
+                logger.warning(f"Não foi possível salvar o HTML da certidão: {e}")
+
+        return _writer.submit(_write)
@@ -0,0 +1,308 @@
+"""
+Perfil do Chrome pré-aquecido (cache HTTP e de código do portal), clonado
+para cada navegador
+"""
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from app.services.chrome_supervisor import ChromeSupervisor, _owner_alive
+
+logger = logging.getLogger(__name__)
+
+# GPI_PROFILE_CACHE=0 volta ao perfil temporário vazio por navegador
+ENABLED_ENV = "GPI_PROFILE_CACHE"
+TEMPLATE_ENV = "GPI_PROFILE_TEMPLATE"
+CLONES_ENV = "GPI_PROFILE_CLONES"
+MAX_AGE_ENV = "GPI_PROFILE_MAX_AGE"
+
+# Estado de sessão que não pode vazar do aquecimento para as tarefas; os
+# caches (Cache, Code Cache, GPUCache, GrShaderCache) ficam
+SESSION_ENTRIES = (
+    "SingletonLock",
+    "SingletonSocket",
+    "SingletonCookie",
+    os.path.join("Default", "Cookies"),
+    os.path.join("Default", "Cookies-journal"),
+    os.path.join("Default", "Network", "Cookies"),
+    os.path.join("Default", "Network", "Cookies-journal"),
+    os.path.join("Default", "Local Storage"),
+    os.path.join("Default", "Session Storage"),
+    os.path.join("Default", "Sessions"),
+    os.path.join("Default", "IndexedDB"),
+    os.path.join("Default", "Service Worker"),
+    os.path.join("Default", "Current Session"),
+    os.path.join("Default", "Current Tabs"),
+    os.path.join("Default", "Last Session"),
+    os.path.join("Default", "Last Tabs"),
+    os.path.join("Default", "History"),
+    os.path.join("Default", "History-journal"),
+)
+
+READY_MARKER = ".gpi_template_ready"
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def copy_tree(src: str, dst: str):
+    """
+    Copia o perfil; no Linux usa `cp --reflink=auto`, que em btrfs/XFS
+    compartilha os blocos do modelo (copy-on-write) em vez de duplicá-los
+    """
+    if platform.system() == "Linux" and shutil.which("cp"):
+        subprocess.run(
+            ["cp", "-a", "--reflink=auto", src, dst],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+    else:
+        shutil.copytree(src, dst, symlinks=True)
+
+
+class ChromeProfileTemplate:
+    """
+    Mantém um user-data-dir modelo, aquecido uma vez com o portal aberto até
+    o formulário de CNPJ (bundles JS do GWT, CSS e cache de código V8), e
+    entrega a cada navegador uma cópia barata desse modelo.
+
+    O modelo é compartilhado pelos workers da máquina e nunca é usado
+    diretamente pelo Chrome: é somente leitura, e cada navegador escreve no
+    seu clone, removido quando o driver é fechado.
+
+    Exemplo:
+        profiles = ChromeProfileTemplate.get_instance()
+        user_data_dir = profiles.clone()     # None: usar perfil vazio
+        ...
+        profiles.discard(user_data_dir)
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        template_dir: Optional[str] = None,
+        clones_dir: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ):
+        base = tempfile.gettempdir()
+        self.template_dir = os.path.abspath(
+            template_dir or os.getenv(TEMPLATE_ENV) or os.path.join(base, "gpi_chrome_template")
+        )
+        self.clones_root = os.path.abspath(
+            clones_dir or os.getenv(CLONES_ENV) or os.path.join(base, "gpi_chrome_profiles")
+        )
+        self.max_age = float(max_age if max_age is not None else os.getenv(MAX_AGE_ENV, "86400"))
+        self.lock_path = self.template_dir + ".lock"
+        # Clones deste processo ficam numa pasta com a marca de dono, para que
+        # os de workers mortos possam ser removidos
+        self.owner_dir = os.path.join(
+            self.clones_root, ChromeSupervisor.get_instance().marker.replace(":", "_")
+        )
+        # _lock protege só o mapa de clones: warm() fecha o Chrome por
+        # WebService.close_driver, que passa por discard_for()
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._warm_failed_at: Optional[float] = None
+        self._clones: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_instance(cls) -> "ChromeProfileTemplate":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = ChromeProfileTemplate()
+            return cls._instance
+
+    @staticmethod
+    def enabled() -> bool:
+        return os.getenv(ENABLED_ENV, "1") != "0"
+
+    # ------------------------------------------------------------------
+    # Modelo
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        Trava entre processos: cópias compartilham, o aquecimento é exclusivo
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def is_ready(self) -> bool:
+        """
+        O modelo existe e não passou de max_age
+        """
+        marker = os.path.join(self.template_dir, READY_MARKER)
+        try:
+            return time.time() - os.path.getmtime(marker) < self.max_age
+        except OSError:
+            return False
+
+    def warm(self, headless: bool = True) -> bool:
+        """
+        Gera o modelo: abre o portal num perfil novo até o formulário de CNPJ,
+        fecha o Chrome (que grava os caches em disco) e remove o estado de sessão
+
+        Returns:
+            True se o modelo ficou pronto
+        """
+        # Imports locais: web_service e portal_flow dependem deste módulo
+        from app.services.web_service import WebService
+        from app.services.portal_flow import PortalFlow, FORM
+
+        with self._file_lock(exclusive=True):
+            if self.is_ready():
+                # Outro worker aqueceu enquanto esperávamos a trava
+                return True
+            build_dir = f"{self.template_dir}.build-{uuid.uuid4().hex[:8]}"
+            started = time.monotonic()
+            logger.info(f"Aquecendo perfil modelo do Chrome em {build_dir}")
+            driver = None
+            warmed = False
+            try:
+                driver = WebService.create_chrome_driver(
+                    headless, user_data_dir=build_dir, use_profile_template=False
+                )
+                PortalFlow(driver, "").run(until=FORM)
+                warmed = True
+            except Exception as e:
+                logger.warning(f"Falha ao aquecer o perfil modelo do Chrome: {e}")
+            finally:
+                # O quit() faz o Chrome gravar os caches no perfil
+                if driver is not None:
+                    WebService.close_driver(driver)
+            if not warmed:
+                self._warm_failed_at = time.monotonic()
+                shutil.rmtree(build_dir, ignore_errors=True)
+                return False
+
+            for entry in SESSION_ENTRIES:
+                _remove(os.path.join(build_dir, entry))
+            with open(os.path.join(build_dir, READY_MARKER), "w") as f:
+                f.write(str(time.time()))
+
+            # Troca atômica: o modelo antigo só é removido depois da troca
+            old_dir = None
+            if os.path.exists(self.template_dir):
+                old_dir = f"{self.template_dir}.old-{uuid.uuid4().hex[:8]}"
+                os.rename(self.template_dir, old_dir)
+            os.rename(build_dir, self.template_dir)
+            if old_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+            logger.info(
+                f"Perfil modelo do Chrome pronto em {time.monotonic() - started:.1f}s: {self.template_dir}"
+            )
+            return True
+
+    # ------------------------------------------------------------------
+    # Clones por navegador
+    # ------------------------------------------------------------------
+
+    def clone(self, headless: bool = True) -> Optional[str]:
+        """
+        Cópia do modelo para um novo navegador, aquecendo o modelo se preciso
+
+        Returns:
+            Caminho do user-data-dir, ou None para usar o perfil vazio padrão
+        """
+        if not self.enabled():
+            return None
+        if not self.is_ready():
+            with self._warm_lock:
+                # Depois de uma falha, espera 10 minutos antes de tentar de novo
+                recently_failed = (
+                    self._warm_failed_at is not None
+                    and time.monotonic() - self._warm_failed_at < 600
+                )
+                if not self.is_ready() and (recently_failed or not self.warm(headless)):
+                    return None
+        target = os.path.join(self.owner_dir, uuid.uuid4().hex)
+        started = time.monotonic()
+        try:
+            os.makedirs(self.owner_dir, exist_ok=True)
+            with self._file_lock(exclusive=False):
+                copy_tree(self.template_dir, target)
+        except Exception as e:
+            logger.warning(f"Falha ao clonar o perfil modelo do Chrome: {e}")
+            shutil.rmtree(target, ignore_errors=True)
+            return None
+        logger.info(f"Perfil do Chrome clonado em {time.monotonic() - started:.2f}s: {target}")
+        return target
+
+    def attach(self, driver, user_data_dir: Optional[str]):
+        """
+        Associa o clone ao driver, para ser removido em discard_for()
+        """
+        if user_data_dir:
+            with self._lock:
+                self._clones[driver] = user_data_dir
+
+    def discard_for(self, driver):
+        """
+        Remove o clone do driver (chamado depois que o Chrome foi encerrado)
+        """
+        with self._lock:
+            path = self._clones.pop(driver, None)
+        if path:
+            self.discard(path)
+
+    def discard(self, user_data_dir: str):
+        if user_data_dir and os.path.abspath(user_data_dir).startswith(self.clones_root):
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+
+    def sweep(self) -> int:
+        """
+        Remove os clones deixados por workers que morreram
+
+        Returns:
+            Quantidade de pastas de dono removidas
+        """
+        removed = 0
+        try:
+            owners = os.listdir(self.clones_root)
+        except OSError:
+            return 0
+        for owner in owners:
+            path = os.path.join(self.clones_root, owner)
+            if path == self.owner_dir or _owner_alive(owner.replace("_", ":", 1)):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        if removed:
+            logger.info(f"Removidos clones de perfil do Chrome de {removed} workers encerrados")
+        return removed
@@ -0,0 +1,286 @@
+"""
+Supervisor dos processos Chrome/chromedriver iniciados por este processo
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Set
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Variável de ambiente herdada pelo chromedriver e por toda a árvore do Chrome;
+# identifica o processo dono (pid:create_time) mesmo depois que ele morre
+OWNER_ENV = "GPI_CHROME_OWNER"
+
+CHROME_NAMES = ("chrome", "chromium", "chromedriver", "headless_shell")
+
+# Processos recém-criados podem ainda não ter sido registrados pelo driver
+MIN_ORPHAN_AGE = 60
+
+
+def _owner_marker(pid: int) -> str:
+    return f"{pid}:{int(psutil.Process(pid).create_time())}"
+
+
+def _owner_alive(marker: str) -> bool:
+    try:
+        pid, created = marker.split(":", 1)
+        return int(psutil.Process(int(pid)).create_time()) == int(created)
+    except (ValueError, psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+def _terminate(processes, timeout: float = 3):
+    processes = [p for p in processes if p.pid != os.getpid()]
+    for proc in processes:
+        try:
+            proc.terminate()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for proc in alive:
+        try:
+            proc.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return len(processes)
+
+
+class ChromeSupervisor:
+    """
+    Registra a árvore exata de processos (chromedriver -> Chrome -> filhos) de
+    cada driver iniciado e encerra apenas esses processos, sem afetar os
+    navegadores de outros workers na mesma máquina.
+
+    Processos órfãos são reconhecidos pela variável GPI_CHROME_OWNER: se o
+    processo dono não existe mais, a árvore é encerrada na varredura.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.marker = _owner_marker(os.getpid())
+        self._lock = threading.Lock()
+        # driver -> pids da árvore registrada
+        self._trees: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._sweep_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls) -> "ChromeSupervisor":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = ChromeSupervisor()
+            return cls._instance
+
+    def child_env(self) -> Dict[str, str]:
+        """
+        Ambiente para o chromedriver/Chrome, com a marca de dono
+        """
+        env = dict(os.environ)
+        env[OWNER_ENV] = self.marker
+        return env
+
+    # ------------------------------------------------------------------
+    # Registro e encerramento por driver
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _tree(root_pid: int) -> Set[int]:
+        try:
+            root = psutil.Process(root_pid)
+            return {root_pid} | {child.pid for child in root.children(recursive=True)}
+        except psutil.NoSuchProcess:
+            return set()
+
+    @staticmethod
+    def _service_pid(driver) -> Optional[int]:
+        process = getattr(getattr(driver, "service", None), "process", None)
+        return getattr(process, "pid", None)
+
+    def register(self, driver):
+        """
+        Registra a árvore de processos de um driver recém-iniciado
+        """
+        pid = self._service_pid(driver)
+        if pid is None:
+            return
+        tree = self._tree(pid)
+        with self._lock:
+            self._trees[driver] = tree
+        logger.info(f"Chrome registrado: chromedriver {pid} com {len(tree) - 1} processos filhos")
+
+    def descendants(self) -> Set[int]:
+        """
+        Pids de todos os processos descendentes deste processo
+        """
+        return self._tree(os.getpid()) - {os.getpid()}
+
+    def register_launched(self, owner, before: Set[int]) -> int:
+        """
+        Registra sob `owner` a árvore de um navegador iniciado sem
+        chromedriver (Playwright): os processos Chrome descendentes deste
+        processo que não existiam em `before` e cujo pai não é um Chrome
+
+        Args:
+            owner: Objeto dono da árvore (ex.: o Browser do Playwright)
+            before: descendants() antes de iniciar o navegador
+
+        Returns:
+            Quantidade de processos registrados
+        """
+        roots = []
+        for pid in self.descendants() - before:
+            try:
+                proc = psutil.Process(pid)
+                name = proc.name().lower()
+                parent = proc.parent()
+                parent_name = parent.name().lower() if parent else ""
+            except psutil.Error:
+                continue
+            # Navegadores do Selenium iniciados ao mesmo tempo têm o chromedriver como raiz
+            if "chromedriver" in name or not any(chrome in name for chrome in CHROME_NAMES):
+                continue
+            if any(chrome in parent_name for chrome in CHROME_NAMES):
+                continue
+            roots.append(pid)
+        tree = set().union(*(self._tree(pid) for pid in roots)) if roots else set()
+        if tree:
+            with self._lock:
+                self._trees[owner] = tree
+            logger.info(f"Chrome registrado: navegador {roots} com {len(tree) - len(roots)} processos filhos")
+        return len(tree)
+
+    def quit(self, driver):
+        """
+        Fecha o driver e encerra qualquer processo da sua árvore que sobreviver
+        """
+        pid = self._service_pid(driver)
+        with self._lock:
+            tree = set(self._trees.pop(driver, set()))
+        # A árvore atual inclui os renderers abertos depois do registro
+        if pid is not None:
+            tree |= self._tree(pid)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Erro ao fechar o navegador: {e}")
+        survivors = []
+        for tree_pid in tree:
+            try:
+                survivors.append(psutil.Process(tree_pid))
+            except psutil.NoSuchProcess:
+                continue
+        if survivors:
+            logger.warning(f"Encerrando {len(survivors)} processos Chrome que sobreviveram ao quit()")
+            _terminate(survivors)
+
+    def tree_rss(self, driver) -> int:
+        """
+        Memória residente (bytes) somada de toda a árvore atual do driver:
+        chromedriver, browser, GPU e renderers
+
+        Returns:
+            Bytes de RSS (0 se o processo não puder ser lido)
+        """
+        pid = self._service_pid(driver)
+        if pid is None:
+            return 0
+        total = 0
+        for tree_pid in self._tree(pid):
+            try:
+                total += psutil.Process(tree_pid).memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total
+
+    # ------------------------------------------------------------------
+    # Varredura por marca de dono
+    # ------------------------------------------------------------------
+
+    def _marked_processes(self):
+        for proc in psutil.process_iter(["pid", "name", "create_time"]):
+            try:
+                name = (proc.info["name"] or "").lower()
+                if not any(chrome in name for chrome in CHROME_NAMES):
+                    continue
+                marker = proc.environ().get(OWNER_ENV)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            if marker:
+                yield proc, marker
+
+    def reap_orphans(self) -> int:
+        """
+        Encerra processos Chrome cujo dono (este ou outro worker) já morreu, e
+        processos deste dono que não pertencem a nenhum driver registrado
+
+        Returns:
+            Quantidade de processos encerrados
+        """
+        with self._lock:
+            tracked = set().union(*self._trees.values()) if self._trees else set()
+        now = time.time()
+        orphans = []
+        for proc, marker in self._marked_processes():
+            if marker == self.marker:
+                if proc.pid in tracked or now - proc.info["create_time"] < MIN_ORPHAN_AGE:
+                    continue
+                # Árvore de um driver registrado que ganhou filhos depois do registro
+                try:
+                    if any(parent.pid in tracked for parent in proc.parents()):
+                        continue
+                except psutil.NoSuchProcess:
+                    continue
+            elif _owner_alive(marker):
+                continue
+            orphans.append(proc)
+        if orphans:
+            logger.warning(f"Encerrando {len(orphans)} processos Chrome órfãos")
+            return _terminate(orphans)
+        return 0
+
+    def reap_owned(self) -> int:
+        """
+        Encerra todos os processos Chrome deste processo (encerramento do worker/API)
+        """
+        owned = [proc for proc, marker in self._marked_processes() if marker == self.marker]
+        with self._lock:
+            self._trees.clear()
+        if owned:
+            logger.info(f"Encerrando {len(owned)} processos Chrome deste processo")
+            return _terminate(owned)
+        return 0
+
+    def sweep_in_background(self, interval: Optional[float] = None) -> threading.Thread:
+        """
+        Varre órfãos em uma thread, sem bloquear a inicialização
+
+        Args:
+            interval: Repete a varredura a cada `interval` segundos (None: só uma vez)
+        """
+
+        def _sweep():
+            while True:
+                try:
+                    self.reap_orphans()
+                except Exception as e:
+                    logger.error(f"Erro na varredura de processos Chrome: {e}")
+                if interval is None:
+                    return
+                time.sleep(interval)
+
+        with self._lock:
+            if self._sweep_thread is None or not self._sweep_thread.is_alive():
+                self._sweep_thread = threading.Thread(
+                    target=_sweep, name="chrome-supervisor", daemon=True
+                )
+                self._sweep_thread.start()
+            return self._sweep_thread
@@ -167,7 +167,7 @@ class CNPJService:
         return f"{cnpj_raw[0:2]}.{cnpj_raw[2:5]}.{cnpj_raw[5:8]}/{cnpj_raw[8:12]}-{cnpj_raw[12:14]}"
     
     @staticmethod
-    async def process_cnpj_on_website(cnpj: CNPJ, headless: bool = False, fila_id: int = None, wait_times: dict = None) -> Dict[str, Any]:
+    async def process_cnpj_on_website(cnpj: CNPJ, headless: bool = False, fila_id: int = None, wait_times: dict = None, driver=None, driver_pool=None, engine: str = None, tab_runner=None, async_backend=None) -> Dict[str, Any]:
         """
         Process a CNPJ on the specified website
         
@@ -176,6 +176,11 @@ class CNPJService:
             headless: Whether to run browser in headless mode
             fila_id: ID da fila para nomear o PDF
             wait_times: Tempos de espera calculados dinamicamente
+            driver: Driver já iniciado (opcional)
+            driver_pool: DriverPool usado quando o Selenium for necessário (opcional)
+            engine: "auto" (caminho direto com fallback Selenium) ou "selenium"
+            tab_runner: MultiTabRunner usado em vez de um navegador por tarefa (opcional)
+            async_backend: AsyncPortalService usado em vez do Selenium (opcional)
             
         Returns:
             Dictionary with interaction results
@@ -183,8 +188,12 @@ class CNPJService:
         # Format the CNPJ for display
         formatted_cnpj = CNPJService.format_cnpj(cnpj.cnpj)
         
-        # Use the WebService to navigate to the portal, passando fila_id e wait_times
-        web_result = await WebService.navigate_to_gpi_portal(cnpj.cnpj, headless, fila_id=fila_id, wait_times=wait_times)
+        # Use the WebService to fetch the certificate (direct HTTP path with Selenium fallback)
+        web_result = await WebService.fetch_certidao(
+            cnpj.cnpj, headless, fila_id=fila_id, wait_times=wait_times,
+            driver=driver, driver_pool=driver_pool, engine=engine,
+            tab_runner=tab_runner, async_backend=async_backend
+        )
         if web_result is None:
             web_result = {}
         
@@ -197,10 +206,16 @@ class CNPJService:
             "resultado": resultado,  # Colocado explicitamente como primeiro campo
             "status_divida": status_divida,  # Garantir que este campo seja preservado
             "status": web_result.get("status", "unknown"),
+            "engine": web_result.get("engine", "selenium"),
             "message": f"Processed CNPJ {formatted_cnpj}",
             "website_url": web_result.get("url", "unknown"),
             "actions": web_result.get("actions", []),
             "screenshots": web_result.get("screenshots", []),
+            "request_blocking": web_result.get("request_blocking"),
+            "timings": web_result.get("timings"),
+            # Estados do PortalFlow e erro original: classificam timeouts e falhas transitórias
+            "flow": web_result.get("flow"),
+            "error": web_result.get("error"),
             "full_result": web_result.get("full_result", ""),
             "cnpj_data": {
                 "raw": cnpj.cnpj,
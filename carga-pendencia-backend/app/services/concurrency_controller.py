@@ -0,0 +1,238 @@
+"""
+Controle adaptativo (AIMD) da quantidade de sessões simultâneas no portal
+"""
+import logging
+import math
+import os
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+from app.services.worker_metrics import WorkerMetrics
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_TIMEOUT = "timeout"
+
+# Mensagens de erro que indicam que o portal não respondeu a tempo
+TIMEOUT_MARKERS = ("timeout", "timed out", "tempo esgotado", "prazo")
+
+
+def percentile(values, pct: float) -> float:
+    """
+    Percentil por posição (sem interpolação) de uma lista de valores
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Semáforo de tamanho variável: o limite de tarefas simultâneas cresce de 1
+    em 1 enquanto o p95 da latência do portal e a taxa de erro ficam dentro do
+    alvo, e é multiplicado por `decrease_factor` em timeouts ou quando a taxa
+    de erro passa do limite (AIMD).
+
+    Cada ajuste espera `limit` tarefas concluídas desde o anterior, para que
+    uma mesma rajada de timeouts não corte o limite várias vezes, e o limite
+    só cresce se estiver de fato sendo usado.
+
+    Exemplo:
+        limiter = AdaptiveConcurrencyLimiter.from_env(initial=3, max_limit=8)
+        limiter.acquire()
+        try:
+            result = processar()
+        finally:
+            limiter.release_result(result, elapsed)
+    """
+
+    def __init__(
+        self,
+        initial: int = 3,
+        min_limit: int = 1,
+        max_limit: int = 10,
+        target_p95: float = 60.0,
+        max_error_rate: float = 0.2,
+        window: int = 30,
+        decrease_factor: float = 0.7,
+        min_samples: int = 5,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.decrease_factor = decrease_factor
+        self.min_samples = min_samples
+        self._limit = min(self.max_limit, max(self.min_limit, initial))
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._since_change = 0
+        # Houve timeout desde o último ajuste
+        self._timeout_seen = False
+        self._samples: deque = deque(maxlen=max(window, min_samples))
+        self._cond = threading.Condition()
+        self.metrics = WorkerMetrics.get_instance()
+        self._publish()
+
+    @staticmethod
+    def from_env(initial: int, max_limit: int) -> "AdaptiveConcurrencyLimiter":
+        """
+        Limiter com os alvos de GPI_CONCURRENCY_MIN, GPI_CONCURRENCY_TARGET_P95
+        (segundos) e GPI_CONCURRENCY_MAX_ERROR_RATE
+        """
+        return AdaptiveConcurrencyLimiter(
+            initial=initial,
+            min_limit=int(os.getenv("GPI_CONCURRENCY_MIN", "1")),
+            max_limit=max_limit,
+            target_p95=float(os.getenv("GPI_CONCURRENCY_TARGET_P95", "60")),
+            max_error_rate=float(os.getenv("GPI_CONCURRENCY_MAX_ERROR_RATE", "0.2")),
+        )
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera uma vaga abaixo do limite atual
+
+        Returns:
+            False se o prazo expirou sem vaga
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_flight < self._limit, timeout):
+                return False
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._publish()
+            return True
+
+    def release(self, outcome: str, latency: Optional[float] = None):
+        """
+        Libera a vaga e ajusta o limite com o resultado da tarefa
+
+        Args:
+            outcome: "ok", "error" ou "timeout"
+            latency: Segundos gastos no portal (None se não medido)
+        """
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._samples.append((outcome, latency))
+            self._since_change += 1
+            self._adjust(outcome)
+            self._publish()
+            self._cond.notify_all()
+
+    def release_unused(self):
+        """
+        Libera a vaga sem amostra: a tarefa não chegou a consultar o portal
+        (outro worker a reivindicou) ou foi cancelada no meio da consulta
+        """
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._publish()
+            self._cond.notify_all()
+
+    def release_result(self, result: Optional[Dict[str, Any]], elapsed: float):
+        """
+        release() a partir do dicionário de resultado da consulta
+        """
+        if result and result.get("status") == "cancelled":
+            # Tarefa excluída no meio da consulta: não diz nada sobre o portal
+            self.release_unused()
+            return
+        self.release(self.outcome_of(result), self.latency_of(result, elapsed))
+
+    @staticmethod
+    def outcome_of(result: Optional[Dict[str, Any]]) -> str:
+        if result and result.get("status") == "success":
+            return OUTCOME_OK
+        message = " ".join(
+            str((result or {}).get(key) or "") for key in ("message", "error")
+        ).lower()
+        if any(marker in message for marker in TIMEOUT_MARKERS):
+            return OUTCOME_TIMEOUT
+        return OUTCOME_ERROR
+
+    @staticmethod
+    def latency_of(result: Optional[Dict[str, Any]], elapsed: float) -> float:
+        """
+        Tempo no portal: total medido pelo StepTimer sem a espera por um
+        navegador livre e sem a inicialização do Chrome
+        """
+        timings = (result or {}).get("timings") or {}
+        total = timings.get("total_s")
+        if total is None:
+            return elapsed
+        phases = timings.get("phases") or {}
+        return max(0.0, total - phases.get("driver_acquire", 0) - phases.get("driver_launch", 0))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return self._stats()
+
+    def _stats(self) -> Dict[str, Any]:
+        latencies = [lat for _, lat in self._samples if lat is not None]
+        errors = sum(1 for outcome, _ in self._samples if outcome != OUTCOME_OK)
+        return {
+            "limit": self._limit,
+            "in_flight": self._in_flight,
+            "p95_s": round(percentile(latencies, 95), 2),
+            "error_rate": round(errors / len(self._samples), 3) if self._samples else 0.0,
+            "samples": len(self._samples),
+        }
+
+    def _adjust(self, outcome: str):
+        if outcome == OUTCOME_TIMEOUT:
+            self._timeout_seen = True
+        # Um ajuste por "rodada" de tarefas (limit conclusões)
+        if self._since_change < self._limit:
+            return
+        stats = self._stats()
+        if self._timeout_seen or (
+            stats["samples"] >= self.min_samples and stats["error_rate"] > self.max_error_rate
+        ):
+            new_limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+            if new_limit < self._limit:
+                logger.warning(
+                    f"Portal degradado ({outcome}, erro {stats['error_rate']:.0%}, "
+                    f"p95 {stats['p95_s']}s): concorrência {self._limit} -> {new_limit}"
+                )
+                self._limit = new_limit
+                self.metrics.inc("concurrency_decrease_total")
+            self._since_change = 0
+            self._timeout_seen = False
+            self._peak_in_flight = self._in_flight
+            return
+        healthy = (
+            stats["samples"] >= self.min_samples
+            and stats["p95_s"] <= self.target_p95
+            and stats["error_rate"] <= self.max_error_rate
+        )
+        # Só cresce se o limite atual chegou a ser usado por inteiro
+        if healthy and self._peak_in_flight >= self._limit and self._limit < self.max_limit:
+            self._limit += 1
+            self.metrics.inc("concurrency_increase_total")
+            logger.info(
+                f"Portal saudável (p95 {stats['p95_s']}s, erro {stats['error_rate']:.0%}): "
+                f"concorrência aumentada para {self._limit}"
+            )
+            self._since_change = 0
+            self._peak_in_flight = self._in_flight
+
+    def _publish(self):
+        stats = self._stats()
+        self.metrics.set("concurrency_limit", stats["limit"])
+        self.metrics.set("concurrency_in_flight", stats["in_flight"])
+        self.metrics.set("concurrency_p95_s", stats["p95_s"])
+        self.metrics.set("concurrency_error_rate", stats["error_rate"])
+        self.metrics.set("concurrency_max_limit", self.max_limit)
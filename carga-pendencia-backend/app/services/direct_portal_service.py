@@ -0,0 +1,392 @@
+"""
+Motor "direct" do portal GPI: repete via HTTP as requisições que o próprio portal
+faz, sem renderizar nada no navegador.
+
+As requisições são aprendidas a partir de uma execução bem-sucedida do Selenium
+(selenium-wire captura tudo o que a página envia) e salvas como templates em disco.
+Valores dinâmicos (tokens de sessão devolvidos pelo servidor) são extraídos das
+respostas anteriores durante o replay.
+"""
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_PATH = os.getenv("GPI_DIRECT_TEMPLATES", "temp/gpi_direct_templates.json")
+
+# Recursos estáticos que não fazem parte do fluxo de dados do portal
+STATIC_EXTENSIONS = (
+    ".js", ".css", ".png", ".gif", ".jpg", ".jpeg", ".svg", ".ico",
+    ".woff", ".woff2", ".ttf", ".eot", ".map",
+)
+# Cabeçalhos relevantes para o servidor GWT; o restante é recriado pela Session
+REPLAY_HEADERS = (
+    "content-type", "accept", "x-gwt-permutation", "x-gwt-module-base",
+    "x-requested-with", "referer",
+)
+TOKEN_PATTERN = r"[A-Za-z0-9_\-:]{16,}"
+TOKEN_CHARSET = r"[A-Za-z0-9_\-:]+"
+TOKEN_PREFIX_LEN = 24
+
+
+class DirectPortalError(Exception):
+    """Falha no caminho direto; o chamador deve recorrer ao Selenium"""
+
+
+def _decode_body(body: bytes, headers) -> str:
+    if not body:
+        return ""
+    try:
+        from seleniumwire.utils import decode  # type: ignore
+
+        body = decode(body, headers.get("Content-Encoding", "identity"))
+    except Exception:
+        pass
+    return body.decode("utf-8", errors="replace")
+
+
+def _format_cnpj(cnpj: str) -> str:
+    if len(cnpj) != 14:
+        return cnpj
+    return f"{cnpj[0:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
+
+
+class DirectPortalService:
+    """
+    Repete o fluxo do portal com um pool de requests.Session (keep-alive)
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        templates_path: str = TEMPLATES_PATH,
+        pool_size: int = 10,
+        timeout: float = 30,
+        max_consecutive_failures: int = 5,
+    ):
+        self.templates_path = templates_path
+        self.timeout = timeout
+        self.max_consecutive_failures = max_consecutive_failures
+        self._lock = threading.Lock()
+        self._template: Optional[Dict[str, Any]] = None
+        self._consecutive_failures = 0
+        # Uma consulta por vez refaz o fluxo completo para aprender os templates
+        self._learning = False
+        self._last_learning_attempt: Optional[float] = None
+        self._sessions: "queue.Queue[requests.Session]" = queue.Queue()
+        for _ in range(pool_size):
+            self._sessions.put(self._new_session(pool_size))
+        self._load()
+
+    @classmethod
+    def get_instance(cls) -> "DirectPortalService":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = DirectPortalService()
+            return cls._instance
+
+    @staticmethod
+    def _new_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+            "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        )
+        return session
+
+    # ------------------------------------------------------------------
+    # Templates
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        if not os.path.exists(self.templates_path):
+            return
+        try:
+            with open(self.templates_path, "r", encoding="utf-8") as f:
+                self._template = json.load(f)
+            logger.info(
+                f"Templates do caminho direto carregados de {self.templates_path} "
+                f"({len(self._template.get('steps', []))} requisições)"
+            )
+        except Exception as e:
+            logger.warning(f"Não foi possível carregar templates do caminho direto: {e}")
+            self._template = None
+
+    def _save(self, template: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.templates_path) or ".", exist_ok=True)
+        tmp_path = f"{self.templates_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(template, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.templates_path)
+
+    @property
+    def available(self) -> bool:
+        """
+        Existem templates válidos para tentar o caminho direto
+        """
+        return self._template is not None and not self._template.get("stale")
+
+    def learned_for(self, portal_url: str) -> bool:
+        """
+        Os templates (válidos ou não) foram aprendidos a partir deste portal
+        """
+        return self._template is not None and self._template.get("portal_url") == portal_url
+
+    def begin_learning(self, portal_url: str, retry_interval: float = 300) -> bool:
+        """
+        Reserva a próxima consulta para aprender o caminho direto pelo fluxo
+        Selenium completo (a sessão estacionada, as abas e o backend
+        assíncrono não capturam as requisições desde a página inicial).
+        Só uma consulta por vez aprende, e uma tentativa que falhou só se
+        repete depois de `retry_interval` segundos.
+
+        Returns:
+            True se esta consulta deve aprender; chamar finish_learning() ao final
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._learning or (
+                self._last_learning_attempt is not None
+                and now - self._last_learning_attempt < retry_interval
+            ):
+                return False
+            self._learning = True
+            self._last_learning_attempt = now
+        motivo = "templates obsoletos" if self._template is not None else "nenhum template aprendido"
+        logger.info(
+            f"Caminho direto desligado ({motivo} para {portal_url}); "
+            f"aprendendo com o fluxo Selenium completo da próxima consulta"
+        )
+        return True
+
+    def finish_learning(self):
+        with self._lock:
+            self._learning = False
+
+    def invalidate(self, reason: str):
+        """
+        Marca os templates como obsoletos, forçando novo aprendizado pelo Selenium
+        """
+        with self._lock:
+            if self._template is not None:
+                logger.warning(f"Templates do caminho direto invalidados: {reason}")
+                self._template["stale"] = True
+
+    def learn_from_driver(self, driver, cnpj: str, portal_url: str) -> bool:
+        """
+        Aprende o fluxo a partir das requisições capturadas pelo selenium-wire
+
+        Args:
+            driver: Driver selenium-wire que acabou de obter a certidão
+            cnpj: CNPJ consultado nessa execução
+            portal_url: URL inicial do portal
+
+        Returns:
+            True se os templates foram gravados
+        """
+        captured = getattr(driver, "requests", None)
+        if not captured:
+            return False
+        portal_host = urlparse(portal_url).netloc
+        cnpj_fmt = _format_cnpj(cnpj)
+
+        records = []
+        for req in captured:
+            response = req.response
+            if response is None or urlparse(req.url).netloc != portal_host:
+                continue
+            path = urlparse(req.url).path.lower()
+            if req.method == "GET" and path.endswith(STATIC_EXTENSIONS):
+                continue
+            records.append(
+                {
+                    "method": req.method,
+                    "url": req.url,
+                    "headers": {
+                        k: v for k, v in req.headers.items() if k.lower() in REPLAY_HEADERS
+                    },
+                    "body": _decode_body(req.body, req.headers),
+                    "status": response.status_code,
+                    "response": _decode_body(response.body, response.headers),
+                    "set_cookie": response.headers.get("Set-Cookie", "") or "",
+                }
+            )
+
+        result_index = None
+        for i, rec in enumerate(records):
+            if 'class="texto"' in rec["response"]:
+                result_index = i
+        if result_index is None:
+            logger.info("Nenhuma resposta com div.texto capturada; caminho direto não aprendido")
+            return False
+        records = records[: result_index + 1]
+
+        steps: List[Dict[str, Any]] = []
+        extractors: List[Dict[str, Any]] = []
+        known_tokens: Dict[str, str] = {}
+        for i, rec in enumerate(records):
+            url = rec["url"].replace(cnpj_fmt, "{{CNPJ_FORMATADO}}").replace(cnpj, "{{CNPJ}}")
+            body = rec["body"].replace(cnpj_fmt, "{{CNPJ_FORMATADO}}").replace(cnpj, "{{CNPJ}}")
+            for token in set(re.findall(TOKEN_PATTERN, url + "\n" + body)):
+                if "{{" in token:
+                    continue
+                name = known_tokens.get(token)
+                if name is None:
+                    for j in range(i):
+                        source = records[j]["response"]
+                        pos = source.find(token)
+                        if pos < 0:
+                            continue
+                        name = f"T{len(extractors)}"
+                        prefix = source[max(0, pos - TOKEN_PREFIX_LEN):pos]
+                        extractors.append(
+                            {"name": name, "step": j, "prefix": re.escape(prefix)}
+                        )
+                        known_tokens[token] = name
+                        break
+                if name:
+                    url = url.replace(token, "{{%s}}" % name)
+                    body = body.replace(token, "{{%s}}" % name)
+            steps.append(
+                {
+                    "method": rec["method"],
+                    "url": url,
+                    "headers": rec["headers"],
+                    "body": body,
+                }
+            )
+
+        if not any("{{CNPJ" in step["url"] + step["body"] for step in steps):
+            logger.info("CNPJ não encontrado nas requisições capturadas; caminho direto não aprendido")
+            return False
+
+        template = {
+            "learned_at": time.time(),
+            "portal_url": portal_url,
+            "steps": steps,
+            "extractors": extractors,
+        }
+        with self._lock:
+            self._save(template)
+            self._template = template
+            self._consecutive_failures = 0
+        logger.info(
+            f"Caminho direto aprendido: {len(steps)} requisições, {len(extractors)} tokens dinâmicos"
+        )
+        return True
+
+    # ------------------------------------------------------------------
+    # Replay
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fill(text: str, values: Dict[str, str]) -> str:
+        for name, value in values.items():
+            text = text.replace("{{%s}}" % name, value)
+        return text
+
+    def _replay(self, session: requests.Session, cnpj: str) -> str:
+        template = self._template
+        if not template:
+            raise DirectPortalError("Sem templates do caminho direto")
+        values = {"CNPJ": cnpj, "CNPJ_FORMATADO": _format_cnpj(cnpj)}
+        extractors = template.get("extractors", [])
+        text = ""
+        for i, step in enumerate(template["steps"]):
+            url = self._fill(step["url"], values)
+            body = self._fill(step["body"], values)
+            response = session.request(
+                step["method"],
+                url,
+                data=body.encode("utf-8") if body else None,
+                headers=step.get("headers") or {},
+                timeout=self.timeout,
+            )
+            if response.status_code >= 400:
+                raise DirectPortalError(f"HTTP {response.status_code} na requisição {i}")
+            text = response.text
+            if text.startswith("//EX"):
+                raise DirectPortalError(f"Exceção GWT na requisição {i}")
+            for extractor in extractors:
+                if extractor["step"] != i:
+                    continue
+                match = re.search(extractor["prefix"] + f"({TOKEN_CHARSET})", text)
+                if not match:
+                    raise DirectPortalError(
+                        f"Token {extractor['name']} não encontrado na resposta {i}"
+                    )
+                values[extractor["name"]] = match.group(1)
+        if 'class="texto"' not in text:
+            raise DirectPortalError("Resposta final não contém div.texto")
+        return text
+
+    def fetch_certidao(self, cnpj: str, timer=None) -> Dict[str, Any]:
+        """
+        Obtém a certidão sem navegador
+
+        Args:
+            cnpj: CNPJ a consultar (apenas dígitos)
+            timer: StepTimer da tarefa (opcional)
+
+        Returns:
+            Dicionário no mesmo formato de WebService.navigate_to_gpi_portal
+
+        Raises:
+            DirectPortalError: se o caminho direto falhar
+        """
+        from app.services.web_service import WebService
+        from app.services.step_timer import StepTimer
+
+        timer = timer or StepTimer()
+        if not self.available:
+            raise DirectPortalError("Caminho direto indisponível")
+        session = self._sessions.get()
+        start = time.monotonic()
+        try:
+            # Cada tarefa abre uma sessão nova no portal, reaproveitando as conexões
+            session.cookies.clear()
+            with timer.phase("direct_replay"):
+                html = self._replay(session, cnpj)
+        except DirectPortalError:
+            self._register_failure()
+            raise
+        except requests.RequestException as e:
+            self._register_failure()
+            raise DirectPortalError(f"Erro HTTP no caminho direto: {e}")
+        finally:
+            self._sessions.put(session)
+
+        self._consecutive_failures = 0
+        result = WebService.resultado_from_html(
+            html, "Texto extraído com sucesso (caminho direto)", timer=timer
+        )
+        result["engine"] = "direct"
+        logger.info(
+            f"Certidão do CNPJ {cnpj} obtida pelo caminho direto em {time.monotonic() - start:.2f}s"
+        )
+        return result
+
+    def _register_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            failures = self._consecutive_failures
+        if failures >= self.max_consecutive_failures:
+            self.invalidate(f"{failures} falhas consecutivas")
@@ -0,0 +1,566 @@
+"""
+Pool de navegadores Chrome pré-iniciados, compartilhado entre as tarefas do worker
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, List, Dict
+from urllib.parse import urlparse
+
+from app.services.web_service import WebService
+from app.services.chrome_supervisor import ChromeSupervisor
+from app.services.worker_metrics import WorkerMetrics
+from app.services.wait_policy import WaitPolicy
+from app.services.step_timer import StepTimer
+from app.services.parked_session import ParkedSession, SessionExpired, PARK_MAX_IDLE
+
+logger = logging.getLogger(__name__)
+
+
+def portal_origin() -> str:
+    """
+    Origem do portal GPI (respeita GPI_PORTAL_URL), usada para limpar storage entre tarefas
+    """
+    url = urlparse(WebService.portal_url())
+    return f"{url.scheme}://{url.netloc}"
+
+
+class RecyclePolicy:
+    """
+    Quando aposentar um navegador do pool: Chrome de vida longa vaza memória,
+    e abrir um por tarefa é caro. O navegador é trocado depois de max_tasks
+    tarefas, acima de max_rss_mb (somado em toda a árvore de processos), depois
+    de max_age segundos ou após max_failures falhas seguidas. Zero desativa o
+    critério.
+    """
+
+    def __init__(
+        self,
+        max_tasks: int = 200,
+        max_rss_mb: float = 1500,
+        max_age: float = 3600,
+        max_failures: int = 3,
+    ):
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self.max_age = max_age
+        self.max_failures = max_failures
+
+    @staticmethod
+    def from_env() -> "RecyclePolicy":
+        """
+        Limites de GPI_RECYCLE_MAX_TASKS, GPI_RECYCLE_MAX_RSS_MB,
+        GPI_RECYCLE_MAX_AGE e GPI_RECYCLE_MAX_FAILURES
+        """
+        return RecyclePolicy(
+            max_tasks=int(os.getenv("GPI_RECYCLE_MAX_TASKS", "200")),
+            max_rss_mb=float(os.getenv("GPI_RECYCLE_MAX_RSS_MB", "1500")),
+            max_age=float(os.getenv("GPI_RECYCLE_MAX_AGE", "3600")),
+            max_failures=int(os.getenv("GPI_RECYCLE_MAX_FAILURES", "3")),
+        )
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "max_tasks": self.max_tasks,
+            "max_rss_mb": self.max_rss_mb,
+            "max_age": self.max_age,
+            "max_failures": self.max_failures,
+        }
+
+    def reason(self, pooled: "PooledDriver") -> Optional[str]:
+        """
+        Motivo para aposentar o navegador, ou None se ele pode continuar
+
+        Returns:
+            "tasks", "failures", "age", "rss" ou None
+        """
+        if self.max_tasks and pooled.tasks >= self.max_tasks:
+            return "tasks"
+        if self.max_failures and pooled.consecutive_failures >= self.max_failures:
+            return "failures"
+        if self.max_age and time.monotonic() - pooled.created_at >= self.max_age:
+            return "age"
+        if self.max_rss_mb:
+            rss_mb = ChromeSupervisor.get_instance().tree_rss(pooled.driver) / (1024 * 1024)
+            pooled.rss_mb = round(rss_mb, 1)
+            if rss_mb >= self.max_rss_mb:
+                return "rss"
+        return None
+
+
+class PooledDriver:
+    """
+    Navegador mantido pelo pool, com a pasta de downloads exclusiva do slot
+    """
+
+    def __init__(self, driver, slot: int, download_dir: str):
+        self.driver = driver
+        self.slot = slot
+        self.download_dir = download_dir
+        self.created_at = time.monotonic()
+        self.tasks = 0
+        self.consecutive_failures = 0
+        self.rss_mb = 0.0
+        # Última vez em que a sessão foi confirmada no formulário de CNPJ
+        self.parked_at: Optional[float] = None
+        # Substituto já está sendo aquecido
+        self.recycling = False
+        # Substituto pronto: o navegador sai do pool na próxima vez que for devolvido ou emprestado
+        self.retired = False
+
+
+class DriverPool:
+    """
+    Mantém N navegadores Chrome aquecidos e verificados, emprestando um por tarefa.
+
+    Entre tarefas o estado do navegador é resetado (cookies, storage, abas extras
+    e pasta de downloads) e instâncias quebradas são substituídas em background.
+
+    Com park=True a sessão do portal é mantida entre tarefas: cada navegador
+    fica estacionado no formulário de CNPJ (ParkedSession) e volta para ele em
+    background depois de cada uso.
+
+    Navegadores que atingem um limite da RecyclePolicy continuam atendendo
+    enquanto o substituto é iniciado (e estacionado) em background; só depois
+    que ele entra no pool o antigo é fechado.
+    """
+
+    def __init__(
+        self,
+        size: int = 3,
+        headless: bool = True,
+        download_root: str = "document/pool",
+        acquire_timeout: float = 600,
+        park: bool = False,
+        recycle: Optional[RecyclePolicy] = None,
+    ):
+        self.size = max(1, size)
+        self.headless = headless
+        self.download_root = os.path.abspath(download_root)
+        self.acquire_timeout = acquire_timeout
+        self.park = park
+        self.recycle = recycle or RecyclePolicy.from_env()
+        self._available: "queue.Queue[PooledDriver]" = queue.Queue()
+        self._all: List[PooledDriver] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        # Geração do navegador de cada slot (pasta de downloads própria ao reciclar)
+        self._generation: Dict[int, int] = {}
+        self.metrics = WorkerMetrics.get_instance()
+        for name, value in self.recycle.as_dict().items():
+            self.metrics.set(f"browser_recycle_{name}", value)
+        self.metrics.set("browser_pool_size", self.size)
+
+    def start(self):
+        """
+        Inicia os navegadores do pool em paralelo
+        """
+        logger.info(f"Iniciando pool com {self.size} navegadores Chrome...")
+        threads = [
+            threading.Thread(target=self._launch_into_pool, args=(slot,), daemon=True)
+            for slot in range(self.size)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        logger.info(
+            f"Pool de navegadores pronto: {self._available.qsize()}/{self.size} disponíveis"
+        )
+        logger.info(f"Reciclagem de navegadores: {self.recycle.as_dict()}")
+        self.metrics.set("browser_pool_alive", len(self._all))
+
+    def _launch(self, slot: int) -> Optional[PooledDriver]:
+        with self._lock:
+            generation = self._generation.get(slot, -1) + 1
+            self._generation[slot] = generation
+        name = f"slot_{slot}" if generation == 0 else f"slot_{slot}_g{generation}"
+        download_dir = os.path.join(self.download_root, name)
+        os.makedirs(download_dir, exist_ok=True)
+        try:
+            driver = WebService.create_chrome_driver(self.headless, download_dir)
+            driver.set_window_size(1280, 800)
+            pooled = PooledDriver(driver, slot, download_dir)
+            self._apply_download_dir(pooled)
+            logger.info(f"Navegador do slot {slot} iniciado")
+            self.metrics.inc("browser_launched_total")
+            if self.park:
+                self._park(pooled)
+            return pooled
+        except Exception as e:
+            logger.error(f"Falha ao iniciar navegador do slot {slot}: {e}")
+            return None
+
+    def _add(self, pooled: PooledDriver) -> bool:
+        """
+        Coloca um navegador recém-iniciado no pool; se o pool foi encerrado
+        enquanto ele iniciava, o navegador é fechado
+
+        Returns:
+            True se o navegador entrou no pool
+        """
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._all.append(pooled)
+                self._available.put(pooled)
+        if closed:
+            self._discard(pooled)
+            return False
+        self.metrics.set("browser_pool_alive", len(self._all))
+        return True
+
+    def _launch_into_pool(self, slot: int, retries: int = 3, rodada: int = 0):
+        for tentativa in range(1, retries + 1):
+            if self._closed:
+                return
+            pooled = self._launch(slot)
+            if pooled:
+                self._add(pooled)
+                return
+            time.sleep(min(5 * tentativa, 30))
+        if self._closed:
+            return
+        # O slot não é abandonado: nova rodada em background, com espera crescente
+        atraso = min(60 * 2 ** rodada, 900)
+        logger.error(
+            f"Slot {slot} do pool ficou sem navegador após {retries} tentativas; "
+            f"nova tentativa em {atraso}s"
+        )
+        self.metrics.inc("browser_launch_failed_total")
+        timer = threading.Timer(atraso, self._launch_into_pool, args=(slot, retries, rodada + 1))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _is_healthy(driver) -> bool:
+        """
+        Verifica se o navegador ainda responde a comandos
+        """
+        try:
+            driver.execute_script("return 1;")
+            return len(driver.window_handles) > 0
+        except Exception as e:
+            logger.warning(f"Navegador do pool não respondeu ao health check: {e}")
+            return False
+
+    @staticmethod
+    def _apply_download_dir(pooled: PooledDriver):
+        try:
+            pooled.driver.execute_cdp_cmd(
+                "Page.setDownloadBehavior",
+                {"behavior": "allow", "downloadPath": pooled.download_dir},
+            )
+        except Exception as e:
+            logger.warning(f"Não foi possível configurar downloads do slot {pooled.slot}: {e}")
+
+    def _reset(self, pooled: PooledDriver):
+        """
+        Limpa o estado deixado pela tarefa anterior, mantendo o cache HTTP aquecido
+        """
+        driver = pooled.driver
+        handles = driver.window_handles
+        main_handle = handles[0]
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(main_handle)
+        driver.get("about:blank")
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        try:
+            driver.execute_cdp_cmd(
+                "Storage.clearDataForOrigin",
+                {
+                    "origin": portal_origin(),
+                    "storageTypes": "local_storage,session_storage,indexeddb,service_workers",
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Não foi possível limpar storage do portal: {e}")
+        # selenium-wire guarda todas as requisições capturadas em memória
+        try:
+            del driver.requests
+        except Exception:
+            pass
+        self._clear_downloads(pooled)
+
+    def _clear_downloads(self, pooled: PooledDriver):
+        for entry in os.listdir(pooled.download_dir):
+            path = os.path.join(pooled.download_dir, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self._apply_download_dir(pooled)
+
+    def _park(self, pooled: PooledDriver, timer: StepTimer = None) -> bool:
+        """
+        Leva o navegador ao formulário de CNPJ
+        """
+        try:
+            parked = ParkedSession.park_at_form(pooled.driver, WaitPolicy(), timer)
+        except Exception as e:
+            logger.warning(f"Falha ao estacionar a sessão do slot {pooled.slot}: {e}")
+            parked = False
+        pooled.parked_at = time.monotonic() if parked else None
+        return parked
+
+    def _parked_and_fresh(self, pooled: PooledDriver) -> bool:
+        return (
+            pooled.parked_at is not None
+            and time.monotonic() - pooled.parked_at < PARK_MAX_IDLE
+            and ParkedSession.is_parked(pooled.driver)
+        )
+
+    def _light_reset(self, pooled: PooledDriver):
+        """
+        Reset entre tarefas que preserva a sessão do portal (cookies e página)
+        """
+        driver = pooled.driver
+        handles = driver.window_handles
+        if len(handles) > 1:
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+        try:
+            del driver.requests
+        except Exception:
+            pass
+        self._clear_downloads(pooled)
+
+    def _park_and_return(self, pooled: PooledDriver):
+        if not self._closed and not self._parked_and_fresh(pooled):
+            self._park(pooled)
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._available.put(pooled)
+        if closed:
+            # shutdown() rodou enquanto a sessão era estacionada
+            self._discard(pooled)
+
+    def submit_parked(
+        self,
+        driver,
+        cnpj: str,
+        fila_id: Optional[int] = None,
+        policy: WaitPolicy = None,
+        timer: StepTimer = None,
+    ) -> Optional[dict]:
+        """
+        Consulta o CNPJ pela sessão estacionada do navegador emprestado,
+        refazendo a sessão uma vez se ela tiver expirado
+
+        Returns:
+            Resultado no formato de WebService.navigate_to_gpi_portal, ou None
+            se a sessão não pôde ser usada (o chamador segue pelo fluxo completo)
+        """
+        pooled = next((p for p in list(self._all) if p.driver is driver), None)
+        if pooled is None:
+            return None
+        for tentativa in (1, 2):
+            if tentativa == 2 or not self._parked_and_fresh(pooled):
+                if not self._park(pooled, timer):
+                    return None
+            try:
+                result = ParkedSession.submit_parked(
+                    driver, cnpj, fila_id, policy=policy, timer=timer
+                )
+            except SessionExpired as e:
+                logger.warning(
+                    f"Sessão estacionada do slot {pooled.slot} expirou ({e}); refazendo"
+                )
+                pooled.parked_at = None
+                continue
+            pooled.parked_at = time.monotonic()
+            return result
+        return None
+
+    def _discard(self, pooled: PooledDriver):
+        with self._lock:
+            if pooled in self._all:
+                self._all.remove(pooled)
+        try:
+            WebService.close_driver(pooled.driver)
+        except Exception as e:
+            logger.warning(f"Erro ao fechar navegador quebrado do slot {pooled.slot}: {e}")
+        shutil.rmtree(pooled.download_dir, ignore_errors=True)
+        self.metrics.set("browser_pool_alive", len(self._all))
+
+    def _replace(self, pooled: PooledDriver):
+        """
+        Descarta um navegador quebrado e inicia outro no mesmo slot em background
+        """
+        logger.warning(f"Substituindo navegador do slot {pooled.slot}")
+        self.metrics.inc("browser_replaced_broken_total")
+        self._discard(pooled)
+        if not self._closed:
+            threading.Thread(
+                target=self._launch_into_pool, args=(pooled.slot,), daemon=True
+            ).start()
+
+    def _recycle(self, pooled: PooledDriver, reason: str):
+        """
+        Aquece o substituto do navegador e só então aposenta o antigo
+        """
+        logger.info(
+            f"Reciclando navegador do slot {pooled.slot} ({reason}): {pooled.tasks} tarefas, "
+            f"{pooled.rss_mb} MB, {time.monotonic() - pooled.created_at:.0f}s, "
+            f"{pooled.consecutive_failures} falhas seguidas"
+        )
+        replacement = None if self._closed else self._launch(pooled.slot)
+        if replacement is None:
+            # Sem substituto o antigo continua atendendo; nova tentativa no próximo release
+            logger.warning(f"Substituto do slot {pooled.slot} não iniciou; reciclagem adiada")
+            self.metrics.inc("browser_recycle_failed_total")
+            pooled.recycling = False
+            return
+        if not self._add(replacement):
+            return
+        self.metrics.inc("browser_recycled_total")
+        self.metrics.inc(f"browser_recycled_{reason}_total")
+        # O antigo sai no próximo acquire/release; se estiver ocioso na fila, o
+        # acquire que o pegar o descarta
+        pooled.retired = True
+
+    def _retire(self, pooled: PooledDriver):
+        logger.info(f"Navegador antigo do slot {pooled.slot} aposentado")
+        self._discard(pooled)
+
+    def _check_recycle(self, pooled: PooledDriver):
+        if pooled.recycling or self._closed:
+            return
+        try:
+            reason = self.recycle.reason(pooled)
+        except Exception as e:
+            logger.warning(f"Erro ao avaliar reciclagem do slot {pooled.slot}: {e}")
+            return
+        if reason:
+            pooled.recycling = True
+            threading.Thread(
+                target=self._recycle, args=(pooled, reason), daemon=True
+            ).start()
+
+    def report(self, driver, success: bool):
+        """
+        Registra o resultado da tarefa feita com um navegador do pool; falhas
+        seguidas contam para a reciclagem
+        """
+        pooled = next((p for p in list(self._all) if p.driver is driver), None)
+        if pooled is None:
+            return
+        if success:
+            pooled.consecutive_failures = 0
+        else:
+            pooled.consecutive_failures += 1
+            self.metrics.inc("browser_task_failures_total")
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledDriver:
+        """
+        Empresta um navegador saudável do pool
+
+        Args:
+            timeout: Tempo máximo de espera por um navegador livre
+
+        Returns:
+            PooledDriver emprestado
+        """
+        deadline = time.monotonic() + (timeout or self.acquire_timeout)
+        while True:
+            if self._closed:
+                raise RuntimeError("Pool de navegadores encerrado")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Nenhum navegador livre no pool dentro do prazo")
+            try:
+                pooled = self._available.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if pooled.retired:
+                self._retire(pooled)
+                continue
+            if self._is_healthy(pooled.driver):
+                return pooled
+            self._replace(pooled)
+
+    def release(self, pooled: PooledDriver, broken: bool = False):
+        """
+        Devolve um navegador ao pool, resetando-o ou substituindo-o se estiver quebrado
+
+        Args:
+            pooled: Navegador emprestado por acquire()
+            broken: Força a substituição do navegador
+        """
+        pooled.tasks += 1
+        self.metrics.inc("browser_tasks_total")
+        if self._closed:
+            self._discard(pooled)
+            return
+        if pooled.retired:
+            self._retire(pooled)
+            return
+        if broken or not self._is_healthy(pooled.driver):
+            self._replace(pooled)
+            return
+        self._check_recycle(pooled)
+        try:
+            if self.park:
+                self._light_reset(pooled)
+            else:
+                self._reset(pooled)
+        except Exception as e:
+            logger.warning(f"Falha ao resetar navegador do slot {pooled.slot}: {e}")
+            self._replace(pooled)
+            return
+        if self.park and not ParkedSession.is_parked(pooled.driver):
+            # Volta ao formulário em background; o navegador só fica disponível
+            # depois de estacionado
+            pooled.parked_at = None
+            threading.Thread(
+                target=self._park_and_return, args=(pooled,), daemon=True
+            ).start()
+            return
+        self._available.put(pooled)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        """
+        Context manager que empresta um driver e o devolve ao final da tarefa
+
+        Exemplo:
+            with pool.lease() as driver:
+                ...
+        """
+        pooled = self.acquire(timeout)
+        broken = False
+        try:
+            yield pooled.driver
+        except Exception:
+            pooled.consecutive_failures += 1
+            broken = not self._is_healthy(pooled.driver)
+            raise
+        finally:
+            self.release(pooled, broken=broken)
+
+    def shutdown(self):
+        """
+        Fecha todos os navegadores do pool
+        """
+        with self._lock:
+            self._closed = True
+            pooled_list = list(self._all)
+            self._all.clear()
+        for pooled in pooled_list:
+            try:
+                WebService.close_driver(pooled.driver)
+            except Exception as e:
+                logger.warning(f"Erro ao fechar navegador do slot {pooled.slot}: {e}")
+        logger.info("Pool de navegadores encerrado")
@@ -0,0 +1,408 @@
+"""
+Processamento concorrente de vários CNPJs em abas de um único Chrome
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Any, List, Optional
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+
+from app.services.wait_policy import WaitPolicy
+from app.services.step_timer import StepTimer
+from app.services.certidao_extractor import CertidaoExtractor
+from app.services.task_cancellation import CancelledTasks, cancelled_result
+from app.services.web_service import (
+    WebService,
+    MENU1_XPATH,
+    MENU2_XPATH,
+    FIRST_RADIO_XPATH,
+    CNPJ_RADIO_XPATH,
+    CNPJ_INPUT_XPATH,
+    SUBMIT_BUTTON_XPATH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TabStep:
+    """
+    Etapa do fluxo de uma aba: condição de prontidão (verificada sem bloquear)
+    e a ação executada quando ela é satisfeita
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ready: Callable[[Any, "TabSession"], Any],
+        action: Callable[[Any, "TabSession"], None],
+    ):
+        self.name = name
+        self.ready = ready
+        self.action = action
+
+
+class TabSession:
+    """
+    Consulta de um CNPJ em andamento em uma aba do navegador
+    """
+
+    def __init__(self, cnpj: str, fila_id: Optional[int], future: Future):
+        self.cnpj = cnpj
+        self.fila_id = fila_id
+        self.future = future
+        self.handle: Optional[str] = None
+        self.result_handle: Optional[str] = None
+        self.handles_before_submit: List[str] = []
+        self.step_index = 0
+        self.step_started_at = time.monotonic()
+        self.started_at = time.monotonic()
+        self.timer = StepTimer()
+
+    @property
+    def current_handle(self) -> Optional[str]:
+        return self.result_handle or self.handle
+
+
+class MultiTabRunner:
+    """
+    Um Chrome com várias sessões do portal em abas separadas.
+
+    Uma única thread alterna entre as abas (round-robin sobre window_handles):
+    em cada volta verifica, sem bloquear, se a etapa atual de cada aba está
+    pronta e executa a ação das que estiverem. Enquanto uma aba espera o
+    portal responder, as outras avançam.
+    """
+
+    def __init__(
+        self,
+        tabs: int = 4,
+        headless: bool = True,
+        portal_url: Optional[str] = None,
+        step_timeout: float = 60,
+        poll_interval: float = 0.2,
+    ):
+        self.tabs = max(1, tabs)
+        self.headless = headless
+        self.portal_url = portal_url or WebService.portal_url()
+        self.step_timeout = step_timeout
+        self.poll_interval = poll_interval
+        self.driver = None
+        self._home_handle: Optional[str] = None
+        self._pending: "queue.Queue[TabSession]" = queue.Queue()
+        self._sessions: List[TabSession] = []
+        # Só uma aba por vez pode aguardar a aba da certidão, para não confundir
+        # qual sessão abriu qual janela
+        self._awaiting_result: Optional[TabSession] = None
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._steps = self._build_steps()
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """
+        Inicia o navegador e a thread que alterna entre as abas
+        """
+        self._launch_driver()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"Navegador multi-abas pronto com até {self.tabs} abas simultâneas")
+
+    def _launch_driver(self):
+        self.driver = WebService.create_chrome_driver(self.headless)
+        self.driver.set_window_size(1280, 800)
+        # A aba inicial nunca é fechada: fechar a última aba encerra o Chrome
+        self._home_handle = self.driver.current_window_handle
+
+    def submit(self, cnpj: str, fila_id: Optional[int] = None) -> Future:
+        """
+        Agenda a consulta de um CNPJ
+
+        Args:
+            cnpj: CNPJ a consultar (apenas dígitos)
+            fila_id: ID da fila, usado no nome do HTML salvo
+
+        Returns:
+            Future com o dicionário no formato de WebService.navigate_to_gpi_portal
+        """
+        future: Future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("Navegador multi-abas encerrado"))
+            return future
+        self._pending.put(TabSession(cnpj, fila_id, future))
+        return future
+
+    def shutdown(self):
+        """
+        Encerra a thread e fecha o navegador, falhando as consultas pendentes
+        """
+        self._closed = True
+        if self._thread:
+            self._thread.join(timeout=30)
+        while True:
+            try:
+                session = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            self._fail(session, "Navegador multi-abas encerrado")
+        WebService.close_driver(self.driver)
+        self.driver = None
+        logger.info("Navegador multi-abas encerrado")
+
+    # ------------------------------------------------------------------
+    # Escalonador
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while not self._closed:
+            self._admit()
+            if not self._sessions:
+                continue
+            progressed = False
+            for session in list(self._sessions):
+                try:
+                    progressed |= self._advance(session)
+                except WebDriverException as e:
+                    if not self._driver_alive():
+                        logger.error(f"Navegador multi-abas parou de responder: {e}")
+                        self._restart_driver()
+                        break
+                    logger.warning(f"Erro na aba do CNPJ {session.cnpj}: {e}")
+                except Exception as e:
+                    # Erro na extração ou numa etapa: só esta aba falha, e a
+                    # thread continua atendendo as demais consultas
+                    logger.exception(f"Erro inesperado na aba do CNPJ {session.cnpj}")
+                    self._fail(session, f"Erro inesperado: {e}")
+            if not progressed:
+                time.sleep(self.poll_interval)
+        for session in list(self._sessions):
+            self._fail(session, "Navegador multi-abas encerrado")
+
+    def _admit(self):
+        """
+        Abre abas para consultas pendentes enquanto houver vagas. Nenhuma aba
+        é aberta enquanto uma sessão espera a aba da certidão: a aba nova
+        seria tomada pela certidão
+        """
+        while len(self._sessions) < self.tabs and self._awaiting_result is None:
+            try:
+                if self._sessions:
+                    session = self._pending.get_nowait()
+                else:
+                    session = self._pending.get(timeout=0.5)
+            except queue.Empty:
+                return
+            try:
+                self.driver.switch_to.new_window("tab")
+                session.handle = self.driver.current_window_handle
+                # Navegação sem bloquear a thread até o fim do carregamento
+                self.driver.execute_script(
+                    "window.location.href = arguments[0];", self.portal_url
+                )
+                session.timer.record("tab_queue_wait", time.monotonic() - session.started_at)
+                session.step_started_at = time.monotonic()
+                self._sessions.append(session)
+                logger.info(f"CNPJ {session.cnpj} iniciado na aba {session.handle}")
+            except WebDriverException as e:
+                self._fail(session, f"Falha ao abrir aba: {e}")
+                if not self._driver_alive():
+                    self._restart_driver()
+                return
+
+    def _advance(self, session: TabSession) -> bool:
+        """
+        Verifica a etapa atual da sessão e executa sua ação se estiver pronta
+
+        Returns:
+            True se a sessão avançou
+        """
+        if CancelledTasks.get_instance().is_cancelled(session.fila_id):
+            # Tarefa excluída: fecha a aba e libera a vaga para a próxima consulta
+            logger.info(f"CNPJ {session.cnpj} cancelado; aba fechada na etapa {self._steps[session.step_index].name}")
+            self._finish(session)
+            if not session.future.done():
+                session.future.set_result(cancelled_result(session.fila_id, session.timer.as_dict()))
+            return True
+        step = self._steps[session.step_index]
+        self.driver.switch_to.window(session.current_handle)
+        try:
+            ready = step.ready(self.driver, session)
+        except WebDriverException:
+            ready = False
+        if not ready:
+            if time.monotonic() - session.step_started_at > self.step_timeout:
+                self._fail(
+                    session,
+                    f"Timeout de {self.step_timeout}s na etapa {step.name}",
+                )
+            return False
+        try:
+            step.action(self.driver, session)
+        except WebDriverException as e:
+            # A ação é repetida na próxima volta enquanto o prazo da etapa não expirar
+            logger.warning(f"Ação {step.name} falhou para CNPJ {session.cnpj}: {e}")
+            return False
+        elapsed = time.monotonic() - session.step_started_at
+        session.timer.record(step.name, elapsed)
+        logger.info(f"CNPJ {session.cnpj}: etapa {step.name} concluída em {elapsed:.2f}s")
+        session.step_index += 1
+        session.step_started_at = time.monotonic()
+        return True
+
+    # ------------------------------------------------------------------
+    # Fluxo do portal
+    # ------------------------------------------------------------------
+
+    def _build_steps(self) -> List[TabStep]:
+        idle = WaitPolicy.page_idle()
+
+        def present(xpath):
+            condition = WaitPolicy.element_present(By.XPATH, xpath)
+            return lambda driver, session: idle(driver) and condition(driver)
+
+        def js_click(xpath):
+            def _action(driver, session):
+                driver.execute_script(
+                    "arguments[0].click();", driver.find_element(By.XPATH, xpath)
+                )
+
+            return _action
+
+        def fill_cnpj(driver, session):
+            cnpj_input = driver.find_element(By.XPATH, CNPJ_INPUT_XPATH)
+            driver.execute_script("arguments[0].focus();", cnpj_input)
+            cnpj_input.clear()
+            cnpj_input.send_keys(session.cnpj)
+            driver.execute_script(
+                """
+                var input = arguments[0];
+                input.dispatchEvent(new Event('input', { bubbles: true }));
+                input.dispatchEvent(new Event('change', { bubbles: true }));
+                input.dispatchEvent(new Event('blur', { bubbles: true }));
+                """,
+                cnpj_input,
+            )
+
+        def submit_ready(driver, session):
+            return self._awaiting_result is None and present(SUBMIT_BUTTON_XPATH)(
+                driver, session
+            )
+
+        def submit(driver, session):
+            session.handles_before_submit = driver.window_handles
+            js_click(SUBMIT_BUTTON_XPATH)(driver, session)
+            self._awaiting_result = session
+
+        def result_tab_ready(driver, session):
+            # Abas de outras sessões nunca são a certidão desta
+            owned = [h for other in self._sessions for h in (other.handle, other.result_handle) if h]
+            return WaitPolicy.new_window(session.handles_before_submit + owned)(driver)
+
+        def switch_to_result(driver, session):
+            session.result_handle = result_tab_ready(driver, session)
+            self._awaiting_result = None
+
+        text_ready = WaitPolicy.text_populated("div.texto")
+
+        return [
+            TabStep("menu1", present(MENU1_XPATH), js_click(MENU1_XPATH)),
+            TabStep("menu2", present(MENU2_XPATH), js_click(MENU2_XPATH)),
+            TabStep("first_radio", present(FIRST_RADIO_XPATH), js_click(FIRST_RADIO_XPATH)),
+            TabStep("cnpj_radio", present(CNPJ_RADIO_XPATH), js_click(CNPJ_RADIO_XPATH)),
+            TabStep("cnpj_input", present(CNPJ_INPUT_XPATH), fill_cnpj),
+            TabStep("submit", submit_ready, submit),
+            TabStep("result_tab", result_tab_ready, switch_to_result),
+            TabStep("extract", lambda driver, session: text_ready(driver), self._extract),
+        ]
+
+    def _extract(self, driver, session: TabSession):
+        result = WebService.resultado_from_driver(driver, timer=session.timer)
+        result["engine"] = "multi_tab"
+        CertidaoExtractor.save_html(
+            result["full_result"],
+            CertidaoExtractor.html_path(session.fila_id or session.cnpj),
+        )
+        logger.info(
+            f"CNPJ {session.cnpj} concluído em {time.monotonic() - session.started_at:.2f}s: "
+            f"{result['status_divida']}"
+        )
+        self._finish(session)
+        session.future.set_result(result)
+
+    # ------------------------------------------------------------------
+    # Encerramento de sessões
+    # ------------------------------------------------------------------
+
+    def _close_tabs(self, session: TabSession):
+        for handle in (session.result_handle, session.handle):
+            if not handle:
+                continue
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except WebDriverException:
+                pass
+        try:
+            self.driver.switch_to.window(self._home_handle)
+            # selenium-wire guarda todas as requisições capturadas em memória
+            del self.driver.requests
+        except Exception:
+            pass
+
+    def _finish(self, session: TabSession):
+        if session in self._sessions:
+            self._sessions.remove(session)
+        if self._awaiting_result is session:
+            self._awaiting_result = None
+        if self.driver is not None:
+            self._close_tabs(session)
+
+    def _fail(self, session: TabSession, message: str):
+        logger.warning(f"CNPJ {session.cnpj} falhou no modo multi-abas: {message}")
+        self._finish(session)
+        if not session.future.done():
+            session.future.set_result(
+                {
+                    "status": "error",
+                    "engine": "multi_tab",
+                    "message": f"Error in web navigation: {message}",
+                    "url": self.portal_url,
+                    "screenshots": [],
+                    "error": message,
+                    "timings": session.timer.as_dict(),
+                }
+            )
+
+    def _driver_alive(self) -> bool:
+        try:
+            self.driver.execute_script("return 1;")
+            return True
+        except Exception:
+            return False
+
+    def _restart_driver(self):
+        """
+        Falha as sessões em andamento e abre um navegador novo
+        """
+        sessions, self._sessions = self._sessions, []
+        self._awaiting_result = None
+        for session in sessions:
+            if not session.future.done():
+                self._fail(session, "Navegador multi-abas reiniciado")
+        try:
+            WebService.close_driver(self.driver)
+        except Exception:
+            pass
+        while not self._closed:
+            try:
+                self._launch_driver()
+                return
+            except Exception as e:
+                logger.error(f"Falha ao reiniciar navegador multi-abas: {e}")
+                time.sleep(10)
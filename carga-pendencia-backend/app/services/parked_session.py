@@ -0,0 +1,243 @@
+"""
+Sessões do portal GPI estacionadas no formulário de CNPJ entre tarefas
+"""
+import logging
+import os
+from typing import Dict, Any, Optional
+
+from selenium.webdriver.common.by import By
+
+from app.services.wait_policy import WaitPolicy
+from app.services.step_timer import StepTimer
+from app.services.request_blocking import RequestBlockingPolicy
+from app.services.certidao_extractor import CertidaoExtractor
+from app.services.web_service import (
+    WebService,
+    MENU1_XPATH,
+    MENU2_XPATH,
+    FIRST_RADIO_XPATH,
+    CNPJ_RADIO_XPATH,
+    CNPJ_INPUT_XPATH,
+    SUBMIT_BUTTON_XPATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# Textos que o portal exibe quando a sessão do servidor expirou
+EXPIRED_MARKERS = (
+    "sessão expirada",
+    "sessao expirada",
+    "sessão encerrada",
+    "sessão inválida",
+    "sessão finalizada",
+    "tempo de sessão",
+)
+
+# Sessões ociosas por mais tempo que isto são refeitas antes de usar
+PARK_MAX_IDLE = float(os.getenv("GPI_PARK_MAX_IDLE", "600"))
+
+
+class SessionExpired(Exception):
+    """O formulário estacionado não responde mais; a sessão precisa ser refeita"""
+
+
+class ParkedSession:
+    """
+    Mantém o navegador no estado "pronto para digitar o CNPJ".
+
+    O prefixo do fluxo (abrir o acessoBase, menu, painel, radio da certidão e
+    radio de CNPJ) é feito uma vez por sessão em park_at_form(); cada tarefa
+    depois só limpa o campo, digita, envia, lê a aba da certidão e a fecha,
+    voltando ao formulário (submit_parked()).
+    """
+
+    @staticmethod
+    def park_at_form(driver, policy: WaitPolicy = None, timer: StepTimer = None) -> bool:
+        """
+        Abre o portal e avança até o campo de CNPJ
+
+        Returns:
+            True se o navegador ficou estacionado no formulário
+        """
+        policy = policy or WaitPolicy()
+        timer = timer or StepTimer()
+        ParkedSession._close_extra_tabs(driver)
+        with timer.phase("park_bootstrap"):
+            driver.get(WebService.portal_url())
+            policy.until(driver, WaitPolicy.page_idle(), description="portal carregado")
+            steps = (
+                ("menu1", MENU1_XPATH, WaitPolicy.element_present(By.XPATH, MENU2_XPATH)),
+                ("menu2", MENU2_XPATH, WaitPolicy.element_present(By.XPATH, FIRST_RADIO_XPATH)),
+                ("first_radio", FIRST_RADIO_XPATH, WaitPolicy.element_present(By.XPATH, CNPJ_RADIO_XPATH)),
+                ("cnpj_radio", CNPJ_RADIO_XPATH, WaitPolicy.element_present(By.XPATH, CNPJ_INPUT_XPATH)),
+            )
+            for step, xpath, ready in steps:
+                policy.until(
+                    driver, WaitPolicy.element_present(By.XPATH, xpath), description=step
+                )
+                strategy = WebService.click_with_strategies(
+                    driver,
+                    step,
+                    [
+                        ("xpath", WebService.clickable_strategy(By.XPATH, xpath, 8)),
+                        ("js_xpath", WebService.js_click_strategy(By.XPATH, xpath)),
+                    ],
+                    policy,
+                    ready=ready,
+                    timeout=policy.default_timeout,
+                    description=f"etapa seguinte a {step}",
+                )
+                timer.strategy(step, strategy)
+                if strategy is None:
+                    logger.warning(f"Não foi possível estacionar a sessão: etapa {step} falhou")
+                    return False
+        parked = ParkedSession.is_parked(driver)
+        if parked:
+            logger.info("Sessão estacionada no formulário de CNPJ")
+        return parked
+
+    @staticmethod
+    def is_parked(driver) -> bool:
+        """
+        O navegador está no formulário com o campo de CNPJ visível e sem aviso
+        de sessão expirada
+        """
+        try:
+            if len(driver.window_handles) != 1:
+                return False
+            inputs = driver.find_elements(By.XPATH, CNPJ_INPUT_XPATH)
+            if not inputs or not inputs[0].is_displayed():
+                return False
+            return not ParkedSession.session_expired(driver)
+        except Exception:
+            return False
+
+    @staticmethod
+    def session_expired(driver) -> bool:
+        """
+        A página atual exibe algum aviso de sessão expirada
+        """
+        try:
+            text = (driver.execute_script("return document.body ? document.body.innerText : '';") or "").lower()
+        except Exception:
+            return True
+        return any(marker in text for marker in EXPIRED_MARKERS)
+
+    @staticmethod
+    def _close_extra_tabs(driver):
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+
+    @staticmethod
+    def submit_parked(
+        driver,
+        cnpj: str,
+        fila_id: Optional[int] = None,
+        policy: WaitPolicy = None,
+        timer: StepTimer = None,
+        result_timeout: float = 60,
+    ) -> Dict[str, Any]:
+        """
+        Consulta um CNPJ a partir do formulário estacionado e volta a ele
+
+        Args:
+            driver: Navegador estacionado por park_at_form()
+            cnpj: CNPJ a consultar (apenas dígitos)
+            fila_id: ID da fila, usado no nome do HTML salvo
+            policy: Política de espera
+            timer: StepTimer da tarefa
+            result_timeout: Prazo para a aba da certidão abrir e ser preenchida
+
+        Returns:
+            Dicionário no formato de WebService.navigate_to_gpi_portal
+
+        Raises:
+            SessionExpired: O formulário não está disponível ou o portal não
+                respondeu ao envio; o chamador deve refazer a sessão
+        """
+        policy = policy or WaitPolicy()
+        timer = timer or StepTimer()
+        if not ParkedSession.is_parked(driver):
+            raise SessionExpired("Formulário de CNPJ indisponível")
+        form_handle = driver.current_window_handle
+        blocking = RequestBlockingPolicy.for_driver(driver)
+        blocking_before = blocking.snapshot() if blocking else None
+
+        with timer.phase("cnpj_typing"):
+            cnpj_input = driver.find_element(By.XPATH, CNPJ_INPUT_XPATH)
+            driver.execute_script(
+                "arguments[0].focus(); arguments[0].value = '';", cnpj_input
+            )
+            cnpj_input.clear()
+            cnpj_input.send_keys(cnpj)
+            driver.execute_script(
+                """
+                var input = arguments[0];
+                input.dispatchEvent(new Event('input', { bubbles: true }));
+                input.dispatchEvent(new Event('change', { bubbles: true }));
+                input.dispatchEvent(new Event('blur', { bubbles: true }));
+                """,
+                cnpj_input,
+            )
+
+        handles_before_submit = driver.window_handles
+        with timer.phase("submit"):
+            strategy = WebService.click_with_strategies(
+                driver,
+                "submit",
+                [
+                    ("xpath", WebService.js_click_strategy(By.XPATH, SUBMIT_BUTTON_XPATH)),
+                    ("clickable", WebService.clickable_strategy(By.XPATH, SUBMIT_BUTTON_XPATH, 8)),
+                ],
+                policy,
+                ready=WaitPolicy.new_window(handles_before_submit),
+                timeout=result_timeout,
+                description="nova aba da certidão",
+            )
+            timer.strategy("submit", strategy)
+
+        with timer.phase("new_tab_detection"):
+            result_handle = WaitPolicy.new_window(handles_before_submit)(driver)
+            if not result_handle:
+                if ParkedSession.session_expired(driver):
+                    raise SessionExpired("Portal informou sessão expirada")
+                raise SessionExpired("A aba da certidão não abriu após o envio")
+            driver.switch_to.window(result_handle)
+            text_ready = policy.until(
+                driver,
+                WaitPolicy.text_populated("div.texto"),
+                timeout=result_timeout,
+                description="div.texto da certidão",
+            )
+
+        try:
+            if not text_ready:
+                return {
+                    "status": "error",
+                    "engine": "parked",
+                    "message": "Error in web navigation: div.texto não preenchida na aba da certidão",
+                    "url": WebService.portal_url(),
+                    "screenshots": [],
+                    "error": "div.texto não preenchida",
+                    "timings": timer.as_dict(),
+                }
+            result = WebService.resultado_from_driver(driver, timer=timer)
+            result["engine"] = "parked"
+            CertidaoExtractor.save_html(
+                result["full_result"], CertidaoExtractor.html_path(fila_id or cnpj)
+            )
+            logger.info(f"CNPJ {cnpj} consultado pela sessão estacionada: {result['status_divida']}")
+        finally:
+            # Fecha a aba da certidão e volta ao formulário para a próxima tarefa
+            try:
+                driver.close()
+            finally:
+                driver.switch_to.window(form_handle)
+        if blocking:
+            result["request_blocking"] = RequestBlockingPolicy.diff(
+                blocking.snapshot(), blocking_before
+            )
+        return result
@@ -0,0 +1,582 @@
+"""
+Fluxo do portal GPI como máquina de estados retomável
+"""
+import logging
+import os
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, List
+
+from selenium.webdriver.common.by import By
+
+from app.services.wait_policy import WaitPolicy
+from app.services.step_timer import StepTimer
+from app.services.certidao_extractor import CertidaoExtractor
+from app.services.worker_metrics import WorkerMetrics
+from app.services.task_cancellation import CancelledTasks
+from app.services.web_service import (
+    WebService,
+    MENU1_XPATH,
+    MENU2_XPATH,
+    FIRST_RADIO_XPATH,
+    CNPJ_RADIO_XPATH,
+    CNPJ_INPUT_XPATH,
+    SUBMIT_BUTTON_XPATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# Estados do fluxo, na ordem em que são alcançados
+LANDING = "landing"
+MENU1 = "menu1"
+MENU2 = "menu2"
+FORM = "form"
+SUBMITTED = "submitted"
+RESULT_TAB = "result_tab"
+EXTRACTED = "extracted"
+
+STATES = (LANDING, MENU1, MENU2, FORM, SUBMITTED, RESULT_TAB, EXTRACTED)
+
+# Tentativas de cada etapa por tarefa (GPI_FLOW_RETRIES sobrescreve, ex.: "form=4,submitted=3")
+DEFAULT_BUDGETS = {
+    LANDING: 2,
+    MENU1: 2,
+    MENU2: 2,
+    FORM: 3,
+    SUBMITTED: 3,
+    RESULT_TAB: 2,
+    EXTRACTED: 2,
+}
+
+# Fase do StepTimer de cada etapa (mesmos nomes usados antes da máquina de
+# estados); "submitted" mede cnpj_typing e submit separadamente
+PHASES = {
+    LANDING: "initial_load",
+    MENU1: "menu1_click",
+    MENU2: "menu2_click",
+    FORM: "radio_selection",
+    RESULT_TAB: "new_tab_detection",
+    EXTRACTED: "html_serialization",
+}
+
+SPINNER_XPATH = '//div[contains(@class, "loading") or contains(@class, "spinner") or contains(@class, "wait") or contains(@class, "carregando")]'
+
+# Desativa as formas conhecidas de abrir o diálogo de impressão
+PRINT_BLOCK_SCRIPT = """
+window.originalPrint = window.originalPrint || window.print;
+window.print = function() {
+    console.log('[Interceptado] Tentativa de abrir diálogo de impressão via window.print() bloqueada');
+    return false;
+};
+window.originalOpen = window.originalOpen || window.open;
+window.open = function(url, name, specs) {
+    if (specs && specs.includes('print')) {
+        console.log('[Interceptado] Tentativa de abrir janela de impressão via window.open() bloqueada');
+        return null;
+    }
+    return window.originalOpen(url, name, specs);
+};
+document.addEventListener('keydown', function(e) {
+    if ((e.ctrlKey || e.metaKey) && e.key === 'p') {
+        e.preventDefault();
+        return false;
+    }
+}, true);
+"""
+
+
+class StepFailed(Exception):
+    """A etapa não alcançou o estado esperado"""
+
+
+class FlowAborted(Exception):
+    """Uma etapa esgotou suas tentativas; a tarefa falha"""
+
+    def __init__(self, message: str, summary: Dict[str, Any]):
+        super().__init__(message)
+        self.summary = summary
+
+
+def budgets_from_env(defaults: Dict[str, int] = None) -> Dict[str, int]:
+    """
+    Tentativas por etapa: padrão sobrescrito por GPI_FLOW_RETRIES ("etapa=n,...")
+    """
+    budgets = dict(defaults or DEFAULT_BUDGETS)
+    for item in os.getenv("GPI_FLOW_RETRIES", "").split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name in budgets and value.strip().isdigit():
+            budgets[name] = max(1, int(value))
+    return budgets
+
+
+class PortalFlow:
+    """
+    Consulta de um CNPJ no portal como estados explícitos:
+
+        landing -> menu1 -> menu2 -> form -> submitted -> result_tab -> extracted
+
+    Cada estado tem uma condição verificável na página. Quando uma etapa
+    falha, o fluxo procura o último estado que ainda vale no navegador e
+    continua dali, na mesma sessão, em vez de falhar a tarefa e recomeçar do
+    driver.get(). Cada etapa tem seu orçamento de tentativas.
+
+    Exemplo:
+        flow = PortalFlow(driver, cnpj, policy, timer, wait_times)
+        extraido = flow.run()          # CertidaoExtractor.extract
+        resultado["flow"] = flow.summary()
+    """
+
+    def __init__(
+        self,
+        driver,
+        cnpj: str,
+        policy: WaitPolicy = None,
+        timer: StepTimer = None,
+        wait_times: Dict[str, float] = None,
+        budgets: Dict[str, int] = None,
+        fila_id: Optional[int] = None,
+    ):
+        self.driver = driver
+        self.cnpj = cnpj
+        # Tarefa da fila, verificada contra os cancelamentos antes de cada etapa
+        self.fila_id = fila_id
+        self.policy = policy or WaitPolicy()
+        self.timer = timer or StepTimer()
+        self.wait_times = {
+            "page_load": 40,
+            "after_click": 20,
+            "form_fill": 10,
+            "element_wait": 30,
+            **(wait_times or {}),
+        }
+        self.budgets = budgets or budgets_from_env()
+        # Último estado alcançado (None: nada feito ainda)
+        self.state: Optional[str] = None
+        self.attempts: Dict[str, int] = {state: 0 for state in STATES}
+        self.errors: List[str] = []
+        self.extraction: Optional[Dict[str, str]] = None
+        self._main_handle: Optional[str] = None
+        self._handles_before_submit: Optional[List[str]] = None
+        self._result_handle: Optional[str] = None
+        self.metrics = WorkerMetrics.get_instance()
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def next_state(state: Optional[str]) -> str:
+        return STATES[0] if state is None else STATES[STATES.index(state) + 1]
+
+    def run(self, until: str = EXTRACTED) -> Optional[Dict[str, str]]:
+        """
+        Avança até o estado `until`, retomando do último estado válido após falhas
+
+        Returns:
+            Extração da certidão (CertidaoExtractor.extract) quando `until` é
+            "extracted", senão None
+
+        Raises:
+            FlowAborted: Uma etapa esgotou suas tentativas ou o navegador morreu
+            TaskCancelled: A tarefa foi excluída; a sessão para antes da próxima etapa
+        """
+        cancellations = CancelledTasks.get_instance()
+        while self.state != until:
+            cancellations.check(self.fila_id)
+            target = self.next_state(self.state)
+            if self.attempts[target] >= self.budgets[target]:
+                self.metrics.inc("flow_aborted_total")
+                raise FlowAborted(
+                    f"Etapa {target} esgotou {self.budgets[target]} tentativa(s): "
+                    f"{self.errors[-1] if self.errors else 'sem detalhes'}",
+                    self.summary(),
+                )
+            self.attempts[target] += 1
+            if self.attempts[target] > 1:
+                logger.info(
+                    f"Retomando o fluxo do CNPJ {self.cnpj} em {target} "
+                    f"(tentativa {self.attempts[target]}/{self.budgets[target]})"
+                )
+                self.metrics.inc("flow_step_retries_total")
+                self.metrics.inc(f"flow_retries_{target}_total")
+            try:
+                phase = PHASES.get(target)
+                with self.timer.phase(phase) if phase else nullcontext():
+                    getattr(self, f"_step_{target}")()
+                if not self._holds(target):
+                    raise StepFailed(f"estado {target} não confirmado na página")
+                self.state = target
+                logger.info(f"✅ Estado {target} alcançado para CNPJ {self.cnpj}")
+            except Exception as e:
+                self.errors.append(f"{target}: {e}")
+                logger.warning(f"Etapa {target} falhou para CNPJ {self.cnpj}: {e}")
+                self._recover(target)
+        return self.extraction if until == EXTRACTED else None
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Estado final e tentativas por etapa, gravados junto com o resultado
+        """
+        return {
+            "state": self.state,
+            "attempts": {state: n for state, n in self.attempts.items() if n},
+            "retries": sum(max(0, n - 1) for n in self.attempts.values()),
+            "errors": self.errors[-5:],
+        }
+
+    # ------------------------------------------------------------------
+    # Recuperação
+    # ------------------------------------------------------------------
+
+    def _recover(self, failed: str):
+        """
+        Volta ao estado válido mais avançado até a etapa que falhou
+        """
+        try:
+            handles = self.driver.window_handles
+        except Exception as e:
+            self.metrics.inc("flow_aborted_total")
+            raise FlowAborted(f"Navegador não responde: {e}", self.summary())
+        if not handles:
+            raise FlowAborted("Navegador sem abas abertas", self.summary())
+
+        resumed = None
+        for state in reversed(STATES[: STATES.index(failed) + 1]):
+            if self._holds(state):
+                resumed = state
+                break
+
+        if resumed is None or STATES.index(resumed) < STATES.index(SUBMITTED):
+            # Abas da certidão de um envio anterior não valem mais
+            self._close_extra_tabs()
+        self.state = resumed
+        logger.info(
+            f"Fluxo do CNPJ {self.cnpj} retomado a partir de {resumed or 'início'}"
+        )
+
+    def _close_extra_tabs(self):
+        main = self._main_handle
+        try:
+            for handle in self.driver.window_handles:
+                if main is not None and handle != main:
+                    self.driver.switch_to.window(handle)
+                    self.driver.close()
+            if main is not None:
+                self.driver.switch_to.window(main)
+        except Exception as e:
+            logger.warning(f"Erro ao fechar abas extras: {e}")
+        self._result_handle = None
+
+    def _on_main(self):
+        if self._main_handle and self.driver.current_window_handle != self._main_handle:
+            self.driver.switch_to.window(self._main_handle)
+
+    def _holds(self, state: str) -> bool:
+        """
+        A condição do estado vale agora no navegador (sem esperar)
+        """
+        driver = self.driver
+        try:
+            if state == EXTRACTED:
+                return bool(self.extraction and self.extraction.get("html"))
+            if state == RESULT_TAB:
+                if not self._result_handle or self._result_handle not in driver.window_handles:
+                    return False
+                driver.switch_to.window(self._result_handle)
+                return bool(WaitPolicy.text_populated("div.texto")(driver))
+            if state == SUBMITTED:
+                return self._handles_before_submit is not None and bool(
+                    WaitPolicy.new_window(self._handles_before_submit)(driver)
+                )
+            self._on_main()
+            if state == FORM:
+                inputs = driver.find_elements(By.XPATH, CNPJ_INPUT_XPATH)
+                return bool(inputs) and inputs[0].is_displayed()
+            if state == MENU2:
+                return bool(driver.find_elements(By.XPATH, "//input[@type='radio']"))
+            if state == MENU1:
+                return bool(driver.find_elements(By.XPATH, MENU2_XPATH))
+            if state == LANDING:
+                return bool(driver.find_elements(By.XPATH, MENU1_XPATH))
+        except Exception as e:
+            logger.debug(f"Verificação do estado {state} falhou: {e}")
+        return False
+
+    # ------------------------------------------------------------------
+    # Etapas
+    # ------------------------------------------------------------------
+
+    def _click(self, step: str, strategies, ready, timeout: float, description: str):
+        strategy = WebService.click_with_strategies(
+            self.driver,
+            step,
+            strategies,
+            self.policy,
+            ready=ready,
+            timeout=timeout,
+            description=description,
+        )
+        self.timer.strategy(step, strategy)
+        if strategy is None:
+            raise StepFailed(f"nenhuma estratégia de clique funcionou em {step}")
+        logger.info(f"Etapa {step}: clicou com a estratégia {strategy}")
+        return strategy
+
+    def _step_landing(self):
+        driver = self.driver
+        portal_url = WebService.portal_url()
+        if not portal_url or not portal_url.startswith("http"):
+            raise ValueError(f"URL inválida: {portal_url!r}")
+        logger.info(f"Navegando para URL: {portal_url!r}")
+        self._close_extra_tabs()
+        driver.get(portal_url)
+        self._main_handle = driver.current_window_handle
+        try:
+            driver.execute_script(PRINT_BLOCK_SCRIPT)
+        except Exception as e:
+            logger.warning(f"Erro ao instalar script de proteção contra impressão: {e}")
+        self.policy.settle(
+            driver,
+            self.wait_times["page_load"],
+            WaitPolicy.element_present(By.XPATH, MENU1_XPATH),
+            description="primeiro elemento do menu",
+        )
+        try:
+            WebService.wait_for_spinner_and_dom_stable(
+                driver,
+                SPINNER_XPATH,
+                stable_time=self.policy.dom_stable_time(self.wait_times["after_click"]),
+                timeout=self.wait_times["page_load"],
+            )
+        except Exception as e:
+            logger.warning(f"Wait error (continuing anyway): {e}")
+
+    def _step_menu1(self):
+        driver = self.driver
+        policy = self.policy
+
+        def _first_visible_interactive(drv):
+            interactive_elements = drv.find_elements(
+                By.CSS_SELECTOR,
+                "a, button, input[type='button'], input[type='submit'], .clickable, [role='button']",
+            )
+            for elem in interactive_elements[:5]:
+                try:
+                    if elem.is_displayed():
+                        drv.execute_script("arguments[0].click();", elem)
+                        return True
+                except Exception:
+                    continue
+            return False
+
+        self._click(
+            "menu1",
+            [
+                ("xpath", WebService.clickable_strategy(By.XPATH, MENU1_XPATH, 8)),
+                ("css", WebService.js_click_strategy(By.CSS_SELECTOR, "#gwt-uid-1 > li > a")),
+                ("js_query_selector", WebService.query_selector_strategy("#gwt-uid-1 > li > a")),
+                (
+                    "full_xpath",
+                    WebService.js_click_strategy(
+                        By.XPATH,
+                        "/html/body/div[4]/div[2]/div/div/div/div[2]/div/div/div/div/div/div/div/div/div/ul/li/a",
+                    ),
+                ),
+                ("first_link", WebService.index_strategy(By.TAG_NAME, "a", 0)),
+                ("first_button", WebService.index_strategy(By.TAG_NAME, "button", 0)),
+                ("first_visible_interactive", _first_visible_interactive),
+            ],
+            ready=WaitPolicy.element_present(By.XPATH, MENU2_XPATH),
+            timeout=self.wait_times["after_click"],
+            description="painel do segundo elemento",
+        )
+        policy.until(
+            driver, WaitPolicy.overlay_gone(), timeout=20, description="overlay após o menu"
+        )
+
+    def _step_menu2(self):
+        driver = self.driver
+        policy = self.policy
+        second_element_css = "#homePanel > div > div:nth-child(2) > div:nth-child(1) > div > div:nth-child(5)"
+
+        def _panel_element(drv):
+            # Elementos com cara de item de menu no painel principal (5º, se houver)
+            panel_elements = drv.find_elements(
+                By.XPATH,
+                "//div[contains(@id, 'Panel')]//div[contains(@class, 'clickable') or contains(@class, 'menu') or contains(@class, 'item')]",
+            )
+            if not panel_elements:
+                return False
+            target = panel_elements[min(4, len(panel_elements) - 1)]
+            drv.execute_script("arguments[0].scrollIntoView({block: 'center'});", target)
+            policy.sleep(5)
+            drv.execute_script("arguments[0].click();", target)
+            return True
+
+        radios = WaitPolicy.any_element_present(By.XPATH, "//input[@type='radio']")
+        self._click(
+            "menu2",
+            [
+                ("xpath", WebService.clickable_strategy(By.XPATH, MENU2_XPATH, 8)),
+                ("css", WebService.js_click_strategy(By.CSS_SELECTOR, second_element_css)),
+                ("js_query_selector", WebService.query_selector_strategy(second_element_css)),
+                (
+                    "full_xpath",
+                    WebService.js_click_strategy(
+                        By.XPATH,
+                        "/html/body/div[4]/div[2]/div/div/div/div[2]/div/div/div/div/div/div/div/div/div/div[1]/div[1]/div/div/div/div[2]/div[1]/div/div[5]",
+                    ),
+                ),
+                ("panel_element", _panel_element),
+            ],
+            ready=radios,
+            timeout=5,
+            description="radios do formulário",
+        )
+        policy.settle(driver, 10, radios, description="radios do formulário")
+
+    def _step_form(self):
+        driver = self.driver
+        policy = self.policy
+        radio_css = "#e9c5eec1-27d9-4cc0-81c0-befa3acb0f18 > label > input[type=radio]"
+        self._click(
+            "first_radio",
+            [
+                (
+                    "xpath",
+                    WebService.js_click_strategy(
+                        By.XPATH, FIRST_RADIO_XPATH, wait=5, policy=policy
+                    ),
+                ),
+                ("css", WebService.js_click_strategy(By.CSS_SELECTOR, radio_css, policy=policy)),
+                ("js_query_selector", WebService.query_selector_strategy(radio_css)),
+                (
+                    "index",
+                    WebService.index_strategy(
+                        By.XPATH, "//input[@type='radio']", 0, policy=policy
+                    ),
+                ),
+            ],
+            ready=WaitPolicy.element_present(By.XPATH, CNPJ_RADIO_XPATH),
+            timeout=5,
+            description="radio de CNPJ",
+        )
+        WebService.wait_for_loading_overlay(driver)
+
+        def _cnpj_radio_by_label(drv):
+            for label in drv.find_elements(By.XPATH, "//label[contains(text(), 'CNPJ')]"):
+                inputs = label.find_elements(By.XPATH, ".//input[@type='radio']")
+                if inputs:
+                    drv.execute_script("arguments[0].click();", inputs[0])
+                    return True
+            return False
+
+        self._click(
+            "cnpj_radio",
+            [
+                (
+                    "xpath",
+                    lambda drv: WebService.click_element_resiliente(
+                        drv, By.XPATH, CNPJ_RADIO_XPATH, tentativas=3, total_timeout=20
+                    ),
+                ),
+                ("index", WebService.index_strategy(By.XPATH, "//input[@type='radio']", 1)),
+                ("label", _cnpj_radio_by_label),
+            ],
+            ready=WaitPolicy.element_present(By.XPATH, CNPJ_INPUT_XPATH),
+            timeout=5,
+            description="campo de CNPJ",
+        )
+
+    def _step_submitted(self):
+        driver = self.driver
+        policy = self.policy
+        # Abas abertas antes do envio, para detectar a aba da certidão
+        self._handles_before_submit = driver.window_handles
+
+        with self.timer.phase("cnpj_typing"):
+            cnpj_input = policy.until(
+                driver,
+                WaitPolicy.element_present(By.XPATH, CNPJ_INPUT_XPATH),
+                timeout=self.wait_times["element_wait"],
+                description="campo de CNPJ",
+            )
+            if not cnpj_input:
+                raise StepFailed("campo de CNPJ não encontrado")
+            driver.execute_script("arguments[0].focus(); arguments[0].value = '';", cnpj_input)
+            cnpj_input.clear()
+            for char in self.cnpj:
+                cnpj_input.send_keys(char)
+                policy.sleep(self.wait_times["form_fill"] / 100)
+            # Disparar apenas eventos no input, sem clicar fora
+            driver.execute_script(
+                """
+                var input = arguments[0];
+                input.dispatchEvent(new Event('input', { bubbles: true }));
+                input.dispatchEvent(new Event('change', { bubbles: true }));
+                input.dispatchEvent(new Event('blur', { bubbles: true }));
+                """,
+                cnpj_input,
+            )
+
+        button_css = "#WorkPanel__4 > tbody > tr:nth-child(2) > td > div > div > div > div > table > tbody > tr > td:nth-child(1) > button"
+        new_tab = WaitPolicy.new_window(self._handles_before_submit)
+        with self.timer.phase("submit"):
+            self._submit(new_tab, button_css)
+        try:
+            driver.execute_script(PRINT_BLOCK_SCRIPT)
+        except Exception as e:
+            logger.warning(f"Falha ao desabilitar window.print() após botão: {e}")
+        policy.settle(
+            driver,
+            5,
+            new_tab,
+            timeout=self.wait_times["element_wait"],
+            description="nova aba da certidão",
+        )
+
+    def _submit(self, new_tab, button_css: str):
+        policy = self.policy
+        self._click(
+            "submit",
+            [
+                ("xpath", WebService.js_click_strategy(By.XPATH, SUBMIT_BUTTON_XPATH, policy=policy)),
+                ("css", WebService.js_click_strategy(By.CSS_SELECTOR, button_css, policy=policy)),
+                ("js_query_selector", WebService.query_selector_strategy(button_css)),
+                (
+                    "resiliente",
+                    lambda drv: WebService.click_element_resiliente(
+                        drv, By.XPATH, SUBMIT_BUTTON_XPATH, tentativas=3, total_timeout=20
+                    ),
+                ),
+            ],
+            ready=new_tab,
+            timeout=5,
+            description="nova aba da certidão",
+        )
+
+    def _step_result_tab(self):
+        driver = self.driver
+        handle = self._result_handle or WaitPolicy.new_window(self._handles_before_submit)(driver)
+        if not handle:
+            raise StepFailed("a aba da certidão não está aberta")
+        self._result_handle = handle
+        driver.switch_to.window(handle)
+        if self.attempts[RESULT_TAB] > 1:
+            # A aba abriu mas não foi preenchida: recarrega a certidão
+            driver.refresh()
+        self.policy.settle(
+            driver,
+            5,
+            WaitPolicy.text_populated("div.texto"),
+            timeout=self.wait_times["page_load"],
+            description="div.texto da certidão",
+        )
+
+    def _step_extracted(self):
+        # Um único script na página devolve o texto da div.texto, o texto
+        # completo e o HTML; nada é reparseado em Python
+        extraido = CertidaoExtractor.extract(self.driver)
+        if not extraido.get("html") or not (extraido.get("texto") or extraido.get("texto_completo")):
+            raise StepFailed("certidão sem texto")
+        self.extraction = extraido
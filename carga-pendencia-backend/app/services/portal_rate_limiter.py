@@ -0,0 +1,260 @@
+"""
+Limite global de consultas por minuto ao portal GPI, compartilhado entre workers
+"""
+import abc
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from app.services.worker_metrics import WorkerMetrics
+
+logger = logging.getLogger(__name__)
+
+# Orçamento global de sessões por minuto (0 ou vazio desativa)
+RPM_ENV = "GPI_PORTAL_RPM"
+# "file" (workers de uma máquina) ou "rabbitmq" (workers em várias máquinas)
+BACKEND_ENV = "GPI_RATE_BACKEND"
+# Rajada máxima acumulada quando os workers ficam ociosos
+BURST_ENV = "GPI_RATE_BURST"
+STATE_FILE_ENV = "GPI_RATE_STATE_FILE"
+
+TOKEN_QUEUE = "gpi_portal_tokens"
+LEADER_QUEUE = "gpi_portal_rate_leader"
+
+
+class PortalRateLimiter(abc.ABC):
+    """
+    Token bucket consultado por todos os workers antes de abrir uma sessão no
+    portal: `rpm` fichas por minuto, acumulando no máximo `burst`.
+
+    Exemplo:
+        limiter = PortalRateLimiter.from_env(RABBITMQ_HOST)
+        if limiter:
+            limiter.acquire()
+    """
+
+    def __init__(self, rpm: float, burst: Optional[int] = None):
+        self.rpm = float(rpm)
+        self.rate = self.rpm / 60.0
+        self.burst = max(1, int(burst if burst is not None else max(1, self.rpm // 6)))
+        self.metrics = WorkerMetrics.get_instance()
+        self.metrics.set("rate_limit_rpm", self.rpm)
+        self.metrics.set("rate_limit_burst", self.burst)
+
+    @staticmethod
+    def from_env(rabbitmq_host: Optional[str] = None) -> Optional["PortalRateLimiter"]:
+        """
+        Limitador configurado por GPI_PORTAL_RPM, GPI_RATE_BACKEND e GPI_RATE_BURST
+
+        Returns:
+            O limitador, ou None se GPI_PORTAL_RPM não estiver definido
+        """
+        rpm = float(os.getenv(RPM_ENV) or 0)
+        if rpm <= 0:
+            return None
+        burst = os.getenv(BURST_ENV)
+        burst = int(burst) if burst else None
+        backend = os.getenv(BACKEND_ENV, "file").lower()
+        if backend == "rabbitmq":
+            limiter = RabbitTokenBucket(rpm, burst, host=rabbitmq_host or "localhost")
+        else:
+            limiter = FileTokenBucket(rpm, burst, os.getenv(STATE_FILE_ENV))
+        logger.info(
+            f"Limite global do portal: {limiter.rpm:g} sessões/min, rajada {limiter.burst} "
+            f"(backend {backend})"
+        )
+        return limiter
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera uma ficha para abrir uma sessão no portal
+
+        Returns:
+            False se o prazo expirou sem ficha
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                waited = time.monotonic() - started
+                self.metrics.inc("rate_limit_tokens_total")
+                self.metrics.inc("rate_limit_wait_seconds_total", round(waited, 3))
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.inc("rate_limit_timeouts_total")
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    @abc.abstractmethod
+    def _try_take(self) -> float:
+        """
+        Tenta consumir uma ficha
+
+        Returns:
+            0 se consumiu, senão os segundos a esperar antes de tentar de novo
+        """
+
+    def close(self):
+        pass
+
+
+class FileTokenBucket(PortalRateLimiter):
+    """
+    Bucket num arquivo JSON travado com flock: serve para todos os workers da
+    mesma máquina, sem serviço extra
+    """
+
+    def __init__(self, rpm: float, burst: Optional[int] = None, path: Optional[str] = None):
+        super().__init__(rpm, burst)
+        self.path = path or os.path.join(tempfile.gettempdir(), "gpi_portal_rate.json")
+        # Sem flock (Windows) o limite vale só para este processo
+        self._local_lock = threading.Lock()
+        if fcntl is None:
+            logger.warning("flock indisponível: limite do portal aplicado só a este processo")
+
+    def _try_take(self) -> float:
+        with self._local_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a+") as handle:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    handle.seek(0)
+                    try:
+                        state = json.loads(handle.read() or "{}")
+                    except ValueError:
+                        state = {}
+                    now = time.time()
+                    tokens = float(state.get("tokens", self.burst))
+                    updated = float(state.get("updated", now))
+                    # Rajada e ritmo do arquivo podem vir de outro worker; vale a configuração atual
+                    tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                    wait = 0.0
+                    if tokens >= 1:
+                        tokens -= 1
+                    else:
+                        wait = (1 - tokens) / self.rate
+                    handle.seek(0)
+                    handle.truncate()
+                    handle.write(json.dumps({"tokens": tokens, "updated": now}))
+                    handle.flush()
+                    return wait
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class RabbitTokenBucket(PortalRateLimiter):
+    """
+    Fichas como mensagens numa fila do RabbitMQ, para workers em várias
+    máquinas. Um único worker (o líder, dono da fila exclusiva
+    gpi_portal_rate_leader) publica uma ficha a cada 60/rpm segundos; a fila
+    guarda no máximo `burst` fichas. Se o líder cai, a fila exclusiva some
+    com a conexão dele e outro worker assume.
+    """
+
+    def __init__(
+        self,
+        rpm: float,
+        burst: Optional[int] = None,
+        host: str = "localhost",
+        election_interval: float = 10,
+    ):
+        super().__init__(rpm, burst)
+        self.host = host
+        self.election_interval = election_interval
+        self.poll_interval = min(1.0, 60.0 / self.rpm)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._closed = False
+        self.is_leader = False
+        self.metrics.set("rate_limit_leader", 0)
+        threading.Thread(target=self._leader_loop, name="rate-leader", daemon=True).start()
+
+    def _declare_tokens(self, channel):
+        channel.queue_declare(
+            queue=TOKEN_QUEUE,
+            arguments={"x-max-length": self.burst, "x-overflow": "drop-head"},
+        )
+
+    def _consumer_channel(self):
+        import pika
+
+        if self._channel is None or not self._channel.is_open:
+            self._connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host))
+            self._channel = self._connection.channel()
+            self._declare_tokens(self._channel)
+        return self._channel
+
+    def _try_take(self) -> float:
+        with self._lock:
+            try:
+                method, _, _ = self._consumer_channel().basic_get(queue=TOKEN_QUEUE, auto_ack=True)
+            except Exception as e:
+                logger.warning(f"Erro ao obter ficha do portal no RabbitMQ: {e}")
+                self._channel = None
+                return self.election_interval
+        return 0 if method else self.poll_interval
+
+    def _leader_loop(self):
+        """
+        Tenta assumir a liderança; o líder repõe as fichas até perder a conexão
+        """
+        import pika
+
+        while not self._closed:
+            connection = None
+            try:
+                connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host))
+                channel = connection.channel()
+                try:
+                    channel.queue_declare(queue=LEADER_QUEUE, exclusive=True, auto_delete=True)
+                except pika.exceptions.ChannelClosedByBroker:
+                    # 405 RESOURCE_LOCKED: outro worker é o líder
+                    connection.close()
+                    time.sleep(self.election_interval)
+                    continue
+                self._declare_tokens(channel)
+                self.is_leader = True
+                self.metrics.set("rate_limit_leader", 1)
+                logger.info(f"Este worker repõe as fichas do portal ({self.rpm:g}/min)")
+                interval = 60.0 / self.rpm
+                while not self._closed:
+                    channel.basic_publish(exchange="", routing_key=TOKEN_QUEUE, body=b"1")
+                    # Processa heartbeats enquanto espera a próxima ficha
+                    connection.sleep(interval)
+            except Exception as e:
+                logger.warning(f"Reposição de fichas do portal interrompida: {e}")
+                time.sleep(self.election_interval)
+            finally:
+                if self.is_leader:
+                    self.is_leader = False
+                    self.metrics.set("rate_limit_leader", 0)
+                try:
+                    if connection is not None and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            try:
+                if self._connection is not None and self._connection.is_open:
+                    self._connection.close()
+            except Exception:
+                pass
@@ -1,5 +1,6 @@
 import pika
 import socket
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional, Tuple
 from app.models.cnpj import CNPJ
 import logging
@@ -8,7 +9,9 @@ from app.database.config import (
     get_all_cnpjs as supabase_get_all_cnpjs,
     insert_cnpj,
     delete_cnpj,
+    delete_cnpjs,
 )
+from app.services.queue_topology import declare_topology, publish_task, publish_cancellations
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -67,7 +70,10 @@ def send_to_queue_and_db(cnpj_obj, user_id: Optional[int] = None):
             "cnpj": cnpj_obj.cnpj,
             "razao_social": cnpj_obj.razao_social or "",
             "municipio": cnpj_obj.municipio or "",
-            "status": "pendente"
+            "status": "pendente",
+            # Publicada logo abaixo: a varredura de pendentes só a republica se
+            # ficar `stale_seconds` sem ser consumida
+            "enqueued_at": datetime.now(timezone.utc).isoformat(),
         }
         
         if user_id is not None:
@@ -81,13 +87,9 @@ def send_to_queue_and_db(cnpj_obj, user_id: Optional[int] = None):
 
         # Envia para o RabbitMQ
         connection = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue='fila_cnpj')
-        channel.basic_publish(
-            exchange='',
-            routing_key='fila_cnpj',
-            body=str(fila_id)
-        )
+        # Fila durável e mensagem persistente: sobrevivem a um restart do broker
+        channel = declare_topology(connection)
+        publish_task(channel, fila_id)
         
         print(f"CNPJ added to queue: {cnpj_obj.cnpj}, ID: {fila_id}, User ID: {user_id}")
         return fila_id
@@ -99,6 +101,30 @@ def send_to_queue_and_db(cnpj_obj, user_id: Optional[int] = None):
         if connection and connection.is_open:
             connection.close()
 
+def notify_cancellations(fila_ids: List[int]):
+    """
+    Avisa os workers, numa única mensagem, que as tarefas foram excluídas: as
+    mensagens ainda na fila são descartadas na chegada e as consultas em
+    andamento param na próxima etapa do navegador
+    
+    Args:
+        fila_ids: IDs das tarefas excluídas
+    """
+    if not fila_ids:
+        return
+    connection = None
+    try:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_HOST))
+        channel = declare_topology(connection)
+        publish_cancellations(channel, fila_ids)
+        logger.info(f"Cancelamento de {len(fila_ids)} tarefa(s) enviado aos workers")
+    except Exception as e:
+        # O registro já foi excluído: nenhum worker consegue mais reivindicá-lo
+        logger.error(f"Erro ao enviar cancelamento de {len(fila_ids)} tarefa(s) aos workers: {str(e)}")
+    finally:
+        if connection and connection.is_open:
+            connection.close()
+
 def delete_from_queue_by_id(fila_id: int, user_id: Optional[int] = None) -> bool:
     """
     Remove um CNPJ da fila pelo ID
@@ -110,9 +136,6 @@ def delete_from_queue_by_id(fila_id: int, user_id: Optional[int] = None) -> bool
     Returns:
         True se o registro foi removido com sucesso, False caso contrário
     """
-    connection = None
-    channel = None
-    
     try:
         # Primeiro verifica se o registro existe e pertence ao usuário (feito pelo serviço de Supabase)
         exists = delete_cnpj(fila_id, user_id)
@@ -120,31 +143,24 @@ def delete_from_queue_by_id(fila_id: int, user_id: Optional[int] = None) -> bool
         if not exists:
             return False
         
-        # Se o registro existe e foi excluído com sucesso, adiciona o ID à fila de ignorados do RabbitMQ
-        try:
-            # Conecta ao RabbitMQ para criar uma fila de ignorados se não existir
-            connection = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_HOST))
-            channel = connection.channel()
-            channel.queue_declare(queue='fila_cnpj_ignorados', durable=True)
-            
-            # Adiciona o ID à fila de ignorados
-            channel.basic_publish(
-                exchange='',
-                routing_key='fila_cnpj_ignorados',
-                body=str(fila_id),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Mensagem persistente
-                )
-            )
-            
-            logger.info(f"ID {fila_id} adicionado à fila de ignorados")
-        except Exception as e:
-            logger.error(f"Erro ao adicionar ID {fila_id} à fila de ignorados: {str(e)}")
-        
+        notify_cancellations([fila_id])
         return True
     except Exception as e:
         logger.error(f"Erro ao deletar CNPJ da fila: {str(e)}")
         return False
-    finally:
-        if connection and connection.is_open:
-            connection.close() 
\ No newline at end of file
+
+def delete_batch_from_queue(fila_ids: List[int], user_id: Optional[int] = None) -> List[int]:
+    """
+    Remove vários CNPJs da fila com uma exclusão no banco e um único aviso de
+    cancelamento aos workers
+    
+    Args:
+        fila_ids: IDs dos registros na fila
+        user_id: ID do usuário (opcional para verificação de permissão)
+        
+    Returns:
+        IDs efetivamente removidos
+    """
+    removidos = delete_cnpjs(fila_ids, user_id)
+    notify_cancellations(removidos)
+    return removidos
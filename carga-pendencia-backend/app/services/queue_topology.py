@@ -0,0 +1,244 @@
+"""
+Topologia durável das filas de CNPJ no RabbitMQ: fila principal, filas de
+retentativa com atraso crescente, fila de mensagens mortas (DLQ) e exchange
+de cancelamentos
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import pika
+
+from app.services.concurrency_controller import AdaptiveConcurrencyLimiter, OUTCOME_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+QUEUE = "fila_cnpj"
+DEAD_LETTER_QUEUE = "fila_cnpj_dlq"
+RETRY_QUEUE = "fila_cnpj_retry_{}"
+# Fanout: cada worker liga a ela uma fila exclusiva (task_cancellation)
+CANCEL_EXCHANGE = "fila_cnpj_cancelamentos"
+
+# Tentativas no total (a primeira mais as retentativas) antes da DLQ
+MAX_ATTEMPTS_ENV = "GPI_RETRY_MAX_ATTEMPTS"
+# Atraso da primeira retentativa; dobra a cada falha
+RETRY_BASE_ENV = "GPI_RETRY_BASE_DELAY"
+
+PERSISTENT = pika.BasicProperties(delivery_mode=2)
+
+
+def max_attempts() -> int:
+    return max(1, int(os.getenv(MAX_ATTEMPTS_ENV, "4")))
+
+
+def retry_delay(failures: int) -> int:
+    """
+    Segundos até a retentativa depois de `failures` falhas: base * 2^(falhas-1)
+    """
+    base = int(os.getenv(RETRY_BASE_ENV, "30"))
+    return base * 2 ** (max(1, failures) - 1)
+
+
+def retry_queue(failures: int) -> str:
+    return RETRY_QUEUE.format(retry_delay(failures))
+
+
+# Falhas de navegador, rede ou sessão e certidões que não carregaram a tempo,
+# com as mensagens usadas pelos caminhos Selenium, sessão estacionada, abas e
+# backend assíncrono; outros erros (campo ou botão ausente, estado não
+# confirmado) se repetiriam e vão direto para "erro"
+TRANSIENT_MARKERS = (
+    "navegador não responde",
+    "navegador sem abas",
+    "navegador multi-abas encerrado",
+    "falha ao abrir aba",
+    "failed to initialize chrome",
+    "chrome not reachable",
+    "invalid session id",
+    "no such window",
+    "connection",
+    "conexão",
+    "sessão expirada",
+    "não abriu",
+    "não está aberta",
+    "não preenchida",
+    "sem texto",
+)
+
+
+def is_transient(result: Optional[Dict[str, Any]]) -> bool:
+    """
+    Falha que vale tentar de novo, classificada pelo desfecho e pela
+    mensagem de erro, igual para todos os caminhos de consulta: timeout do
+    portal, navegador ou conexão caídos, certidão que não carregou, ou
+    exceção no worker sem resultado
+    """
+    if not result:
+        return True
+    if result.get("status") in ("success", "cancelled"):
+        return False
+    if AdaptiveConcurrencyLimiter.outcome_of(result) == OUTCOME_TIMEOUT:
+        return True
+    if str(result.get("message", "")).startswith("Falha no processamento"):
+        return True
+    message = " ".join(str(result.get(key) or "") for key in ("message", "error")).lower()
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def _declare(connection, channel, queue: str, arguments: Optional[Dict[str, Any]] = None):
+    """
+    Declara a fila durável. Uma fila já existente com outras propriedades
+    (como a fila_cnpj não durável de versões anteriores) faz o broker fechar
+    o canal com 406: se estiver vazia e sem consumidores ela é recriada,
+    senão continua como está até ser esvaziada.
+
+    Returns:
+        O canal aberto (um novo, se o broker fechou o anterior)
+    """
+    try:
+        channel.queue_declare(queue=queue, durable=True, arguments=arguments)
+        return channel
+    except pika.exceptions.ChannelClosedByBroker as e:
+        if e.reply_code != 406:
+            raise
+    channel = connection.channel()
+    try:
+        # if_empty/if_unused: o broker só remove se ninguém estiver usando
+        channel.queue_delete(queue=queue, if_unused=True, if_empty=True)
+    except pika.exceptions.ChannelClosedByBroker:
+        channel = connection.channel()
+        channel.queue_declare(queue=queue, passive=True)
+        logger.warning(
+            f"Fila {queue} existe com outras propriedades e está em uso; mantida como está. "
+            f"Será recriada durável quando estiver vazia e sem consumidores."
+        )
+        return channel
+    channel.queue_declare(queue=queue, durable=True, arguments=arguments)
+    logger.info(f"Fila {queue} recriada como durável")
+    return channel
+
+
+def declare_topology(connection):
+    """
+    Declara a fila principal, as filas de retentativa (uma por atraso, cujo
+    TTL devolve a mensagem à fila principal), a DLQ e a exchange de cancelamentos
+
+    Returns:
+        Canal aberto para uso depois da declaração
+    """
+    channel = connection.channel()
+    channel = _declare(connection, channel, QUEUE)
+    for failures in range(1, max_attempts()):
+        channel = _declare(
+            connection,
+            channel,
+            retry_queue(failures),
+            {
+                "x-message-ttl": retry_delay(failures) * 1000,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": QUEUE,
+            },
+        )
+    channel = _declare(connection, channel, DEAD_LETTER_QUEUE)
+    channel.exchange_declare(exchange=CANCEL_EXCHANGE, exchange_type="fanout", durable=True)
+    return channel
+
+
+def publish_task(channel, fila_id: int, queue: str = QUEUE, headers: Optional[Dict[str, Any]] = None):
+    """
+    Publica o ID da tarefa como mensagem persistente
+    """
+    properties = PERSISTENT if not headers else pika.BasicProperties(delivery_mode=2, headers=headers)
+    channel.basic_publish(exchange="", routing_key=queue, body=str(fila_id), properties=properties)
+
+
+def publish_cancellations(channel, fila_ids: Iterable[int]):
+    """
+    Avisa todos os workers, numa única mensagem, que as tarefas foram excluídas
+    """
+    ids = [int(fila_id) for fila_id in fila_ids]
+    if ids:
+        channel.basic_publish(exchange=CANCEL_EXCHANGE, routing_key="", body=json.dumps(ids))
+
+
+class TaskPublisher:
+    """
+    Conexão de publicação compartilhada pelas threads do processo, com a
+    topologia declarada e confirmação do broker em cada publicação
+
+    Exemplo:
+        TaskPublisher.get_instance(RABBITMQ_HOST).publish(fila_id)
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, host: str = "localhost"):
+        self.host = host
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+
+    @classmethod
+    def get_instance(cls, host: str = "localhost") -> "TaskPublisher":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TaskPublisher(host)
+            return cls._instance
+
+    def _ensure_channel(self):
+        if self._channel is None or not self._channel.is_open:
+            if self._connection is not None and self._connection.is_open:
+                try:
+                    self._connection.close()
+                except Exception:
+                    pass
+            self._connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host))
+            self._channel = declare_topology(self._connection)
+            self._channel.confirm_delivery()
+        return self._channel
+
+    def declare(self):
+        """
+        Declara a topologia (usado antes de consumidores que não a declaram)
+        """
+        with self._lock:
+            self._ensure_channel()
+
+    def publish(self, fila_id: int, queue: str = QUEUE, headers: Optional[Dict[str, Any]] = None):
+        """
+        Publica a tarefa; reconecta uma vez se a conexão ociosa caiu
+        """
+        with self._lock:
+            try:
+                publish_task(self._ensure_channel(), fila_id, queue, headers)
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError):
+                self._channel = None
+                publish_task(self._ensure_channel(), fila_id, queue, headers)
+
+    def schedule_retry(self, fila_id: int, failures: int) -> int:
+        """
+        Publica a tarefa na fila de retentativa do atraso correspondente
+
+        Returns:
+            Segundos até a mensagem voltar à fila principal
+        """
+        self.publish(fila_id, retry_queue(failures), {"x-failures": failures})
+        return retry_delay(failures)
+
+    def dead_letter(self, fila_id: int, failures: int, reason: str):
+        self.publish(fila_id, DEAD_LETTER_QUEUE, {"x-failures": failures, "x-reason": reason[:500]})
+
+    def close(self):
+        with self._lock:
+            try:
+                if self._connection is not None and self._connection.is_open:
+                    self._connection.close()
+            except Exception:
+                pass
+            self._connection = self._channel = None
@@ -0,0 +1,267 @@
+"""
+Bloqueio de recursos não essenciais (imagens, fontes, terceiros) durante a
+automação do portal GPI, via request_interceptor do selenium-wire ou
+context.route do backend assíncrono
+"""
+import logging
+import os
+import threading
+import weakref
+from typing import Dict, Any, Iterable, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Tipos bloqueados por padrão. Folhas de estilo e scripts do portal ficam de fora:
+# o GWT depende deles para montar o layout e a visibilidade dos elementos
+DEFAULT_BLOCKED_TYPES = ("image", "font", "media")
+
+# Hosts de terceiros que os scripts do portal realmente precisam
+DEFAULT_ALLOWED_HOSTS = ("gpi18.cloud.el.com.br",)
+
+# Tamanho típico de cada tipo de recurso, usado para estimar os bytes economizados
+# (o corpo de uma requisição bloqueada nunca é baixado)
+ESTIMATED_SIZES = {
+    "image": 15_000,
+    "font": 40_000,
+    "style": 12_000,
+    "script": 30_000,
+    "media": 200_000,
+    "other": 5_000,
+}
+
+EXTENSION_TYPES = {
+    ".png": "image", ".gif": "image", ".jpg": "image", ".jpeg": "image",
+    ".svg": "image", ".ico": "image", ".webp": "image", ".bmp": "image",
+    ".woff": "font", ".woff2": "font", ".ttf": "font", ".otf": "font", ".eot": "font",
+    ".css": "style",
+    ".js": "script",
+    ".mp4": "media", ".webm": "media", ".mp3": "media", ".ogg": "media",
+}
+
+# resource_type do Playwright para os tipos usados aqui
+PLAYWRIGHT_TYPES = {
+    "image": "image", "font": "font", "media": "media",
+    "stylesheet": "style", "script": "script", "document": "document",
+}
+
+# GIF transparente 1x1: mantém os eventos onload das imagens funcionando
+TRANSPARENT_GIF = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\x00\x00\x00!\xf9\x04\x01"
+    b"\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+)
+
+STUB_RESPONSES = {
+    "image": ("image/gif", TRANSPARENT_GIF),
+    "style": ("text/css", b""),
+    "script": ("application/javascript", b""),
+}
+
+_POLICIES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _env_list(name: str, default: Iterable[str]) -> tuple:
+    value = os.getenv(name)
+    if value is None:
+        return tuple(default)
+    return tuple(item.strip().lower() for item in value.split(",") if item.strip())
+
+
+class RequestBlockingPolicy:
+    """
+    Decide, para cada requisição do navegador, se ela segue ou é respondida
+    localmente com um stub (GIF 1x1, CSS/JS vazio ou 204), e contabiliza o que
+    foi economizado.
+
+    Configuração por ambiente:
+        GPI_REQUEST_BLOCKING=0       desativa o bloqueio
+        GPI_BLOCK_TYPES              tipos bloqueados (padrão: image,font,media)
+        GPI_BLOCK_ALLOW_HOSTS        hosts liberados além do portal
+        GPI_BLOCK_THIRD_PARTY=0      não bloqueia hosts de terceiros
+        GPI_PORTAL_URL               host do portal alternativo é liberado
+    """
+
+    def __init__(
+        self,
+        blocked_types: Iterable[str] = DEFAULT_BLOCKED_TYPES,
+        allowed_hosts: Iterable[str] = DEFAULT_ALLOWED_HOSTS,
+        block_third_party: bool = True,
+    ):
+        self.blocked_types = set(blocked_types)
+        self.allowed_hosts = set(allowed_hosts)
+        self.block_third_party = block_third_party
+        self._lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def from_env() -> Optional["RequestBlockingPolicy"]:
+        """
+        Cria a política a partir das variáveis de ambiente
+
+        Returns:
+            RequestBlockingPolicy, ou None se o bloqueio estiver desativado
+        """
+        if os.getenv("GPI_REQUEST_BLOCKING", "1") == "0":
+            return None
+        # Portal alternativo (GPI_PORTAL_URL) também conta como primeira parte
+        portal_host = (urlparse(os.getenv("GPI_PORTAL_URL", "")).hostname or "").lower()
+        return RequestBlockingPolicy(
+            blocked_types=_env_list("GPI_BLOCK_TYPES", DEFAULT_BLOCKED_TYPES),
+            allowed_hosts=DEFAULT_ALLOWED_HOSTS
+            + ((portal_host,) if portal_host else ())
+            + _env_list("GPI_BLOCK_ALLOW_HOSTS", ()),
+            block_third_party=os.getenv("GPI_BLOCK_THIRD_PARTY", "1") != "0",
+        )
+
+    def install(self, driver) -> "RequestBlockingPolicy":
+        """
+        Instala a política como request_interceptor do driver selenium-wire
+        """
+        driver.request_interceptor = self.intercept
+        _POLICIES[driver] = self
+        logger.info(
+            f"Bloqueio de requisições ativo: tipos={sorted(self.blocked_types)}, "
+            f"terceiros={'bloqueados' if self.block_third_party else 'liberados'}"
+        )
+        return self
+
+    @staticmethod
+    def for_driver(driver) -> Optional["RequestBlockingPolicy"]:
+        """
+        Política instalada no driver, se houver
+        """
+        try:
+            return _POLICIES.get(driver)
+        except TypeError:
+            return None
+
+    # ------------------------------------------------------------------
+    # Classificação
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def resource_type(request) -> str:
+        """
+        Tipo do recurso pela dica Sec-Fetch-Dest do Chrome ou pela extensão da URL
+        """
+        dest = (request.headers.get("Sec-Fetch-Dest") or "").lower()
+        if dest in ("image", "font", "style", "script"):
+            return dest
+        if dest in ("audio", "video", "track"):
+            return "media"
+        if dest in ("document", "iframe", "frame"):
+            return "document"
+        path = urlparse(request.url).path.lower()
+        for extension, kind in EXTENSION_TYPES.items():
+            if path.endswith(extension):
+                return kind
+        return "other"
+
+    def _host_allowed(self, host: str) -> bool:
+        return any(host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts)
+
+    def decide(self, request, kind: Optional[str] = None) -> Optional[str]:
+        """
+        Retorna o motivo do bloqueio, ou None se a requisição deve seguir
+        """
+        kind = kind or self.resource_type(request)
+        if kind == "document":
+            return None
+        if kind in self.blocked_types:
+            return kind
+        host = (urlparse(request.url).hostname or "").lower()
+        if self.block_third_party and host and not self._host_allowed(host):
+            return "third_party"
+        return None
+
+    # ------------------------------------------------------------------
+    # Interceptação
+    # ------------------------------------------------------------------
+
+    def intercept(self, request):
+        """
+        request_interceptor do selenium-wire (executado nas threads do proxy)
+        """
+        kind = self.resource_type(request)
+        reason = self.decide(request, kind)
+        self._count(kind, reason)
+        if not reason:
+            return
+        stub = STUB_RESPONSES.get(kind)
+        if stub:
+            content_type, body = stub
+            request.create_response(
+                status_code=200,
+                headers={"Content-Type": content_type, "Cache-Control": "max-age=86400"},
+                body=body,
+            )
+        else:
+            request.create_response(status_code=204, headers={}, body=b"")
+
+    async def intercept_route(self, route):
+        """
+        Handler de page.route/context.route do backend assíncrono (Playwright)
+        """
+        request = route.request
+        kind = PLAYWRIGHT_TYPES.get(request.resource_type, "other")
+        reason = self.decide(request, kind)
+        self._count(kind, reason)
+        if not reason:
+            await route.continue_()
+            return
+        stub = STUB_RESPONSES.get(kind)
+        if stub:
+            content_type, body = stub
+            await route.fulfill(status=200, content_type=content_type, body=body)
+        else:
+            await route.fulfill(status=204, body=b"")
+
+    # ------------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------------
+
+    def _count(self, kind: str, reason: Optional[str]):
+        with self._lock:
+            self._stats["requests_total"] += 1
+            if reason:
+                self._stats["requests_blocked"] += 1
+                self._stats["bytes_saved_estimate"] += ESTIMATED_SIZES.get(
+                    kind, ESTIMATED_SIZES["other"]
+                )
+                by_reason = self._stats["blocked_by_reason"]
+                by_reason[reason] = by_reason.get(reason, 0) + 1
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            "requests_total": 0,
+            "requests_blocked": 0,
+            "bytes_saved_estimate": 0,
+            "blocked_by_reason": {},
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Cópia dos contadores acumulados desde a instalação
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["blocked_by_reason"] = dict(self._stats["blocked_by_reason"])
+        return stats
+
+    @staticmethod
+    def diff(after: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Contadores de uma tarefa: diferença entre dois snapshots
+        """
+        by_reason = {
+            reason: count - before["blocked_by_reason"].get(reason, 0)
+            for reason, count in after["blocked_by_reason"].items()
+            if count - before["blocked_by_reason"].get(reason, 0)
+        }
+        return {
+            "requests_total": after["requests_total"] - before["requests_total"],
+            "requests_blocked": after["requests_blocked"] - before["requests_blocked"],
+            "bytes_saved_estimate": after["bytes_saved_estimate"] - before["bytes_saved_estimate"],
+            "blocked_by_reason": by_reason,
+        }
@@ -0,0 +1,191 @@
+"""
+Cache persistente das estratégias de seletor usadas em cada etapa do portal GPI
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("GPI_SELECTOR_CACHE", "temp/gpi_selector_cache.json")
+# Intervalo mínimo entre gravações do cache em disco, em segundos
+FLUSH_INTERVAL_ENV = "GPI_SELECTOR_CACHE_FLUSH_S"
+
+
+def _apply(steps: Dict[str, Dict[str, Dict[str, Any]]], step: str, strategy: str,
+           success: bool, latency: float, when: float):
+    s = steps.setdefault(step, {}).setdefault(
+        strategy,
+        {"wins": 0, "failures": 0, "consecutive_failures": 0, "avg_latency": 0.0},
+    )
+    if success:
+        # Média móvel exponencial da latência das vitórias
+        s["avg_latency"] = (
+            latency if s["wins"] == 0 else 0.8 * s["avg_latency"] + 0.2 * latency
+        )
+        s["wins"] += 1
+        s["consecutive_failures"] = 0
+    else:
+        s["failures"] += 1
+        s["consecutive_failures"] += 1
+    s["last_used"] = max(s.get("last_used", 0), when)
+
+
+class SelectorStrategyCache:
+    """
+    Registra, por etapa, quais estratégias de clique funcionaram e quanto tempo
+    levaram, para que a próxima tarefa tente primeiro a vencedora.
+
+    Estratégias que falham repetidamente são rebaixadas para o fim da fila, mas
+    continuam disponíveis como último recurso.
+
+    As tentativas são gravadas em lote, no máximo a cada `flush_interval`
+    segundos e na saída do processo: o arquivo é relido sob flock e as
+    tentativas deste processo são somadas às dos outros workers.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path: str = CACHE_PATH, demote_after: int = 3, flush_interval: Optional[float] = None):
+        self.path = path
+        self.demote_after = demote_after
+        if flush_interval is None:
+            flush_interval = float(os.getenv(FLUSH_INTERVAL_ENV, "30"))
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Serializa as gravações deste processo; entre processos vale o flock
+        self._flush_lock = threading.Lock()
+        self._steps: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Tentativas ainda não gravadas: (etapa, estratégia, sucesso, latência, quando)
+        self._pending: List[Tuple[str, str, bool, float, float]] = []
+        self._last_flush = time.monotonic()
+        self._steps = self._read()
+        if self._steps:
+            logger.info(f"Cache de estratégias de seletor carregado de {self.path}")
+        atexit.register(self.flush)
+
+    @classmethod
+    def get_instance(cls) -> "SelectorStrategyCache":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = SelectorStrategyCache()
+            return cls._instance
+
+    def _read(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("steps", {})
+        except Exception as e:
+            logger.warning(f"Não foi possível carregar o cache de estratégias: {e}")
+            return {}
+
+    def _write(self, steps: Dict[str, Dict[str, Dict[str, Any]]]):
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"updated_at": time.time(), "steps": steps},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+
+    def flush(self):
+        """
+        Grava as tentativas pendentes: relê o arquivo sob flock (num arquivo
+        .lock ao lado, já que o cache é substituído a cada gravação), aplica
+        as tentativas deste processo e grava de volta
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+            if not pending:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(f"{self.path}.lock", "a") as handle:
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_EX)
+                    try:
+                        steps = self._read()
+                        for event in pending:
+                            _apply(steps, *event)
+                        self._write(steps)
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(handle, fcntl.LOCK_UN)
+            except Exception as e:
+                logger.warning(f"Não foi possível gravar o cache de estratégias: {e}")
+                with self._lock:
+                    # Tenta de novo na próxima gravação
+                    self._pending = pending + self._pending
+                return
+            with self._lock:
+                # Estado dos outros workers mais as tentativas feitas durante a gravação
+                for event in self._pending:
+                    _apply(steps, *event)
+                self._steps = steps
+
+    def order(self, step: str, strategies: List[str]) -> List[str]:
+        """
+        Ordena as estratégias da etapa: vencedoras primeiro (maior taxa de acerto,
+        menor latência), depois as não testadas e por fim as rebaixadas
+
+        Args:
+            step: Nome da etapa (ex.: "menu1")
+            strategies: Estratégias na ordem declarada pelo fluxo
+
+        Returns:
+            Lista de nomes na ordem em que devem ser tentadas
+        """
+        with self._lock:
+            stats = dict(self._steps.get(step, {}))
+
+        def _rank(item):
+            index, name = item
+            s = stats.get(name)
+            if not s:
+                return (1, 0, 0, index)
+            if s["consecutive_failures"] >= self.demote_after:
+                return (2, 0, 0, index)
+            if s["wins"] == 0:
+                return (1, 0, 0, index)
+            attempts = s["wins"] + s["failures"]
+            return (0, -round(s["wins"] / attempts, 2), s["avg_latency"], index)
+
+        return [name for _, name in sorted(enumerate(strategies), key=_rank)]
+
+    def record(self, step: str, strategy: str, success: bool, latency: float):
+        """
+        Registra o resultado de uma tentativa; o cache vai para o disco na
+        próxima gravação em lote
+
+        Args:
+            step: Nome da etapa
+            strategy: Nome da estratégia tentada
+            success: Se o clique funcionou
+            latency: Tempo gasto na tentativa, em segundos
+        """
+        event = (step, strategy, success, latency, time.time())
+        with self._lock:
+            _apply(self._steps, *event)
+            self._pending.append(event)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
@@ -0,0 +1,83 @@
+"""
+Medição do tempo gasto em cada etapa da consulta ao portal GPI
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+
+class StepTimer:
+    """
+    Acumula a duração de cada fase (relógio monotônico) e a estratégia de
+    seletor vencedora de cada etapa, para gravar junto com o resultado da tarefa.
+
+    Exemplo:
+        timer = StepTimer()
+        with timer.phase("initial_load"):
+            driver.get(url)
+        timer.strategy("menu1", "xpath")
+        resultado["timings"] = timer.as_dict()
+    """
+
+    def __init__(self):
+        self._origin = time.monotonic()
+        self._phases: Dict[str, float] = {}
+        self._open: Dict[str, float] = {}
+        self._strategies: Dict[str, Optional[str]] = {}
+
+    def start(self, name: str):
+        """
+        Inicia (ou reinicia) a contagem de uma fase
+        """
+        self._open[name] = time.monotonic()
+
+    def stop(self, name: str) -> float:
+        """
+        Encerra a fase, somando o tempo ao total dela
+
+        Returns:
+            Segundos desta medição (0 se a fase não estava aberta)
+        """
+        started = self._open.pop(name, None)
+        if started is None:
+            return 0.0
+        elapsed = time.monotonic() - started
+        self.record(name, elapsed)
+        return elapsed
+
+    def record(self, name: str, seconds: float):
+        """
+        Soma uma duração já medida ao total da fase
+        """
+        self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Context manager que mede o bloco como a fase `name`
+        """
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def strategy(self, step: str, name: Optional[str]):
+        """
+        Registra a estratégia de seletor que venceu a etapa (None se nenhuma)
+        """
+        self._strategies[step] = name
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Bloco `timings` gravado com a tarefa
+        """
+        for name in list(self._open):
+            self.stop(name)
+        phases = {name: round(seconds, 3) for name, seconds in self._phases.items()}
+        return {
+            "total_s": round(time.monotonic() - self._origin, 3),
+            "phases": phases,
+            "slowest_phase": max(phases, key=phases.get) if phases else None,
+            "strategies": dict(self._strategies),
+        }
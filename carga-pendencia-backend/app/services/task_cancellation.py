@@ -0,0 +1,155 @@
+"""
+Cancelamento de tarefas em tempo real: os IDs excluídos são publicados numa
+exchange fanout e cada worker guarda os cancelados num conjunto limitado,
+consultado quando a mensagem chega e entre as etapas da sessão no portal
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from app.services.queue_topology import CANCEL_EXCHANGE
+from app.services.worker_metrics import WorkerMetrics
+
+logger = logging.getLogger(__name__)
+
+# Quantos IDs cancelados cada worker lembra (os mais antigos saem primeiro)
+MAX_IDS_ENV = "GPI_CANCEL_MAX_IDS"
+
+STATUS_CANCELLED = "cancelled"
+
+
+class TaskCancelled(Exception):
+    """A tarefa foi excluída enquanto era processada"""
+
+    def __init__(self, fila_id: int):
+        super().__init__(f"Tarefa {fila_id} cancelada")
+        self.fila_id = fila_id
+
+
+def cancelled_result(fila_id: Optional[int], timings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Resultado de uma consulta interrompida pelo cancelamento: não é gravado
+    no banco (o registro foi excluído) nem volta para a fila
+    """
+    return {
+        "status": STATUS_CANCELLED,
+        "message": f"Tarefa {fila_id} cancelada",
+        "screenshots": [],
+        "timings": timings,
+    }
+
+
+def parse_ids(body: bytes):
+    """
+    IDs de uma mensagem de cancelamento: um ID ou uma lista JSON de IDs
+    """
+    ids = json.loads(body.decode())
+    return [int(i) for i in ids] if isinstance(ids, list) else [int(ids)]
+
+
+class CancelledTasks:
+    """
+    IDs cancelados conhecidos por este processo. Um listener assina a
+    exchange de cancelamentos com uma fila exclusiva; um worker que sobe
+    depois de um cancelamento não o recebe, mas a tarefa excluída já não
+    pode ser reivindicada no banco.
+
+    Exemplo:
+        cancelled = CancelledTasks.get_instance()
+        cancelled.listen(RABBITMQ_HOST)
+        cancelled.check(fila_id)   # TaskCancelled se a tarefa foi excluída
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_ids: Optional[int] = None):
+        self.max_ids = max(1, max_ids or int(os.getenv(MAX_IDS_ENV, "10000")))
+        self._ids: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self.metrics = WorkerMetrics.get_instance()
+
+    @classmethod
+    def get_instance(cls) -> "CancelledTasks":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = CancelledTasks()
+            return cls._instance
+
+    def add(self, fila_ids: Iterable[int]):
+        with self._lock:
+            for fila_id in fila_ids:
+                self._ids[fila_id] = None
+                self._ids.move_to_end(fila_id)
+            while len(self._ids) > self.max_ids:
+                self._ids.popitem(last=False)
+            self.metrics.set("cancelled_ids", len(self._ids))
+
+    def is_cancelled(self, fila_id: Optional[int]) -> bool:
+        return fila_id is not None and fila_id in self._ids
+
+    def check(self, fila_id: Optional[int]):
+        """
+        Ponto de verificação entre etapas
+
+        Raises:
+            TaskCancelled: A tarefa foi cancelada
+        """
+        if self.is_cancelled(fila_id):
+            self.metrics.inc("tasks_cancelled_in_flight_total")
+            raise TaskCancelled(fila_id)
+
+    def listen(self, host: str = "localhost", reconnect_delay: float = 5):
+        """
+        Inicia (uma vez por processo) a thread que recebe os cancelamentos
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(
+                target=self._listen_loop, args=(host, reconnect_delay), name="cancel-listener", daemon=True
+            )
+            self._listener.start()
+
+    def _listen_loop(self, host: str, reconnect_delay: float):
+        import pika
+
+        def _on_message(channel, method, properties, body):
+            try:
+                ids = parse_ids(body)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Mensagem de cancelamento inválida ({body!r}): {e}")
+                return
+            self.add(ids)
+            self.metrics.inc("cancellations_received_total", len(ids))
+            logger.info(f"{len(ids)} tarefa(s) cancelada(s): {ids[:20]}")
+
+        while True:
+            connection = None
+            try:
+                connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+                channel = connection.channel()
+                channel.exchange_declare(exchange=CANCEL_EXCHANGE, exchange_type="fanout", durable=True)
+                # Fila própria deste worker, removida quando a conexão cai
+                declared = channel.queue_declare(queue="", exclusive=True, auto_delete=True)
+                channel.queue_bind(queue=declared.method.queue, exchange=CANCEL_EXCHANGE)
+                channel.basic_consume(queue=declared.method.queue, on_message_callback=_on_message, auto_ack=True)
+                logger.info(f"Recebendo cancelamentos de {CANCEL_EXCHANGE}")
+                channel.start_consuming()
+            except Exception as e:
+                logger.warning(f"Recebimento de cancelamentos interrompido: {e}")
+            finally:
+                try:
+                    if connection is not None and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+            time.sleep(reconnect_delay)
@@ -0,0 +1,222 @@
+"""
+Política de espera baseada em condições para a automação do portal GPI
+"""
+import logging
+import os
+import time
+from typing import Callable, Optional, Any, List
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    TimeoutException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+)
+
+logger = logging.getLogger(__name__)
+
+# XPath dos overlays de carregamento usados pelo portal (GWT)
+LOADING_OVERLAY_XPATH = '//div[contains(@class, "mostrar_carregando") or contains(@class, "loading") or contains(@class, "spinner") or contains(@class, "carregando")]'
+
+
+class WaitPolicy:
+    """
+    Espera cada etapa terminar assim que a condição de prontidão é satisfeita,
+    respeitando um prazo máximo.
+
+    Os sleeps fixos antigos continuam disponíveis apenas como fallback opcional
+    (fixed_sleeps=True ou variável de ambiente GPI_FIXED_SLEEPS=1).
+    """
+
+    def __init__(
+        self,
+        fixed_sleeps: bool = False,
+        poll_interval: float = 0.25,
+        default_timeout: float = 30,
+        dom_stable_time: float = 1.5,
+    ):
+        self.fixed_sleeps = fixed_sleeps
+        self.poll_interval = poll_interval
+        self.default_timeout = default_timeout
+        self._dom_stable_time = dom_stable_time
+
+    @staticmethod
+    def from_wait_times(
+        wait_times: dict, fixed_sleeps: Optional[bool] = None
+    ) -> "WaitPolicy":
+        """
+        Cria a política a partir dos tempos calculados por calculate_wait_time
+
+        Args:
+            wait_times: Tempos de espera (usados como prazo máximo de cada etapa)
+            fixed_sleeps: Força o modo de sleeps fixos (padrão: GPI_FIXED_SLEEPS)
+
+        Returns:
+            WaitPolicy configurada
+        """
+        if fixed_sleeps is None:
+            fixed_sleeps = os.getenv("GPI_FIXED_SLEEPS", "0") == "1"
+        return WaitPolicy(
+            fixed_sleeps=fixed_sleeps,
+            default_timeout=wait_times.get("element_wait", 30),
+        )
+
+    # ------------------------------------------------------------------
+    # Esperas
+    # ------------------------------------------------------------------
+
+    def until(
+        self,
+        driver,
+        condition: Callable[[Any], Any],
+        timeout: Optional[float] = None,
+        description: str = "",
+    ):
+        """
+        Espera a condição ser satisfeita ou o prazo expirar
+
+        Args:
+            driver: Driver do Selenium
+            condition: Função (driver) -> valor verdadeiro quando pronto
+            timeout: Prazo máximo em segundos
+            description: Descrição da etapa para o log
+
+        Returns:
+            O valor retornado pela condição, ou None em caso de timeout
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        start = time.monotonic()
+        try:
+            result = WebDriverWait(
+                driver,
+                timeout,
+                poll_frequency=self.poll_interval,
+                ignored_exceptions=(
+                    NoSuchElementException,
+                    StaleElementReferenceException,
+                ),
+            ).until(condition)
+            logger.info(
+                f"Condição satisfeita em {time.monotonic() - start:.2f}s: {description or 'sem descrição'}"
+            )
+            return result
+        except TimeoutException:
+            logger.warning(
+                f"Timeout de {timeout}s esperando condição: {description or 'sem descrição'}"
+            )
+            return None
+
+    def settle(
+        self,
+        driver,
+        seconds: float,
+        condition: Optional[Callable[[Any], Any]] = None,
+        timeout: Optional[float] = None,
+        description: str = "",
+    ):
+        """
+        Substitui um sleep fixo: espera a condição de prontidão (padrão: página
+        ociosa) com prazo de `timeout` (ou `seconds`), ou dorme `seconds` no modo fixo.
+        """
+        if self.fixed_sleeps:
+            time.sleep(seconds)
+            return True
+        return self.until(
+            driver,
+            condition or WaitPolicy.page_idle(),
+            timeout=seconds if timeout is None else timeout,
+            description=description or "página ociosa",
+        )
+
+    def sleep(self, seconds: float):
+        """
+        Pausa cosmética (ex.: após scrollIntoView) executada apenas no modo fixo
+        """
+        if self.fixed_sleeps:
+            time.sleep(seconds)
+
+    def dom_stable_time(self, fixed_seconds: float) -> float:
+        """
+        Tempo que o DOM deve ficar estável antes de interagir
+        """
+        return fixed_seconds if self.fixed_sleeps else self._dom_stable_time
+
+    # ------------------------------------------------------------------
+    # Condições de prontidão
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def element_present(by, selector) -> Callable:
+        return EC.presence_of_element_located((by, selector))
+
+    @staticmethod
+    def element_clickable(by, selector) -> Callable:
+        return EC.element_to_be_clickable((by, selector))
+
+    @staticmethod
+    def any_element_present(by, selector) -> Callable:
+        def _condition(driver):
+            elements = driver.find_elements(by, selector)
+            return elements if elements else False
+
+        return _condition
+
+    @staticmethod
+    def document_ready() -> Callable:
+        def _condition(driver):
+            return driver.execute_script("return document.readyState") == "complete"
+
+        return _condition
+
+    @staticmethod
+    def overlay_gone(xpath: str = LOADING_OVERLAY_XPATH) -> Callable:
+        def _condition(driver):
+            return not any(
+                elem.is_displayed() for elem in driver.find_elements(By.XPATH, xpath)
+            )
+
+        return _condition
+
+    @staticmethod
+    def page_idle(xpath: str = LOADING_OVERLAY_XPATH) -> Callable:
+        """
+        Documento carregado e nenhum overlay de carregamento visível
+        """
+        ready = WaitPolicy.document_ready()
+        no_overlay = WaitPolicy.overlay_gone(xpath)
+
+        def _condition(driver):
+            return ready(driver) and no_overlay(driver)
+
+        return _condition
+
+    @staticmethod
+    def new_window(known_handles: List[str]) -> Callable:
+        """
+        Uma nova aba/janela foi aberta; retorna o handle da nova aba
+        """
+        known = set(known_handles)
+
+        def _condition(driver):
+            novos = [h for h in driver.window_handles if h not in known]
+            return novos[-1] if novos else False
+
+        return _condition
+
+    @staticmethod
+    def text_populated(css_selector: str = "div.texto", min_length: int = 20) -> Callable:
+        """
+        O elemento existe e já tem texto (ex.: div.texto da certidão)
+        """
+
+        def _condition(driver):
+            text = driver.execute_script(
+                "var el = document.querySelector(arguments[0]);"
+                "return el ? (el.innerText || el.textContent || '') : '';",
+                css_selector,
+            )
+            return text if text and len(text.strip()) >= min_length else False
+
+        return _condition
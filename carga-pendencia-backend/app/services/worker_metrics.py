@@ -0,0 +1,108 @@
+"""
+Métricas do worker (contadores e valores atuais), compartilhadas entre threads
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Arquivo JSON reescrito a cada relatório (vazio: só log)
+METRICS_FILE_ENV = "GPI_METRICS_FILE"
+
+
+class WorkerMetrics:
+    """
+    Registro simples de métricas do processo: contadores (somados) e gauges
+    (último valor). O snapshot é registrado no log periodicamente e, com
+    GPI_METRICS_FILE, gravado em JSON para ser lido por outros processos.
+
+    Exemplo:
+        metrics = WorkerMetrics.get_instance()
+        metrics.inc("browser_recycled_total")
+        metrics.set("browser_recycle_max_tasks", 200)
+        metrics.snapshot()
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, Any] = {}
+        self._started_at = time.time()
+        self._report_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls) -> "WorkerMetrics":
+        """
+        Instância compartilhada por todas as threads do processo
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = WorkerMetrics()
+            return cls._instance
+
+    def inc(self, name: str, amount: float = 1):
+        """
+        Soma `amount` ao contador `name`
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name: str, value: Any):
+        """
+        Define o valor atual do gauge `name`
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Cópia das métricas atuais
+        """
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "uptime_s": round(time.time() - self._started_at, 1),
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def write(self, path: str):
+        """
+        Grava o snapshot em JSON (substituição atômica do arquivo)
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def report_in_background(self, interval: float = 60) -> threading.Thread:
+        """
+        Registra (e grava, com GPI_METRICS_FILE) as métricas a cada `interval` segundos
+        """
+
+        def _report():
+            while True:
+                time.sleep(interval)
+                try:
+                    path = os.getenv(METRICS_FILE_ENV)
+                    if path:
+                        self.write(path)
+                    logger.info(f"Métricas do worker: {self.snapshot()}")
+                except Exception as e:
+                    logger.warning(f"Erro ao registrar métricas do worker: {e}")
+
+        with self._lock:
+            if self._report_thread is None or not self._report_thread.is_alive():
+                self._report_thread = threading.Thread(
+                    target=_report, name="worker-metrics", daemon=True
+                )
+                self._report_thread.start()
+            return self._report_thread
@@ -0,0 +1,158 @@
+"""
+Runtime assíncrono do worker: um único event loop consome a fila do RabbitMQ
+e conduz todas as tarefas, com a concorrência limitada por um semáforo.
+
+Dependência opcional:
+    pip install aio-pika
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set
+
+try:
+    import aio_pika
+except ImportError:  # pragma: no cover - runtime opcional
+    aio_pika = None
+
+from app.services.worker_metrics import WorkerMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntimeUnavailable(RuntimeError):
+    """O aio-pika não está instalado"""
+
+
+class AsyncWorkerRuntime:
+    """
+    Consumidor AMQP assíncrono: cada mensagem vira uma task no event loop,
+    que espera uma vaga no semáforo antes de chamar o handler. Mensagens
+    além das vagas (até o prefetch) ficam aguardando como tasks baratas, sem
+    uma thread cada.
+
+    A mensagem é confirmada depois do handler, com sucesso ou não, como no
+    consumidor síncrono; se o handler retornar True, ela volta para a fila
+    (tarefa não iniciada por causa do encerramento).
+
+    Exemplo:
+        async def handler(body: bytes):
+            ...
+        runtime = AsyncWorkerRuntime(handler, host="localhost", concurrency=6)
+        await runtime.run()
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[bytes], Awaitable[Optional[bool]]],
+        host: str = "localhost",
+        queue: str = "fila_cnpj",
+        concurrency: int = 3,
+        prefetch: int = 10,
+        reconnect_delay: float = 5,
+    ):
+        self.handler = handler
+        self.host = host
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.prefetch = max(self.concurrency, prefetch)
+        self.reconnect_delay = reconnect_delay
+        self.metrics = WorkerMetrics.get_instance()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stopping: Optional[asyncio.Event] = None
+        # stop() chamado antes de run() criar o evento
+        self._stop_requested = False
+        self._tasks: Set[asyncio.Task] = set()
+        self._running = 0
+
+    @staticmethod
+    def available() -> bool:
+        """
+        O aio-pika está instalado
+        """
+        return aio_pika is not None
+
+    async def run(self):
+        """
+        Consome a fila até stop(); deve ser chamado no event loop que conduz
+        as tarefas
+        """
+        if aio_pika is None:
+            raise AsyncRuntimeUnavailable("Runtime assíncrono requer o aio-pika: pip install aio-pika")
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopping = asyncio.Event()
+        if self._stop_requested:
+            self._stopping.set()
+        # connect_robust reconecta e refaz a declaração e o consumo sozinho
+        connection = await aio_pika.connect_robust(
+            host=self.host, reconnect_interval=self.reconnect_delay
+        )
+        try:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=self.prefetch)
+            # A topologia (fila durável, retentativas e DLQ) é declarada por queue_topology
+            queue = await channel.declare_queue(self.queue, passive=True)
+            consumer_tag = await queue.consume(self._on_message)
+            logger.info(
+                f"Consumindo {self.queue} em um único event loop: até {self.concurrency} "
+                f"tarefas simultâneas, prefetch {self.prefetch}"
+            )
+            await self._stopping.wait()
+            # Para de receber e termina as tarefas já recebidas antes de fechar o canal
+            await queue.cancel(consumer_tag)
+            await self.drain()
+        finally:
+            await connection.close()
+
+    def stop(self):
+        """
+        Encerra o consumo; seguro de chamar de outra thread via
+        call_soon_threadsafe. Antes de run(), o pedido fica registrado e run()
+        apenas termina as tarefas já recebidas (nenhuma)
+        """
+        self._stop_requested = True
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def drain(self):
+        """
+        Aguarda as tarefas em andamento
+        """
+        if self._tasks:
+            logger.info(f"Aguardando {len(self._tasks)} tarefas em andamento")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _on_message(self, message):
+        task = asyncio.create_task(self._handle(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        self._publish()
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._publish()
+
+    async def _handle(self, message):
+        requeue = False
+        try:
+            async with self._semaphore:
+                self._running += 1
+                self._publish()
+                try:
+                    requeue = await self.handler(message.body) is True
+                finally:
+                    self._running -= 1
+        except Exception as e:
+            logger.error(f"Handler falhou para a mensagem {message.body!r}: {e}")
+        finally:
+            try:
+                if requeue:
+                    await message.nack(requeue=True)
+                else:
+                    await message.ack()
+            except Exception as ack_error:
+                logger.error(f"Falha ao confirmar a mensagem {message.body!r}: {ack_error}")
+            self.metrics.inc("runtime_messages_total")
+
+    def _publish(self):
+        self.metrics.set("runtime_running", self._running)
+        self.metrics.set("runtime_waiting", max(0, len(self._tasks) - self._running))
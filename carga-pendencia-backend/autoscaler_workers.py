@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# Supervisor que ajusta a quantidade de processos worker_cnpj.py à demanda:
+# lê a profundidade da fila_cnpj no RabbitMQ e as tarefas 'pendente' no banco,
+# inicia workers até o máximo enquanto houver folga de CPU e memória na máquina
+# e, quando a demanda cai, retira workers com SIGTERM (o worker termina as
+# tarefas em andamento antes de sair).
+#
+# Uso:
+#   python autoscaler_workers.py --min 1 --max 6 --tarefas-por-worker 20
+#   python autoscaler_workers.py --max 4 --mem-por-worker-mb 2500 -- --modo fila --runtime asyncio
+
+import argparse
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pika
+import psutil
+
+from app.database.config import count_tasks_by_status
+from app.services.queue_service import RABBITMQ_HOST
+from app.services.queue_topology import QUEUE
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker_cnpj.py")
+
+
+def ler_demanda():
+    """
+    Mensagens prontas na fila_cnpj e tarefas 'pendente' no banco
+
+    Returns:
+        Tupla (profundidade da fila, pendentes); None onde a leitura falhou
+    """
+    profundidade = None
+    try:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
+        try:
+            declarada = connection.channel().queue_declare(queue=QUEUE, passive=True)
+            profundidade = declarada.method.message_count
+        finally:
+            connection.close()
+    except Exception as e:
+        print(f"[Autoscaler] Erro ao ler a profundidade da fila: {e}")
+    try:
+        pendentes = count_tasks_by_status("pendente")
+    except Exception as e:
+        print(f"[Autoscaler] Erro ao contar pendentes: {e}")
+        pendentes = None
+    return profundidade, pendentes
+
+
+class Autoscaler:
+    """
+    Mantém entre `minimo` e `maximo` workers: um para cada
+    `tarefas_por_worker` tarefas em espera, subindo no máximo um por ciclo e
+    só com folga de memória e CPU, e descendo um por vez depois de
+    `espera_descida` segundos sem mudanças
+    """
+
+    def __init__(self, args):
+        self.minimo = max(0, args.min)
+        self.maximo = max(self.minimo, args.max)
+        self.tarefas_por_worker = max(1, args.tarefas_por_worker)
+        self.mem_por_worker_mb = args.mem_por_worker_mb
+        self.reserva_mem_mb = args.reserva_mem_mb
+        self.cpu_max = args.cpu_max
+        self.espera_subida = args.espera_subida
+        self.espera_descida = args.espera_descida
+        self.dreno_timeout = args.dreno_timeout
+        self.worker_args = args.worker_args or ["--modo", "fila"]
+        # Workers ativos e os que estão drenando (processo -> prazo para sair)
+        self.ativos = []
+        self.drenando = {}
+        self.ultima_mudanca = 0.0
+        self.encerrando = False
+
+    def alvo(self, profundidade, pendentes):
+        """
+        Quantidade de workers para a demanda atual
+        """
+        leituras = [valor for valor in (profundidade, pendentes) if valor is not None]
+        if not leituras:
+            # Sem leitura: mantém o que está rodando
+            return len(self.ativos)
+        desejado = math.ceil(max(leituras) / self.tarefas_por_worker)
+        return min(self.maximo, max(self.minimo, desejado))
+
+    def folga(self):
+        """
+        A máquina comporta mais um worker (Chrome incluso)
+
+        Returns:
+            Tupla (comporta, motivo)
+        """
+        livre_mb = psutil.virtual_memory().available / (1024 * 1024)
+        if livre_mb - self.reserva_mem_mb < self.mem_por_worker_mb:
+            return False, f"memória livre {livre_mb:.0f} MB"
+        cpu = psutil.cpu_percent(interval=1)
+        if cpu >= self.cpu_max:
+            return False, f"CPU em {cpu:.0f}%"
+        return True, ""
+
+    def iniciar_worker(self):
+        processo = subprocess.Popen([sys.executable, WORKER_SCRIPT, *self.worker_args])
+        self.ativos.append(processo)
+        self.ultima_mudanca = time.monotonic()
+        print(f"[Autoscaler] Worker iniciado (pid {processo.pid}); ativos: {len(self.ativos)}")
+
+    def retirar_worker(self):
+        # O mais novo sai primeiro: os antigos já têm perfis e navegadores aquecidos
+        processo = self.ativos.pop()
+        self.drenar(processo)
+        self.ultima_mudanca = time.monotonic()
+        print(f"[Autoscaler] Worker {processo.pid} drenando; ativos: {len(self.ativos)}")
+
+    def drenar(self, processo):
+        try:
+            processo.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        self.drenando[processo] = time.monotonic() + self.dreno_timeout
+
+    def verificar_processos(self):
+        """
+        Remove workers que saíram e mata os que passaram do prazo de dreno
+        """
+        for processo in [p for p in self.ativos if p.poll() is not None]:
+            self.ativos.remove(processo)
+            print(f"[Autoscaler] Worker {processo.pid} saiu inesperadamente (código {processo.returncode})")
+        agora = time.monotonic()
+        for processo, prazo in list(self.drenando.items()):
+            if processo.poll() is not None:
+                del self.drenando[processo]
+                print(f"[Autoscaler] Worker {processo.pid} drenado e encerrado")
+            elif agora > prazo:
+                # Navegadores órfãos são varridos pelo ChromeSupervisor dos outros workers
+                print(f"[Autoscaler] Worker {processo.pid} não terminou em {self.dreno_timeout}s; encerrando à força")
+                processo.kill()
+                del self.drenando[processo]
+
+    def ciclo(self):
+        self.verificar_processos()
+        profundidade, pendentes = ler_demanda()
+        alvo = self.alvo(profundidade, pendentes)
+        ativos = len(self.ativos)
+        desde_mudanca = time.monotonic() - self.ultima_mudanca
+        print(
+            f"[Autoscaler] Fila: {profundidade}, pendentes: {pendentes}, "
+            f"workers: {ativos} (+{len(self.drenando)} drenando), alvo: {alvo}"
+        )
+        if ativos < self.minimo:
+            self.iniciar_worker()
+        elif alvo > ativos and desde_mudanca >= self.espera_subida:
+            comporta, motivo = self.folga()
+            if comporta:
+                self.iniciar_worker()
+            else:
+                print(f"[Autoscaler] Sem folga para mais um worker ({motivo})")
+        elif alvo < ativos and desde_mudanca >= self.espera_descida:
+            self.retirar_worker()
+
+    def encerrar(self, signum=None, frame=None):
+        self.encerrando = True
+
+    def executar(self, intervalo):
+        signal.signal(signal.SIGTERM, self.encerrar)
+        signal.signal(signal.SIGINT, self.encerrar)
+        print(
+            f"[Autoscaler] Entre {self.minimo} e {self.maximo} workers, um a cada "
+            f"{self.tarefas_por_worker} tarefas em espera; worker: {' '.join(self.worker_args)}"
+        )
+        while not self.encerrando:
+            try:
+                self.ciclo()
+            except Exception as e:
+                print(f"[Autoscaler] Erro no ciclo: {e}")
+            fim = time.monotonic() + intervalo
+            while not self.encerrando and time.monotonic() < fim:
+                time.sleep(1)
+        print(f"[Autoscaler] Encerrando: drenando {len(self.ativos)} workers...")
+        while self.ativos:
+            self.drenar(self.ativos.pop())
+        while self.drenando:
+            self.verificar_processos()
+            time.sleep(1)
+        print("[Autoscaler] Todos os workers encerrados.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajusta a quantidade de workers de CNPJ à demanda da fila")
+    parser.add_argument("--min", type=int, default=1, help="Workers sempre em execução")
+    parser.add_argument("--max", type=int, default=4, help="Máximo de workers")
+    parser.add_argument("--tarefas-por-worker", type=int, default=20, help="Tarefas em espera que justificam um worker")
+    parser.add_argument("--mem-por-worker-mb", type=int, default=2000, help="Memória estimada por worker com seus navegadores")
+    parser.add_argument("--reserva-mem-mb", type=int, default=1024, help="Memória que deve sobrar na máquina")
+    parser.add_argument("--cpu-max", type=float, default=85, help="Não inicia workers com a CPU acima deste percentual")
+    parser.add_argument("--intervalo", type=float, default=30, help="Segundos entre verificações da demanda")
+    parser.add_argument("--espera-subida", type=float, default=60, help="Segundos mínimos entre um ajuste e o próximo aumento")
+    parser.add_argument("--espera-descida", type=float, default=300, help="Segundos mínimos entre um ajuste e a próxima redução")
+    parser.add_argument("--dreno-timeout", type=float, default=900, help="Prazo para um worker terminar suas tarefas após o SIGTERM")
+    parser.add_argument("worker_args", nargs=argparse.REMAINDER, help="Argumentos do worker_cnpj.py, após --")
+    args = parser.parse_args()
+    if args.worker_args and args.worker_args[0] == "--":
+        args.worker_args = args.worker_args[1:]
+
+    Autoscaler(args).executar(args.intervalo)
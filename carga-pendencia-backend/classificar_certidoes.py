@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Script de regressão, benchmark e reclassificação em massa do status_divida das certidões
+#
+# Uso:
+#   python classificar_certidoes.py verificar                 # compara com scripts/classificacao_esperada.json
+#   python classificar_certidoes.py verificar --gravar        # grava a classificação atual como esperada
+#   python classificar_certidoes.py benchmark --repeticoes 200
+#   python classificar_certidoes.py reclassificar             # simulação sobre fila_cnpj.full_result
+#   python classificar_certidoes.py reclassificar --aplicar   # grava os status alterados no banco
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from app.services.certidao_classifier import CertidaoClassifier
+from app.services.certidao_extractor import CertidaoExtractor
+
+ESPERADO_PADRAO = os.path.join("scripts", "classificacao_esperada.json")
+
+
+def texto_para_analise(html):
+    """
+    Texto usado na classificação: div.texto, ou a página inteira se não houver
+    """
+    texto, texto_completo = CertidaoExtractor.texts_from_html(html or "")
+    return texto or texto_completo
+
+
+def carregar_corpus(padrao):
+    """
+    Lê as certidões salvas pelo worker
+
+    Returns:
+        Lista de (nome do arquivo, texto para análise)
+    """
+    corpus = []
+    for caminho in sorted(glob.glob(padrao)):
+        with open(caminho, "r", encoding="utf-8") as f:
+            corpus.append((os.path.basename(caminho), texto_para_analise(f.read())))
+    return corpus
+
+
+def verificar(args):
+    corpus = carregar_corpus(args.certidoes)
+    if not corpus:
+        print(f"Nenhuma certidão encontrada em {args.certidoes}")
+        return 1
+    atual = dict(zip(
+        [nome for nome, _ in corpus],
+        CertidaoClassifier.classify_many(texto for _, texto in corpus),
+    ))
+
+    if args.gravar:
+        os.makedirs(os.path.dirname(args.esperado) or ".", exist_ok=True)
+        with open(args.esperado, "w", encoding="utf-8") as f:
+            json.dump(atual, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Classificação de {len(atual)} certidões gravada em {args.esperado}")
+        return 0
+
+    if not os.path.exists(args.esperado):
+        print(f"Arquivo de classificação esperada não encontrado: {args.esperado} (use --gravar)")
+        return 1
+    with open(args.esperado, "r", encoding="utf-8") as f:
+        esperado = json.load(f)
+
+    divergencias = 0
+    for nome, status in sorted(atual.items()):
+        if nome not in esperado:
+            print(f"[NOVO] {nome}: {status}")
+        elif esperado[nome] != status:
+            divergencias += 1
+            print(f"[DIVERGENTE] {nome}: esperado '{esperado[nome]}', obtido '{status}'")
+
+    contagem = defaultdict(int)
+    for status in atual.values():
+        contagem[status] += 1
+    print(f"{len(atual)} certidões classificadas: {dict(contagem)}")
+    if divergencias:
+        print(f"❌ {divergencias} divergência(s) em relação a {args.esperado}")
+        return 1
+    print("✅ Classificação idêntica à esperada")
+    return 0
+
+
+def benchmark(args):
+    corpus = carregar_corpus(args.certidoes)
+    if not corpus:
+        print(f"Nenhuma certidão encontrada em {args.certidoes}")
+        return 1
+    textos = [texto for _, texto in corpus] * args.repeticoes
+
+    inicio = time.perf_counter()
+    CertidaoClassifier.classify_many(textos)
+    duracao = time.perf_counter() - inicio
+    print(
+        f"Classificação: {len(textos)} textos em {duracao:.3f}s "
+        f"({len(textos) / duracao:,.0f} textos/s)"
+    )
+
+    # Extração de texto do HTML, o passo dominante na reclassificação do histórico
+    htmls = []
+    for caminho in sorted(glob.glob(args.certidoes)):
+        with open(caminho, "r", encoding="utf-8") as f:
+            htmls.append(f.read())
+    inicio = time.perf_counter()
+    for html in htmls:
+        texto_para_analise(html)
+    duracao = time.perf_counter() - inicio
+    print(
+        f"Extração de texto do HTML: {len(htmls)} certidões em {duracao:.3f}s "
+        f"({len(htmls) / duracao:,.0f} certidões/s)"
+    )
+    return 0
+
+
+def reclassificar(args):
+    from app.database.config import get_supabase_client
+
+    supabase = get_supabase_client()
+    inicio = time.perf_counter()
+    total = 0
+    alteracoes = defaultdict(list)
+
+    with ProcessPoolExecutor(max_workers=args.processos) as pool:
+        offset = 0
+        while True:
+            resposta = (
+                supabase.table("fila_cnpj")
+                .select("id, status_divida, full_result")
+                .not_.is_("full_result", "null")
+                .order("id")
+                .range(offset, offset + args.pagina - 1)
+                .execute()
+            )
+            linhas = resposta.data or []
+            if not linhas:
+                break
+            offset += len(linhas)
+            textos = pool.map(
+                texto_para_analise,
+                [linha.get("full_result") for linha in linhas],
+                chunksize=max(1, len(linhas) // (args.processos * 4)),
+            )
+            novos = CertidaoClassifier.classify_many(textos)
+            for linha, status in zip(linhas, novos):
+                if linha.get("full_result") and status != linha.get("status_divida"):
+                    alteracoes[status].append(linha["id"])
+            total += len(linhas)
+            print(f"{total} registros lidos...")
+
+    duracao = time.perf_counter() - inicio
+    alterados = sum(len(ids) for ids in alteracoes.values())
+    print(
+        f"{total} registros reclassificados em {duracao:.1f}s "
+        f"({total / max(duracao, 1e-9):,.0f}/s); {alterados} com status diferente"
+    )
+    for status, ids in alteracoes.items():
+        print(f"  -> '{status}': {len(ids)} registros")
+
+    if not args.aplicar:
+        print("Simulação: nada foi gravado (use --aplicar)")
+        return 0
+    for status, ids in alteracoes.items():
+        # Um UPDATE por status e lote de IDs
+        for i in range(0, len(ids), args.pagina):
+            supabase.table("fila_cnpj").update({"status_divida": status}).in_(
+                "id", ids[i:i + args.pagina]
+            ).execute()
+    print(f"✅ {alterados} registros atualizados")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regressão, benchmark e reclassificação do status_divida das certidões")
+    parser.add_argument("--certidoes", default=os.path.join("screenshots", "*_new_tab_html.html"), help="Glob das certidões salvas usadas como corpus")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_verificar = sub.add_parser("verificar", help="Compara a classificação do corpus com a esperada")
+    p_verificar.add_argument("--esperado", default=ESPERADO_PADRAO, help="Arquivo JSON com a classificação esperada")
+    p_verificar.add_argument("--gravar", action="store_true", help="Grava a classificação atual como esperada")
+    p_verificar.set_defaults(func=verificar)
+
+    p_benchmark = sub.add_parser("benchmark", help="Mede a vazão do classificador sobre o corpus")
+    p_benchmark.add_argument("--repeticoes", type=int, default=200, help="Quantas vezes o corpus é classificado")
+    p_benchmark.set_defaults(func=benchmark)
+
+    p_reclassificar = sub.add_parser("reclassificar", help="Reclassifica o full_result gravado em fila_cnpj")
+    p_reclassificar.add_argument("--pagina", type=int, default=1000, help="Registros lidos por página")
+    p_reclassificar.add_argument("--processos", type=int, default=os.cpu_count() or 2, help="Processos usados para extrair o texto do HTML")
+    p_reclassificar.add_argument("--aplicar", action="store_true", help="Grava os status alterados no banco")
+    p_reclassificar.set_defaults(func=reclassificar)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
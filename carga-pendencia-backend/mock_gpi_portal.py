@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# Servidor local que imita o fluxo do portal GPI usado por navigate_to_gpi_portal,
+# para benchmarks e testes de carga sem acessar o portal real.
+#
+# Uso:
+#   python mock_gpi_portal.py --porta 8765 --latencia 0.8 --jitter 0.4 --taxa-erro 0.02
+#   python worker_cnpj.py --portal-url "http://127.0.0.1:8765/ServerExec/acessoBase/?idPortal=mock"
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+BASE_PATH = "/ServerExec/acessoBase/"
+
+# Página inicial: o "GWT" monta cada etapa depois de uma chamada RPC ao servidor,
+# reproduzindo os ids e a estrutura que os XPaths do worker esperam
+LANDING_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>GPI - Portal do Contribuinte (simulado)</title>
+<style>
+  body { font-family: sans-serif; margin: 0; }
+  .mostrar_carregando { position: fixed; top: 0; left: 0; right: 0; bottom: 0;
+    background: rgba(255,255,255,0.6); z-index: 1000; }
+  .item { display: inline-block; padding: 12px; margin: 4px; border: 1px solid #ccc; cursor: pointer; }
+  .erro { color: #b00; }
+  button { padding: 6px 16px; }
+</style>
+</head>
+<body>
+<div id="loading" class="mostrar_carregando" style="display: none"></div>
+<div id="app"><ul id="menuBar"></ul></div>
+<script>
+var BASE = "__BASE__";
+
+function rpc(acao, dados, onOk) {
+  var overlay = document.getElementById("loading");
+  overlay.style.display = "block";
+  var xhr = new XMLHttpRequest();
+  xhr.open("POST", BASE + "rpc", true);
+  xhr.setRequestHeader("Content-Type", "text/x-gwt-rpc; charset=utf-8");
+  xhr.onreadystatechange = function () {
+    if (xhr.readyState !== 4) { return; }
+    overlay.style.display = "none";
+    if (xhr.status !== 200 || xhr.responseText.indexOf("//EX") === 0) {
+      var erro = document.createElement("div");
+      erro.className = "erro";
+      erro.textContent = "Erro de comunicação com o servidor (" + xhr.status + ")";
+      document.getElementById("app").appendChild(erro);
+      return;
+    }
+    onOk(JSON.parse(xhr.responseText.substring(4)));
+  };
+  var payload = {"acao": acao};
+  for (var k in dados) { payload[k] = dados[k]; }
+  xhr.send(JSON.stringify(payload));
+}
+
+function renderMenu() {
+  var app = document.getElementById("app");
+  app.innerHTML = '<ul id="gwt-uid-1"><li><a href="javascript:;">Serviços</a></li></ul>';
+  app.querySelector("#gwt-uid-1 a").onclick = function () { rpc("menu", {}, renderHome); };
+}
+
+function renderHome() {
+  var itens = "";
+  var nomes = ["Alvará", "IPTU", "ISS", "Nota Fiscal", "Certidão Negativa de Débitos", "Ouvidoria"];
+  for (var i = 0; i < nomes.length; i++) {
+    itens += '<div class="item">' + nomes[i] + '</div>';
+  }
+  var home = document.createElement("div");
+  home.id = "homePanel";
+  home.innerHTML = '<div><div class="titulo">Serviços ao contribuinte</div>'
+    + '<div><div><div>' + itens + '</div></div></div></div>';
+  document.getElementById("app").appendChild(home);
+  home.querySelectorAll(".item")[4].onclick = function () { rpc("servico", {}, renderForm); };
+}
+
+function linha(conteudo) {
+  return '<tr><td>' + conteudo + '</td></tr>';
+}
+
+function renderForm() {
+  var campos = '<div id="DataEntryForm_dataForm__6"><div><div><table><tbody>'
+    + linha('<b>Emissão de Certidão</b>')
+    + linha('<div id="e9c5eec1-27d9-4cc0-81c0-befa3acb0f18"><label><input type="radio" name="tipo"> Certidão Negativa de Débitos</label></div>')
+    + linha('<div id="tipoDocumento"></div>')
+    + linha('&nbsp;')
+    + linha('&nbsp;')
+    + linha('<div id="campoDocumento"></div>')
+    + '</tbody></table></div></div></div>';
+  var botoes = '<div><div><div><div><table><tbody><tr>'
+    + '<td><button type="button" id="emitir">Emitir</button></td>'
+    + '<td><button type="button">Limpar</button></td>'
+    + '</tr></tbody></table></div></div></div></div>';
+  var work = document.createElement("table");
+  work.id = "WorkPanel__4";
+  work.innerHTML = '<tbody>' + linha(campos) + linha(botoes) + '</tbody>';
+  document.getElementById("app").appendChild(work);
+  document.querySelector("#e9c5eec1-27d9-4cc0-81c0-befa3acb0f18 input").onclick = function () {
+    rpc("tipo", {}, renderTipoDocumento);
+  };
+  document.getElementById("emitir").onclick = emitir;
+}
+
+function renderTipoDocumento() {
+  document.getElementById("tipoDocumento").outerHTML =
+    '<div id="CNPJ"><label><input type="radio" name="documento"> CNPJ</label></div>';
+  document.querySelector("#CNPJ input").onclick = function () {
+    rpc("documento", {"tipo": "CNPJ"}, renderCampoDocumento);
+  };
+}
+
+function renderCampoDocumento() {
+  document.getElementById("campoDocumento").outerHTML =
+    '<table><tbody><tr><td><table><tbody>'
+    + '<tr><td>CNPJ</td></tr><tr><td><input type="text" maxlength="18"></td></tr>'
+    + '</tbody></table></td></tr></tbody></table>';
+}
+
+function emitir() {
+  var campo = document.querySelector("#DataEntryForm_dataForm__6 input[type=text]");
+  var cnpj = campo ? campo.value.replace(/\\D/g, "") : "";
+  rpc("emitir", {"cnpj": cnpj}, function (resposta) {
+    window.open(BASE + "certidao?id=" + resposta.id, "_blank");
+  });
+}
+
+rpc("inicio", {}, renderMenu);
+</script>
+</body>
+</html>
+"""
+
+
+def format_cnpj(cnpj):
+    if len(cnpj) != 14:
+        return cnpj
+    return f"{cnpj[0:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
+
+
+class CertidaoSeeds:
+    """
+    Certidões reais salvas pelo worker, usadas como resposta do portal simulado
+    """
+
+    def __init__(self, pattern):
+        self.pages = []
+        self.by_cnpj = {}
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8") as f:
+                html = f.read()
+            if 'class="texto"' not in html:
+                continue
+            self.pages.append(html)
+            match = re.search(r"<i>CNPJ</i>\s*([\d./-]+)", html)
+            if match:
+                self.by_cnpj.setdefault(re.sub(r"\D", "", match.group(1)), html)
+        if not self.pages:
+            raise SystemExit(f"Nenhuma certidão encontrada em {pattern}")
+
+    def for_cnpj(self, cnpj):
+        """
+        Certidão do CNPJ, se ele estiver entre as salvas; senão uma certidão
+        escolhida de forma determinística com o CNPJ substituído
+        """
+        if cnpj in self.by_cnpj:
+            return self.by_cnpj[cnpj]
+        index = int(hashlib.md5(cnpj.encode()).hexdigest(), 16) % len(self.pages)
+        return re.sub(
+            r"(<i>CNPJ</i>\s*)[\d./-]+",
+            lambda m: m.group(1) + format_cnpj(cnpj),
+            self.pages[index],
+            count=1,
+        )
+
+
+class MockPortalState:
+    def __init__(self, seeds, latency, jitter, error_rate, result_latency):
+        self.seeds = seeds
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.result_latency = result_latency
+        self.emitidas = {}
+        self.lock = threading.Lock()
+        self.stats = {"rpc": 0, "erros": 0, "certidoes": 0}
+
+    def delay(self, base):
+        time.sleep(max(0.0, random.uniform(base - self.jitter, base + self.jitter)))
+
+
+class MockPortalHandler(BaseHTTPRequestHandler):
+    server_version = "GPIMock/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8"):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == BASE_PATH:
+            self._send(200, LANDING_PAGE.replace("__BASE__", BASE_PATH))
+        elif url.path == BASE_PATH + "certidao":
+            self.state.delay(self.state.result_latency)
+            certidao_id = parse_qs(url.query).get("id", [""])[0]
+            with self.state.lock:
+                cnpj = self.state.emitidas.pop(certidao_id, None)
+            if cnpj is None:
+                self._send(404, "<html><body>Certidão não encontrada</body></html>")
+                return
+            with self.state.lock:
+                self.state.stats["certidoes"] += 1
+            self._send(200, self.state.seeds.for_cnpj(cnpj))
+        elif url.path == "/status":
+            with self.state.lock:
+                body = json.dumps(self.state.stats)
+            self._send(200, body, "application/json")
+        else:
+            self._send(404, "<html><body>Não encontrado</body></html>")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", errors="replace")
+        if url.path != BASE_PATH + "rpc":
+            self._send(404, "")
+            return
+        self.state.delay(self.state.latency)
+        with self.state.lock:
+            self.state.stats["rpc"] += 1
+        if random.random() < self.state.error_rate:
+            with self.state.lock:
+                self.state.stats["erros"] += 1
+            self._send(500, "//EX[\"Erro simulado do servidor\"]", "text/plain; charset=utf-8")
+            return
+        try:
+            payload = json.loads(body or "{}")
+        except ValueError:
+            self._send(400, "//EX[\"Requisição inválida\"]", "text/plain; charset=utf-8")
+            return
+        resposta = {"ok": True}
+        if payload.get("acao") == "emitir":
+            cnpj = re.sub(r"\D", "", str(payload.get("cnpj", "")))
+            if len(cnpj) != 14:
+                self._send(200, "//EX[\"CNPJ inválido\"]", "text/plain; charset=utf-8")
+                return
+            certidao_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.emitidas[certidao_id] = cnpj
+            resposta = {"id": certidao_id}
+        self._send(200, "//OK" + json.dumps(resposta), "text/plain; charset=utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portal GPI simulado para benchmarks do worker")
+    parser.add_argument("--host", default="127.0.0.1", help="Endereço de escuta")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta de escuta")
+    parser.add_argument("--latencia", type=float, default=0.5, help="Latência média de cada chamada RPC (segundos)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variação máxima da latência (segundos)")
+    parser.add_argument("--latencia-certidao", type=float, default=1.0, help="Latência da página da certidão (segundos)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração das chamadas RPC que falham (0 a 1)")
+    parser.add_argument("--certidoes", default=os.path.join("screenshots", "*_new_tab_html.html"), help="Glob das certidões salvas usadas como resposta")
+    parser.add_argument("--verbose", action="store_true", help="Registra cada requisição no console")
+    args = parser.parse_args()
+
+    seeds = CertidaoSeeds(args.certidoes)
+    server = ThreadingHTTPServer((args.host, args.porta), MockPortalHandler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    server.state = MockPortalState(
+        seeds, args.latencia, args.jitter, args.taxa_erro, args.latencia_certidao
+    )
+    print(f"Portal GPI simulado com {len(seeds.pages)} certidões ({len(seeds.by_cnpj)} CNPJs conhecidos)")
+    print(f"URL do portal: http://{args.host}:{args.porta}{BASE_PATH}?idPortal=mock")
+    print(f"Estatísticas: http://{args.host}:{args.porta}/status")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Encerrando portal simulado.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
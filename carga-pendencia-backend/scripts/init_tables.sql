@@ -40,14 +40,25 @@ CREATE TABLE IF NOT EXISTS fila_cnpj (
     error_message TEXT,
     user_id INTEGER,
     full_result TEXT,
+    timings JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Tempo de cada etapa da consulta ao portal (bancos criados antes da coluna)
+ALTER TABLE fila_cnpj ADD COLUMN IF NOT EXISTS timings JSONB;
+
+-- Reivindicação das tarefas pelos workers: dono, validade da reivindicação
+-- e última publicação no RabbitMQ
+ALTER TABLE fila_cnpj ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100);
+ALTER TABLE fila_cnpj ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE fila_cnpj ADD COLUMN IF NOT EXISTS enqueued_at TIMESTAMP WITH TIME ZONE;
+
 -- Create indices on Queue table
 CREATE INDEX IF NOT EXISTS idx_fila_cnpj_cnpj ON fila_cnpj(cnpj);
 CREATE INDEX IF NOT EXISTS idx_fila_cnpj_status ON fila_cnpj(status);
 CREATE INDEX IF NOT EXISTS idx_fila_cnpj_user_id ON fila_cnpj(user_id);
+CREATE INDEX IF NOT EXISTS idx_fila_cnpj_status_lease ON fila_cnpj(status, lease_expires_at);
 
 -- Create Ignore list table
 CREATE TABLE IF NOT EXISTS fila_cnpj_ignorados (
@@ -0,0 +1,58 @@
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+from app.services.chrome_profile import ChromeProfileTemplate
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    """
+    Modelo frio com WebService e PortalFlow falsos: o "Chrome" só cria o
+    user-data-dir, e close_driver passa por discard_for() como o real
+    """
+    monkeypatch.setenv("GPI_PROFILE_CACHE", "1")
+    template = ChromeProfileTemplate(
+        template_dir=str(tmp_path / "template"), clones_dir=str(tmp_path / "clones")
+    )
+    monkeypatch.setattr(ChromeProfileTemplate, "_instance", template)
+
+    class FakeDriver:
+        pass
+
+    class FakeWebService:
+        @staticmethod
+        def create_chrome_driver(headless, user_data_dir=None, use_profile_template=True):
+            os.makedirs(os.path.join(user_data_dir, "Default", "Cache"), exist_ok=True)
+            return FakeDriver()
+
+        @staticmethod
+        def close_driver(driver, owns_driver=True):
+            ChromeProfileTemplate.get_instance().discard_for(driver)
+
+    class FakePortalFlow:
+        def __init__(self, driver, cnpj):
+            pass
+
+        def run(self, until=None):
+            return {}
+
+    monkeypatch.setitem(sys.modules, "app.services.web_service", types.SimpleNamespace(WebService=FakeWebService))
+    monkeypatch.setitem(
+        sys.modules, "app.services.portal_flow", types.SimpleNamespace(PortalFlow=FakePortalFlow, FORM="form")
+    )
+    return template
+
+
+def test_clone_warms_cold_template_without_deadlock(profiles):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(path=profiles.clone()), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive(), "clone() travou aquecendo o modelo"
+    assert profiles.is_ready()
+    assert result["path"] and os.path.isdir(os.path.join(result["path"], "Default", "Cache"))
@@ -1,11 +1,35 @@
 import pika
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from app.models.cnpj import CNPJ
 from app.services.cnpj_service import CNPJService
+from app.services.driver_pool import DriverPool
+from app.services.multi_tab_service import MultiTabRunner
+from app.services.async_portal_service import AsyncPortalService
+from app.services.chrome_supervisor import ChromeSupervisor
+from app.services.chrome_profile import ChromeProfileTemplate
+from app.services.worker_metrics import WorkerMetrics
+from app.services.concurrency_controller import AdaptiveConcurrencyLimiter
+from app.services.portal_rate_limiter import PortalRateLimiter
+from app.services.worker_runtime import AsyncWorkerRuntime
+from app.services.task_cancellation import CancelledTasks, STATUS_CANCELLED, cancelled_result
+from app.services.queue_topology import (
+    QUEUE,
+    TaskPublisher,
+    declare_topology,
+    is_transient,
+    max_attempts,
+    retry_delay
+)
 from app.database.config import (
     get_supabase_client,
-    update_queue_item
+    update_queue_item,
+    claim_task,
+    release_for_retry,
+    renew_leases,
+    reap_expired_leases,
+    claim_stale_pending
 )
 import os
 import glob
@@ -20,10 +44,13 @@ import random
 import argparse
 import sys
 import threading
+import atexit
+import signal
 
 # Limitar a quantidade de workers simultâneos por instância do worker
 # Reduzir de 10 para 3 para evitar sobrecarga ao executar múltiplas instâncias
-executor = ThreadPoolExecutor(max_workers=3)
+MAX_WORKERS = 3
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
 # Função para calcular tempos de espera dinâmicos baseados no tamanho do batch
 def calculate_wait_time(batchsize):
@@ -72,12 +99,262 @@ WAIT_TIMES = calculate_wait_time(20)  # Valor padrão inicial
 print(f"Usando RabbitMQ em: {RABBITMQ_HOST}")
 print(f"Tempos de espera iniciais: {WAIT_TIMES}")
 
-# Lista de tarefas ignoradas (local)
-ignored_tasks = set()
+# Dono das tarefas reivindicadas por este processo e validade da reivindicação;
+# depois dela o reaper de qualquer worker devolve a tarefa à fila
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(os.getenv("GPI_LEASE_SECONDS", "900"))
+
+# Tarefas reivindicadas por este worker cujo resultado ainda não foi gravado;
+# a reivindicação de cada uma é renovada em background enquanto ela dura
+REIVINDICACOES = set()
+REIVINDICACOES_LOCK = threading.Lock()
+
+def reivindicar_tarefa(fila_id):
+    """
+    Reivindica a tarefa para este worker ('pendente' -> 'processando')
+    
+    Returns:
+        O registro da tarefa, ou None se outro worker já a pegou ou ela não está pendente
+    """
+    task = claim_task(fila_id, WORKER_ID, LEASE_SECONDS)
+    if task is None:
+        print(f"Tarefa {fila_id} já reivindicada por outro worker ou não está pendente. Ignorando.")
+        return None
+    with REIVINDICACOES_LOCK:
+        REIVINDICACOES.add(fila_id)
+    return task
+
+def liberar_reivindicacao(fila_id):
+    """
+    Para de renovar a reivindicação (resultado gravado ou tarefa devolvida)
+    """
+    with REIVINDICACOES_LOCK:
+        REIVINDICACOES.discard(fila_id)
+
+def renovar_reivindicacoes():
+    """
+    Thread que estende, a cada terço da lease, a reivindicação de todas as
+    tarefas em andamento: esperas por vaga, navegador e retentativas do fluxo
+    não fazem o reaper de outro worker devolver uma tarefa viva
+    """
+    intervalo = max(5, LEASE_SECONDS / 3)
+    while True:
+        time.sleep(intervalo)
+        with REIVINDICACOES_LOCK:
+            ativas = list(REIVINDICACOES)
+        if not ativas:
+            continue
+        perdidas = set(ativas) - set(renew_leases(ativas, WORKER_ID, LEASE_SECONDS))
+        if perdidas:
+            # O resultado dessas tarefas não será gravado (update_task_status é condicional ao dono)
+            print(f"[AVISO] Reivindicações perdidas para outro worker: {sorted(perdidas)}")
+            WorkerMetrics.get_instance().inc("leases_lost_total", len(perdidas))
+
+# SIGTERM (autoscaler, docker stop): parar de pegar tarefas, terminar as em
+# andamento e sair
+ENCERRANDO = threading.Event()
+
+def solicitar_encerramento(signum=None, frame=None):
+    """
+    Handler de SIGTERM: o worker termina as tarefas em andamento antes de
+    sair. Só marca o pedido; o consumo é interrompido pela própria thread da
+    conexão (acompanhar_prefetch) e o batch para de buscar tarefas.
+    """
+    if not ENCERRANDO.is_set():
+        ENCERRANDO.set()
+        print("Encerramento solicitado: terminando as tarefas em andamento antes de sair...")
+
+# Pool de navegadores compartilhado pelas tarefas (None = um Chrome novo por CNPJ)
+DRIVER_POOL = None
+
+def iniciar_pool_drivers(size):
+    """
+    Inicia o pool de navegadores Chrome aquecidos usado pelas tarefas.
+    Com GPI_PARK_SESSIONS=1 (padrão) cada navegador fica estacionado no
+    formulário de CNPJ entre as tarefas.
+    
+    Args:
+        size: Quantidade de navegadores no pool (0 desativa o pool)
+        
+    Returns:
+        O pool iniciado ou None se desativado
+    """
+    global DRIVER_POOL
+    if size <= 0:
+        print("Pool de navegadores desativado. Um Chrome novo será iniciado por CNPJ.")
+        return None
+    DRIVER_POOL = DriverPool(
+        size=size,
+        headless=True,
+        park=os.getenv("GPI_PARK_SESSIONS", "1") != "0"
+    )
+    DRIVER_POOL.start()
+    return DRIVER_POOL
+
+def encerrar_pool_drivers():
+    """
+    Fecha os navegadores do pool, se existir
+    """
+    global DRIVER_POOL
+    if DRIVER_POOL is not None:
+        DRIVER_POOL.shutdown()
+        DRIVER_POOL = None
+
+# Chrome único com várias abas (None = um navegador por tarefa)
+TAB_RUNNER = None
+
+def iniciar_navegador_abas(abas):
+    """
+    Inicia um único Chrome que processa vários CNPJs em abas simultâneas
+    
+    Args:
+        abas: Quantidade de abas simultâneas (0 desativa o modo multi-abas)
+        
+    Returns:
+        O MultiTabRunner iniciado ou None se desativado
+    """
+    global TAB_RUNNER
+    if abas <= 0:
+        return None
+    TAB_RUNNER = MultiTabRunner(tabs=abas, headless=True)
+    TAB_RUNNER.start()
+    return TAB_RUNNER
+
+def encerrar_navegador_abas():
+    """
+    Fecha o navegador multi-abas, se existir
+    """
+    global TAB_RUNNER
+    if TAB_RUNNER is not None:
+        TAB_RUNNER.shutdown()
+        TAB_RUNNER = None
+
+# Controle adaptativo de sessões simultâneas no portal (None = concorrência fixa)
+CONCURRENCY = None
+
+def iniciar_controle_concorrencia(inicial, maximo):
+    """
+    Inicia o controle AIMD: a quantidade de tarefas simultâneas no portal
+    começa em `inicial` e varia entre GPI_CONCURRENCY_MIN e `maximo` conforme
+    o p95 da latência e a taxa de erro/timeouts do portal
+    
+    Args:
+        inicial: Limite inicial de tarefas simultâneas
+        maximo: Limite máximo (0 desativa o controle; fica a concorrência fixa)
+        
+    Returns:
+        O AdaptiveConcurrencyLimiter ou None se desativado
+    """
+    global CONCURRENCY
+    if maximo <= 0:
+        CONCURRENCY = None
+        print(f"Concorrência fixa em {inicial} tarefas simultâneas.")
+        return None
+    CONCURRENCY = AdaptiveConcurrencyLimiter.from_env(inicial, maximo)
+    print(
+        f"Concorrência adaptativa: começa em {CONCURRENCY.limit}, "
+        f"entre {CONCURRENCY.min_limit} e {CONCURRENCY.max_limit} tarefas simultâneas "
+        f"(p95 alvo {CONCURRENCY.target_p95}s)."
+    )
+    return CONCURRENCY
+
+# Limite global de sessões por minuto, compartilhado entre workers (None = sem limite)
+RATE_LIMITER = None
+
+def iniciar_limite_portal():
+    """
+    Inicia o token bucket global do portal a partir de GPI_PORTAL_RPM e
+    GPI_RATE_BACKEND (file: workers desta máquina; rabbitmq: várias máquinas)
+    
+    Returns:
+        O PortalRateLimiter ou None se não houver limite
+    """
+    global RATE_LIMITER
+    RATE_LIMITER = PortalRateLimiter.from_env(RABBITMQ_HOST)
+    if RATE_LIMITER is not None:
+        print(f"Limite global do portal: {RATE_LIMITER.rpm:g} sessões por minuto.")
+    return RATE_LIMITER
+
+def aguardar_limite_portal():
+    """
+    Espera uma ficha do limite global antes de abrir uma sessão no portal
+    """
+    if RATE_LIMITER is not None:
+        RATE_LIMITER.acquire()
+
+# Resultado de uma tarefa que outro worker reivindicou antes
+NAO_REIVINDICADA = {"status": "nao_reivindicada"}
+# Resultado de uma tarefa que só conseguiu a vaga depois do SIGTERM: não é
+# reivindicada e a mensagem volta para a fila
+ADIADA_ENCERRAMENTO = {"status": "adiada_encerramento"}
+
+def executar_com_controle(consulta):
+    """
+    Executa a consulta ao portal dentro de uma vaga do controle de concorrência
+    e do limite global de sessões por minuto, informando a latência e o
+    resultado ao controle
+    """
+    if CONCURRENCY is None:
+        aguardar_limite_portal()
+        return consulta()
+    CONCURRENCY.acquire()
+    # A espera pela ficha não entra na latência medida
+    aguardar_limite_portal()
+    inicio = time.monotonic()
+    result = None
+    try:
+        result = consulta()
+        return result
+    finally:
+        if result is NAO_REIVINDICADA or result is ADIADA_ENCERRAMENTO:
+            CONCURRENCY.release_unused()
+        else:
+            CONCURRENCY.release_result(result, time.monotonic() - inicio)
+
+# Backend assíncrono (Playwright) e o event loop que conduz todas as suas sessões
+ASYNC_BACKEND = None
+ASYNC_LOOP = None
+
+def iniciar_backend_async(sessoes):
+    """
+    Inicia o backend assíncrono em um event loop dedicado (thread própria)
+    
+    Args:
+        sessoes: Quantidade máxima de sessões simultâneas do portal
+        
+    Returns:
+        O AsyncPortalService iniciado
+    """
+    global ASYNC_BACKEND, ASYNC_LOOP
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    backend = AsyncPortalService(max_sessions=sessoes, headless=True)
+    try:
+        asyncio.run_coroutine_threadsafe(backend.start(), loop).result()
+    except Exception:
+        loop.call_soon_threadsafe(loop.stop)
+        raise
+    ASYNC_BACKEND, ASYNC_LOOP = backend, loop
+    print(f"Backend assíncrono iniciado com até {sessoes} sessões em um único event loop.")
+    return backend
+
+def encerrar_backend_async():
+    """
+    Fecha o navegador do backend assíncrono e para o event loop, se existirem
+    """
+    global ASYNC_BACKEND, ASYNC_LOOP
+    if ASYNC_BACKEND is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(ASYNC_BACKEND.close(), ASYNC_LOOP).result(timeout=30)
+        except Exception as e:
+            print(f"Erro ao encerrar backend assíncrono: {e}")
+        ASYNC_LOOP.call_soon_threadsafe(ASYNC_LOOP.stop)
+        ASYNC_BACKEND, ASYNC_LOOP = None, None
 
 def should_ignore_task(fila_id):
     """
-    Verifica se uma tarefa deve ser ignorada
+    Verifica se uma tarefa foi cancelada (excluída pela API) em qualquer
+    momento desde que este worker assinou os cancelamentos
     
     Args:
         fila_id: ID da tarefa na fila
@@ -85,16 +362,16 @@ def should_ignore_task(fila_id):
     Returns:
         True se a tarefa deve ser ignorada, False caso contrário
     """
-    return fila_id in ignored_tasks
+    return CancelledTasks.get_instance().is_cancelled(fila_id)
 
 def add_to_ignore_list(fila_id):
     """
-    Adiciona uma tarefa à lista de ignorados
+    Adiciona uma tarefa aos cancelados deste worker
     
     Args:
         fila_id: ID da tarefa na fila
     """
-    ignored_tasks.add(fila_id)
+    CancelledTasks.get_instance().add([fila_id])
 
 def get_pending_tasks(limit=50):
     """
@@ -117,7 +394,7 @@ def get_pending_tasks(limit=50):
         print(f"[ERRO] Erro ao obter tarefas pendentes: {e}")
         return []
 
-def update_task_status(fila_id, status, resultado=None, status_divida=None, pdf_path=None, full_result=None):
+def update_task_status(fila_id, status, resultado=None, status_divida=None, pdf_path=None, full_result=None, timings=None, failures=None):
     """
     Atualiza o status de uma tarefa no banco de dados
     
@@ -128,6 +405,8 @@ def update_task_status(fila_id, status, resultado=None, status_divida=None, pdf_
         status_divida: Status da dívida (opcional)
         pdf_path: Caminho para o PDF (opcional)
         full_result: Resultado completo (opcional)
+        timings: Tempo de cada etapa da consulta ao portal (opcional)
+        failures: Tentativas que falharam (opcional)
         
     Returns:
         True se a atualização foi bem-sucedida, False caso contrário
@@ -147,8 +426,19 @@ def update_task_status(fila_id, status, resultado=None, status_divida=None, pdf_
         if full_result is not None:
             update_data["full_result"] = full_result
             
-        # Atualizar no banco
-        return update_queue_item(fila_id, update_data)
+        if timings is not None:
+            update_data["timings"] = timings
+            
+        if failures is not None:
+            update_data["failures"] = failures
+            
+        if status != "processando":
+            # Fim da reivindicação: o reaper não deve devolver a tarefa
+            update_data["lease_expires_at"] = None
+            
+        # Só grava se a tarefa ainda é deste worker: com a lease perdida, o
+        # resultado é do worker que a reivindicou depois
+        return update_queue_item(fila_id, update_data, worker_id=WORKER_ID)
     except Exception as e:
         print(f"[ERRO] Erro ao atualizar status da tarefa {fila_id}: {e}")
         return False
@@ -164,29 +454,88 @@ def verificar_tarefas_pendentes_lote(limit=50):
             print("[LOG] Nenhuma tarefa pendente encontrada.")
             return []
             
-        return [task["id"] for task in tasks]
+        # Os registros completos: nenhuma leitura extra por tarefa
+        return tasks
     except Exception as e:
         print(f"[ERRO] Erro ao verificar tarefas pendentes em lote: {e}")
         return []
 
+# Event loop reaproveitado por thread, em vez de um loop novo por tarefa
+_thread_state = threading.local()
+
+def loop_da_thread():
+    """
+    Event loop da thread atual, criado na primeira tarefa e reaproveitado
+    nas seguintes
+    """
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        _thread_state.loop = loop
+    return loop
+
+def cnpj_da_tarefa(task):
+    """
+    CNPJ com todos os campos disponíveis no registro da tarefa
+    """
+    return CNPJ(
+        cnpj=task['cnpj'],
+        razao_social=task.get('razao_social') or "",
+        municipio=task.get('municipio') or ""
+    )
+
+def processar_tarefa(fila_id):
+    """
+    Reivindica e consulta uma tarefa: a reivindicação só é feita depois da
+    vaga no controle de concorrência e da ficha do limite global, para que a
+    lease não corra enquanto a tarefa espera capacidade
+    
+    Returns:
+        Tupla (registro da tarefa, resultado); (None, NAO_REIVINDICADA) se
+        outro worker pegou a tarefa e (None, ADIADA_ENCERRAMENTO) se a vaga
+        só veio depois do SIGTERM
+    """
+    tarefa = {}
+    def _consultar():
+        if ENCERRANDO.is_set():
+            # Esperou a vaga durante o dreno: fica para outro worker
+            return ADIADA_ENCERRAMENTO
+        task = reivindicar_tarefa(fila_id)
+        if task is None:
+            return NAO_REIVINDICADA
+        tarefa.update(task)
+        if should_ignore_task(fila_id):
+            # Cancelada enquanto esperava a vaga
+            return cancelled_result(fila_id)
+        print(f"Processando CNPJ {task['cnpj']} com headless=True (fila_id={fila_id})")
+        return process_cnpj_on_website_sync((cnpj_da_tarefa(task), fila_id), headless=True)
+    result = executar_com_controle(_consultar)
+    return (tarefa or None), result
+
 def process_cnpj_on_website_sync(args, headless=True):
     cnpj_obj, fila_id = args
     try:
-        # Criar um novo loop de eventos para cada thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        if ASYNC_LOOP is not None:
+            # Todas as sessões rodam no event loop do backend assíncrono;
+            # esta thread apenas aguarda o resultado
+            return asyncio.run_coroutine_threadsafe(
+                process_cnpj_on_website_async(args, headless=headless),
+                ASYNC_LOOP
+            ).result()
         
-        # Passar os tempos de espera para o web_service
-        result = loop.run_until_complete(
+        # Passar os tempos de espera para o web_service; o navegador do pool
+        # só é emprestado se o caminho direto (HTTP) falhar
+        return loop_da_thread().run_until_complete(
             CNPJService.process_cnpj_on_website(
                 cnpj_obj, 
                 headless=headless, 
                 fila_id=fila_id,
-                wait_times=WAIT_TIMES  # Passar os tempos de espera configurados
+                wait_times=WAIT_TIMES,  # Passar os tempos de espera configurados
+                driver_pool=DRIVER_POOL,
+                tab_runner=TAB_RUNNER
             )
         )
-        loop.close()
-        return result
     except Exception as e:
         print(f"[ERRO] process_cnpj_on_website_sync falhou para CNPJ {cnpj_obj.cnpj}: {e}")
         print(traceback.format_exc())
@@ -196,76 +545,219 @@ def process_cnpj_on_website_sync(args, headless=True):
             "resultado": f"[ERRO] {str(e)}"
         }
 
-def processa_cnpj(fila_id):
-    try:
-        # Verificar se a tarefa ainda precisa ser processada (poderia ter sido pega por outro worker)
-        task = get_task_by_id(fila_id)
-        if not task or task.get("status") != "processando":
-            print(f"Tarefa {fila_id} não encontrada ou não está em processamento. Ignorando.")
-            return
+async def process_cnpj_on_website_async(args, headless=True):
+    cnpj_obj, fila_id = args
+    return await CNPJService.process_cnpj_on_website(
+        cnpj_obj,
+        headless=headless,
+        fila_id=fila_id,
+        wait_times=WAIT_TIMES,
+        async_backend=ASYNC_BACKEND
+    )
 
-        # Verificar se a tarefa está na lista de ignorados
+async def processar_tarefa_async(fila_id):
+    """
+    processar_tarefa no event loop atual com o backend assíncrono: vaga,
+    ficha e só então a reivindicação
+    
+    Returns:
+        Tupla (registro da tarefa, resultado); (None, NAO_REIVINDICADA) se
+        outro worker pegou a tarefa e (None, ADIADA_ENCERRAMENTO) se a vaga
+        só veio depois do SIGTERM
+    """
+    loop = asyncio.get_running_loop()
+    if CONCURRENCY is not None:
+        # Espera a vaga fora do event loop
+        await loop.run_in_executor(None, CONCURRENCY.acquire)
+    if RATE_LIMITER is not None:
+        await loop.run_in_executor(None, RATE_LIMITER.acquire)
+    inicio = time.monotonic()
+    task = None
+    result = None
+    try:
+        if ENCERRANDO.is_set():
+            result = ADIADA_ENCERRAMENTO
+            return None, result
+        task = await loop.run_in_executor(None, reivindicar_tarefa, fila_id)
+        if task is None:
+            result = NAO_REIVINDICADA
+            return None, result
         if should_ignore_task(fila_id):
-            print(f"Tarefa {fila_id} na lista de ignorados. Ignorando processamento.")
-            update_task_status(fila_id, "ignorado", "Tarefa ignorada pelo worker")
-            return
-
-        # Criar objeto CNPJ com todos os campos disponíveis
-        cnpj_obj = CNPJ(
-            cnpj=task['cnpj'],
-            razao_social=task.get('razao_social') or "",
-            municipio=task.get('municipio') or ""
-        )
-        # Garantir que headless=True
+            result = cancelled_result(fila_id)
+            return task, result
         print(f"Processando CNPJ {task['cnpj']} com headless=True (fila_id={fila_id})")
-        result = process_cnpj_on_website_sync((cnpj_obj, fila_id), headless=True)
-        print(f"==== RESULTADO DO WEBSERVICE (fila_id={fila_id}) ====")
-        print(result)
-        print("===============================")
-        
-        if not result:
-            status = "erro"
-            resultado = "[ERRO] Nenhum resultado retornado do WebService"
-            full_result = ""
-            print(f"[ERRO] WebService retornou None para fila_id={fila_id}")
-        elif result.get("status") == "error":
-            status = "erro"
-            resultado = f"[ERRO] Falha no site: {result.get('message', 'Sem detalhes')}"
-            full_result = result.get("full_result", "")
-        elif result.get("status") == "success":
-            status = "concluido"
-            if result.get("resultado"):
-                resultado = result.get("resultado")
-            elif result.get("status_divida"):
-                resultado = result.get("status_divida")
+        result = await process_cnpj_on_website_async((cnpj_da_tarefa(task), fila_id), headless=True)
+        return task, result
+    except Exception as e:
+        print(f"[ERRO] Backend assíncrono falhou para fila_id={fila_id}: {e}")
+        result = {
+            "status": "error",
+            "message": f"Falha no processamento: {str(e)}",
+            "resultado": f"[ERRO] {str(e)}"
+        }
+        return task, result
+    finally:
+        if CONCURRENCY is not None:
+            if result is NAO_REIVINDICADA or result is ADIADA_ENCERRAMENTO:
+                CONCURRENCY.release_unused()
             else:
-                resultado = "Processado com sucesso, sem retorno específico"
-            
-            if not resultado:
-                resultado = "Resultado vazio"
-            
-            if len(resultado) > 2000:
-                resultado = resultado[:1997] + "..."
-                
-            full_result = result.get("full_result", "")
+                CONCURRENCY.release_result(result, time.monotonic() - inicio)
+
+def processar_tarefa_batch(args):
+    """
+    Tarefa do batch: reivindicada só quando a consulta pode começar
+    """
+    return processar_tarefa(args[1])[1]
+
+async def processar_tarefa_batch_async(args):
+    """
+    processar_tarefa_batch no event loop do backend assíncrono
+    """
+    return (await processar_tarefa_async(args[1]))[1]
+
+def agendar_retentativa(fila_id, result, failures=0):
+    """
+    Falha transitória (timeout, navegador ou conexão caídos, certidão que não
+    carregou, exceção): devolve a tarefa à fila com atraso exponencial pelas
+    filas de retentativa ou, esgotadas as tentativas, publica na DLQ
+    
+    Args:
+        fila_id: ID da tarefa na fila
+        result: Resultado da consulta que falhou (ou None)
+        failures: Falhas anteriores registradas na tarefa
+        
+    Returns:
+        "retentativa", "dlq" ou None se a falha não é transitória
+    """
+    if not is_transient(result):
+        return None
+    falhas = (failures or 0) + 1
+    motivo = str((result or {}).get("error") or (result or {}).get("message") or "Nenhum resultado retornado")
+    publisher = TaskPublisher.get_instance(RABBITMQ_HOST)
+    metrics = WorkerMetrics.get_instance()
+    if falhas < max_attempts():
+        atraso = retry_delay(falhas)
+        if not release_for_retry(fila_id, WORKER_ID, falhas, motivo, atraso):
+            return None
+        try:
+            publisher.schedule_retry(fila_id, falhas)
+        except Exception as e:
+            # A tarefa está pendente: o polling a republica
+            print(f"[ERRO] Falha ao agendar retentativa de fila_id={fila_id}: {e}")
+        metrics.inc("task_retries_total")
+        print(f"Falha transitória em fila_id={fila_id} ({motivo}); tentativa {falhas + 1} em {atraso}s.")
+        return "retentativa"
+    try:
+        publisher.dead_letter(fila_id, falhas, motivo)
+    except Exception as e:
+        print(f"[ERRO] Falha ao publicar fila_id={fila_id} na DLQ: {e}")
+    metrics.inc("task_dead_lettered_total")
+    print(f"fila_id={fila_id} falhou {falhas} vezes; enviada para a DLQ.")
+    return "dlq"
+
+def registrar_resultado(fila_id, result, failures=0):
+    """
+    Converte o resultado da consulta no status da tarefa e grava no banco;
+    falhas transitórias voltam para a fila com atraso
+    
+    Args:
+        fila_id: ID da tarefa na fila
+        result: Dicionário retornado pela consulta ao portal (ou None)
+        failures: Falhas anteriores registradas na tarefa
+        
+    Returns:
+        Status gravado ("concluido", "erro", "pendente" quando há retentativa
+        ou "cancelado" quando a tarefa foi excluída)
+    """
+    print(f"==== RESULTADO DO WEBSERVICE (fila_id={fila_id}) ====")
+    print(result)
+    print("===============================")
+    
+    if result and result.get("status") == STATUS_CANCELLED:
+        # O registro foi excluído: nada a gravar nem a tentar de novo
+        WorkerMetrics.get_instance().inc("tasks_cancelled_total")
+        print(f"Tarefa {fila_id} cancelada durante a consulta; sessão interrompida.")
+        return "cancelado"
+    
+    if not result:
+        status = "erro"
+        resultado = "[ERRO] Nenhum resultado retornado do WebService"
+        full_result = ""
+        print(f"[ERRO] WebService retornou None para fila_id={fila_id}")
+    elif result.get("status") == "error":
+        status = "erro"
+        resultado = f"[ERRO] Falha no site: {result.get('message', 'Sem detalhes')}"
+        full_result = result.get("full_result", "")
+    elif result.get("status") == "success":
+        status = "concluido"
+        if result.get("resultado"):
+            resultado = result.get("resultado")
+        elif result.get("status_divida"):
+            resultado = result.get("status_divida")
         else:
-            status = "erro"
-            resultado = "[ERRO] Status desconhecido retornado pelo WebService"
-            full_result = str(result)
-            
-        # Atualizar status da tarefa no banco
-        status_divida = result.get("status_divida") if result else None
-        pdf_path = next(iter(result.get("screenshots", [])), None) if result else None
-            
-        update_task_status(
-            fila_id, 
-            status, 
-            resultado, 
-            status_divida, 
-            pdf_path, 
-            full_result
-        )
+            resultado = "Processado com sucesso, sem retorno específico"
+        
+        if not resultado:
+            resultado = "Resultado vazio"
+        
+        if len(resultado) > 2000:
+            resultado = resultado[:1997] + "..."
             
+        full_result = result.get("full_result", "")
+    else:
+        status = "erro"
+        resultado = "[ERRO] Status desconhecido retornado pelo WebService"
+        full_result = str(result)
+        
+    falhas = None
+    if status == "erro":
+        retentativa = agendar_retentativa(fila_id, result, failures)
+        if retentativa == "retentativa":
+            return "pendente"
+        if retentativa == "dlq":
+            falhas = (failures or 0) + 1
+            resultado = f"{resultado} (após {falhas} tentativas)"
+        
+    # Atualizar status da tarefa no banco
+    status_divida = result.get("status_divida") if result else None
+    pdf_path = next(iter(result.get("screenshots", [])), None) if result else None
+    timings = result.get("timings") if result else None
+    if timings and result.get("flow"):
+        # Estados alcançados e tentativas por etapa do PortalFlow
+        timings["flow"] = result["flow"]
+    if timings:
+        print(f"Tempos por etapa (fila_id={fila_id}): {timings}")
+        
+    update_task_status(
+        fila_id, 
+        status, 
+        resultado, 
+        status_divida, 
+        pdf_path, 
+        full_result,
+        timings,
+        falhas
+    )
+    return status
+
+def processa_cnpj(fila_id):
+    """
+    Reivindica a tarefa quando houver capacidade, consulta o portal e grava o resultado
+    
+    Args:
+        fila_id: ID da tarefa na fila
+        
+    Returns:
+        False se a tarefa não foi consultada por causa do SIGTERM e a
+        mensagem deve voltar para a fila
+    """
+    try:
+        task, result = processar_tarefa(fila_id)
+        if result is ADIADA_ENCERRAMENTO:
+            return False
+        if task is None:
+            return
+        status = registrar_resultado(fila_id, result, task.get("failures") or 0)
         print(f"CNPJ {task['cnpj']} processado com status: {status}")
     except Exception as e:
         print(f"[ERRO] Erro ao processar CNPJ de fila_id={fila_id}: {e}")
@@ -283,74 +775,208 @@ def processa_cnpj(fila_id):
         except Exception as update_error:
             print(f"[ERRO FATAL] Não foi possível atualizar status da tarefa no banco: {update_error}")
 
-def callback(ch, method, properties, body):
+def confirmar_mensagem(connection, ch, delivery_tag, ack=True, requeue=False):
+    """
+    Agenda o ack (ou nack) na thread da conexão: o canal do BlockingConnection
+    não é thread-safe e não pode ser usado pelas threads das tarefas
+    
+    Args:
+        connection: BlockingConnection dona do canal
+        ch: Canal em que a mensagem foi recebida
+        delivery_tag: Delivery tag da mensagem
+        ack: True confirma; False rejeita
+        requeue: No nack, devolve a mensagem à fila para outro worker
+    """
+    def _confirmar():
+        if not ch.is_open:
+            # O broker já devolveu a mensagem à fila quando o canal caiu
+            print(f"[AVISO] Canal fechado; mensagem {delivery_tag} será reentregue pelo RabbitMQ.")
+            return
+        if ack:
+            ch.basic_ack(delivery_tag=delivery_tag)
+            WorkerMetrics.get_instance().inc("amqp_acks_total")
+        else:
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+            WorkerMetrics.get_instance().inc("amqp_nacks_total")
     try:
-        fila_id = int(body.decode())
-        print(f" [x] Recebido {fila_id}")
-        
-        # Verificar se a tarefa está na lista de ignorados
+        connection.add_callback_threadsafe(_confirmar)
+    except Exception as e:
+        print(f"[ERRO] Falha ao agendar confirmação da mensagem {delivery_tag}: {e}")
+
+def processa_mensagem(connection, ch, delivery_tag, fila_id):
+    """
+    Processa a mensagem numa thread do executor; a confirmação volta para a
+    thread da conexão
+    """
+    devolver = False
+    try:
+        # Tarefa cancelada enquanto esperava na fila: descartada sem ir ao banco
         if should_ignore_task(fila_id):
-            print(f"Tarefa {fila_id} na lista de ignorados. Ignorando processamento e confirmando recebimento.")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            print(f"Tarefa {fila_id} cancelada. Ignorando processamento e confirmando recebimento.")
+            WorkerMetrics.get_instance().inc("tasks_cancelled_total")
             return
             
-        # Verifica se o fila_id existe e está com status 'pendente' ou 'processando'
-        task = get_task_by_id(fila_id)
-        if not task or (task.get("status") != "pendente" and task.get("status") != "processando"):
-            print(f"Tarefa {fila_id} não encontrada, não está pendente ou não está em processamento. Confirmando recebimento.")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        # Uma única leitura: a reivindicação condicional já devolve a tarefa,
+        # e só um worker a consegue
+        devolver = processa_cnpj(fila_id) is False
+    except Exception as e:
+        print(f"[ERRO] Thread de processamento falhou para fila_id={fila_id}: {str(e)}")
+        # Tentar marcar como erro no banco
+        try:
+            update_task_status(
+                fila_id, 
+                "erro", 
+                f"[ERRO CRÍTICO] Falha na thread de processamento: {str(e)}"
+            )
+        except Exception as db_error:
+            print(f"[ERRO FATAL] Falha ao atualizar status para erro no banco para fila_id={fila_id}: {str(db_error)}")
+    finally:
+        liberar_reivindicacao(fila_id)
+        if devolver:
+            # A vaga só veio depois do SIGTERM: outro worker consulta a tarefa
+            print(f"Encerrando: fila_id={fila_id} devolvido à fila sem ser consultado.")
+            confirmar_mensagem(connection, ch, delivery_tag, ack=False, requeue=True)
+        else:
+            # Mesmo com falha, confirma o recebimento para não reprocessar
+            confirmar_mensagem(connection, ch, delivery_tag)
+
+# Tarefas do modo fila submetidas ao executor e ainda não concluídas
+TAREFAS_FILA = set()
+
+def callback(ch, method, properties, body):
+    # Roda na thread da conexão: só despacha a mensagem, para que nenhuma
+    # chamada ao Supabase ou ao portal atrase os heartbeats
+    try:
+        fila_id = int(body.decode())
+    except Exception as e:
+        print(f"[ERRO] Mensagem inválida na fila ({body!r}): {e}")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    print(f" [x] Recebido {fila_id}")
+    if should_ignore_task(fila_id):
+        # Cancelada enquanto esperava na fila: nem ocupa uma thread
+        print(f"Tarefa {fila_id} cancelada. Descartando mensagem.")
+        WorkerMetrics.get_instance().inc("tasks_cancelled_total")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    if ENCERRANDO.is_set():
+        # Entregue antes do cancelamento do consumo: fica para outro worker
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        return
+    try:
+        future = executor.submit(processa_mensagem, ch.connection, ch, method.delivery_tag, fila_id)
+        TAREFAS_FILA.add(future)
+        future.add_done_callback(TAREFAS_FILA.discard)
+    except RuntimeError as e:
+        # Executor encerrado: a mensagem volta à fila para outro worker
+        print(f"[ERRO] Não foi possível iniciar fila_id={fila_id}: {e}. Devolvendo à fila.")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+def capacidade_atual():
+    """
+    Tarefas que o worker consegue processar agora: o limite do controle
+    adaptativo ou, com a concorrência fixa, as threads do executor
+    """
+    if CONCURRENCY is not None:
+        return CONCURRENCY.limit
+    return executor._max_workers
+
+def acompanhar_prefetch(connection, channel, prefetch, interval=5):
+    """
+    Reajusta o prefetch do canal à capacidade atual do worker, para que as
+    mensagens excedentes fiquem na fila para os outros workers em vez de
+    esperar no buffer local. Roda na thread da conexão via call_later, que
+    também interrompe o consumo depois de um SIGTERM.
+    """
+    def _ajustar():
+        nonlocal prefetch
+        if not channel.is_open:
             return
-            
-        # Atualizar status para 'processando' se estiver 'pendente'
-        if task.get("status") == "pendente":
-            update_task_status(fila_id, "processando")
-            
-        def task():
-            try:
-                processa_cnpj(fila_id)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            except Exception as e:
-                print(f"[ERRO] Thread de processamento falhou para fila_id={fila_id}: {str(e)}")
-                # Mesmo com falha, confirma o recebimento para não reprocessar
-                try:
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                except Exception as ack_error:
-                    print(f"[ERRO] Falha ao confirmar recebimento para fila_id={fila_id}: {str(ack_error)}")
-                # Tentar marcar como erro no banco
-                try:
-                    update_task_status(
-                        fila_id, 
-                        "erro", 
-                        f"[ERRO CRÍTICO] Falha na thread de processamento: {str(e)}"
-                    )
-                except Exception as db_error:
-                    print(f"[ERRO FATAL] Falha ao atualizar status para erro no banco para fila_id={fila_id}: {str(db_error)}")
-        
-        # Executa o processamento em uma thread separada
-        executor.submit(task)
-        
+        if ENCERRANDO.is_set():
+            channel.stop_consuming()
+            return
+        capacidade = max(1, capacidade_atual())
+        if capacidade != prefetch:
+            channel.basic_qos(prefetch_count=capacidade)
+            print(f"Prefetch ajustado de {prefetch} para {capacidade} mensagens.")
+            prefetch = capacidade
+        WorkerMetrics.get_instance().set("amqp_prefetch", prefetch)
+        connection.call_later(interval, _ajustar)
+    connection.call_later(interval, _ajustar)
+
+async def processa_mensagem_async(body):
+    """
+    Handler do runtime assíncrono: mesmas verificações do callback síncrono,
+    com as chamadas ao Supabase e ao Selenium fora do event loop e o backend
+    assíncrono conduzido no próprio loop. Retorna True para devolver a
+    mensagem à fila
+    """
+    loop = asyncio.get_running_loop()
+    fila_id = int(body.decode())
+    print(f" [x] Recebido {fila_id}")
+    
+    if should_ignore_task(fila_id):
+        print(f"Tarefa {fila_id} cancelada. Ignorando processamento e confirmando recebimento.")
+        WorkerMetrics.get_instance().inc("tasks_cancelled_total")
+        return
+    
+    try:
+        if ASYNC_BACKEND is not None:
+            task, result = await processar_tarefa_async(fila_id)
+        else:
+            # O Selenium bloqueia: roda numa thread do executor, com o event loop dela
+            task, result = await loop.run_in_executor(None, processar_tarefa, fila_id)
+        if result is ADIADA_ENCERRAMENTO:
+            # O runtime devolve a mensagem à fila
+            print(f"Encerrando: fila_id={fila_id} devolvido à fila sem ser consultado.")
+            return True
+        if task is None:
+            return
+        status = await loop.run_in_executor(
+            None, registrar_resultado, fila_id, result, task.get("failures") or 0
+        )
+        print(f"CNPJ {task['cnpj']} processado com status: {status}")
     except Exception as e:
-        print(f"[ERRO] Callback falhou: {str(e)}")
+        print(f"[ERRO] Erro ao processar CNPJ de fila_id={fila_id}: {e}")
+        print(traceback.format_exc())
         try:
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as ack_error:
-            print(f"[ERRO] Falha ao confirmar recebimento após erro: {str(ack_error)}")
+            await loop.run_in_executor(
+                None,
+                update_task_status,
+                fila_id,
+                "erro",
+                f"[ERRO] Exceção no processamento: {str(e)}",
+                None,
+                None,
+                traceback.format_exc()
+            )
+        except Exception as update_error:
+            print(f"[ERRO FATAL] Não foi possível atualizar status da tarefa no banco: {update_error}")
+    finally:
+        liberar_reivindicacao(fila_id)
 
-def connect_to_rabbitmq():
+def connect_to_rabbitmq(prefetch=10):
+    # Heartbeats são respondidos pela thread da conexão, que não fica
+    # bloqueada durante as consultas ao portal
+    heartbeat = int(os.getenv("GPI_AMQP_HEARTBEAT", "60"))
     retry_count = 0
     max_retries = 10
     retry_delay = 5
     
     while retry_count < max_retries:
         try:
-            connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-            channel = connection.channel()
-            channel.queue_declare(queue='fila_cnpj')
-            channel.queue_declare(queue='fila_cnpj_ignorados', durable=True)
-            channel.basic_qos(prefetch_count=10)  # Aumentar o prefetch para melhor throughput
+            connection = pika.BlockingConnection(pika.ConnectionParameters(
+                host=RABBITMQ_HOST,
+                heartbeat=heartbeat,
+                blocked_connection_timeout=300
+            ))
+            # Fila durável, filas de retentativa, DLQ e exchange de cancelamentos
+            channel = declare_topology(connection)
+            # Só as mensagens que o worker consegue processar já; o resto fica para os outros
+            channel.basic_qos(prefetch_count=prefetch)
             
             # Consumir mensagens da fila
-            channel.basic_consume(queue='fila_cnpj', on_message_callback=callback)
+            channel.basic_consume(queue=QUEUE, on_message_callback=callback)
             
             print(' [*] Aguardando mensagens. Para sair pressione CTRL+C')
             
@@ -369,40 +995,61 @@ def connect_to_rabbitmq():
             print(f"Erro inesperado ao conectar ao RabbitMQ: {e}")
             return None, None
 
-def polling_reenfileira_pendentes(interval=60, limit=30):
+def polling_reenfileira_pendentes(interval=60, limit=30, stale_seconds=600):
     """
-    Thread que periodicamente busca pendentes no banco e reenfileira no RabbitMQ
+    Thread que periodicamente devolve à fila as tarefas com reivindicação
+    expirada (worker morto) e republica no RabbitMQ as pendentes que não são
+    publicadas há `stale_seconds`. Cada tarefa é marcada no banco de forma
+    condicional, então só um dos workers a republica.
     """
-    print(f"[Polling] Iniciando polling inteligente de pendentes a cada {interval}s...")
+    print(f"[Polling] Iniciando reaper e republicação de pendentes a cada {interval}s...")
     while True:
         try:
-            # Conectar ao RabbitMQ (nova conexão para thread)
-            connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-            channel = connection.channel()
-            channel.queue_declare(queue='fila_cnpj')
-
-            # Buscar pendentes no banco
-            pendentes = get_pending_tasks(limit=limit)
-            print(f"[Polling] Encontrados {len(pendentes)} pendentes no banco.")
-            for task in pendentes:
-                fila_id = task["id"]
-                # Só reenfileira se não estiver processando
-                if task.get("status") == "pendente":
-                    # Publica na fila
-                    channel.basic_publish(
-                        exchange='',
-                        routing_key='fila_cnpj',
-                        body=str(fila_id)
-                    )
-                    print(f"[Polling] Reenfileirou pendente ID {fila_id} no RabbitMQ.")
-                    # Marca como processando para evitar flood
-                    update_task_status(fila_id, "processando")
-            connection.close()
+            devolvidas = reap_expired_leases(limit=limit)
+            republicar = devolvidas + [
+                fila_id for fila_id in claim_stale_pending(limit=limit, stale_seconds=stale_seconds)
+                if fila_id not in devolvidas
+            ]
+            if republicar:
+                publisher = TaskPublisher.get_instance(RABBITMQ_HOST)
+                for fila_id in republicar:
+                    publisher.publish(fila_id)
+                WorkerMetrics.get_instance().inc("leases_reaped_total", len(devolvidas))
+                print(
+                    f"[Polling] Republicadas {len(republicar)} tarefas "
+                    f"({len(devolvidas)} com reivindicação expirada): {republicar}"
+                )
         except Exception as e:
             print(f"[Polling] Erro no polling de pendentes: {e}")
         time.sleep(interval)
 
-def modo_batch(batchsize=30, workers=2):
+def registrar_resultado_batch(cnpj_obj, fila_id, result, failures=0):
+    """
+    Grava no banco o resultado de uma tarefa do batch assim que ela termina
+    (registrar_resultado, sem deixar uma falha de gravação parar o lote)
+    
+    Args:
+        cnpj_obj: CNPJ da tarefa
+        fila_id: ID da tarefa na fila
+        result: Resultado da consulta (NAO_REIVINDICADA se outro worker pegou a tarefa)
+        failures: Falhas anteriores registradas na tarefa
+    """
+    if result is NAO_REIVINDICADA or result is ADIADA_ENCERRAMENTO:
+        # Outro worker está com a tarefa, ou ela segue pendente após o SIGTERM
+        return
+    try:
+        status = registrar_resultado(fila_id, result, failures)
+        print(f"CNPJ {cnpj_obj.cnpj} (fila_id={fila_id}) processado em batch com status: {status}")
+    except Exception as e:
+        print(f"[ERRO] Falha ao atualizar status da tarefa {fila_id} após processamento em batch: {e}")
+
+def modo_batch(batchsize=30, workers=2, pool_size=None, abas=0, backend="selenium", sessoes=10, concorrencia_max=None):
+    """
+    Processa até `batchsize` tarefas pendentes em fluxo contínuo: cada
+    resultado é gravado no banco assim que sai, e cada vaga liberada recebe
+    a próxima pendente (buscando mais no banco quando preciso), sem esperar
+    as tarefas mais lentas do lote
+    """
     global WAIT_TIMES
     
     # Ajustar os tempos de espera com base no tamanho do batch
@@ -416,103 +1063,156 @@ def modo_batch(batchsize=30, workers=2):
         print(f"⚠️ Número de workers limitado a {max_safe_workers} para evitar sobrecarga (solicitado: {workers})")
     
     print(f"Verificando até {batchsize} tarefas pendentes...")
-    ids_pendentes = verificar_tarefas_pendentes_lote(batchsize)
+    pendentes = verificar_tarefas_pendentes_lote(batchsize)
     
-    if not ids_pendentes:
+    if not pendentes:
         print("Nenhuma tarefa pendente encontrada.")
         return
         
-    print(f"Encontradas {len(ids_pendentes)} tarefas pendentes.")
+    print(f"Encontradas {len(pendentes)} tarefas pendentes.")
     
-    # Preparar lista de objetos CNPJ e IDs para processamento
-    tasks = []
-    for fila_id in ids_pendentes:
-        try:
-            task = get_task_by_id(fila_id)
-            if not task:
-                print(f"Tarefa com ID {fila_id} não encontrada no banco. Ignorando.")
+    # Tarefas ainda não iniciadas (cada uma é reivindicada só quando sua
+    # consulta começa) e todas as já vistas neste batch
+    proximas = deque()
+    vistas = set()
+    falhas_anteriores = {}
+    
+    def enfileirar(registros):
+        novas = 0
+        for task in registros:
+            fila_id = task["id"]
+            if fila_id in vistas or len(vistas) >= batchsize:
                 continue
-                
-            cnpj_obj = CNPJ(
-                cnpj=task['cnpj'],
-                razao_social=task.get('razao_social') or "",
-                municipio=task.get('municipio') or ""
-            )
-            
-            tasks.append((cnpj_obj, fila_id))
-        except Exception as e:
-            print(f"Erro ao preparar tarefa {fila_id} para processamento: {e}")
-            
-    if not tasks:
+            vistas.add(fila_id)
+            falhas_anteriores[fila_id] = task.get("failures") or 0
+            try:
+                cnpj_obj = CNPJ(
+                    cnpj=task['cnpj'],
+                    razao_social=task.get('razao_social') or "",
+                    municipio=task.get('municipio') or ""
+                )
+                proximas.append((cnpj_obj, fila_id))
+                novas += 1
+            except Exception as e:
+                print(f"Erro ao preparar tarefa {fila_id} para processamento: {e}")
+        return novas
+    
+    enfileirar(pendentes)
+    if not proximas:
         print("Nenhuma tarefa válida para processar.")
         return
-        
-    print(f"Processando {len(tasks)} tarefas em modo batch com {max_safe_workers} workers...")
     
-    # Processar as tarefas com limite de workers
-    with ThreadPoolExecutor(max_workers=max_safe_workers) as ex:
-        batch_results = []
-        for result in ex.map(lambda args: process_cnpj_on_website_sync(args, headless=True), tasks):
-            batch_results.append(result)
-    
-    print(f"Processamento em batch concluído. Resultados: {len(batch_results)} tarefas processadas.")
+    if backend == "async":
+        # Um único event loop conduz todas as sessões; nenhuma thread por navegador
+        iniciar_controle_concorrencia(min(max_safe_workers, sessoes), sessoes if concorrencia_max is None else min(concorrencia_max, sessoes))
+        iniciar_backend_async(sessoes)
+        vagas = sessoes
+        ex = None
+        submeter = lambda args: asyncio.run_coroutine_threadsafe(processar_tarefa_batch_async(args), ASYNC_LOOP)
+        print(f"Processando até {batchsize} tarefas em modo batch com até {sessoes} sessões assíncronas...")
+    else:
+        if abas > 0:
+            # Um único Chrome com uma aba por tarefa em andamento; as threads só aguardam as abas
+            max_safe_workers = abas
+            maximo = abas if concorrencia_max is None else min(concorrencia_max, abas)
+            iniciar_controle_concorrencia(max_safe_workers, maximo)
+            iniciar_navegador_abas(abas)
+        else:
+            # O controle adaptativo pode passar dos workers iniciais até o máximo
+            maximo = max_safe_workers * 2 if concorrencia_max is None else concorrencia_max
+            iniciar_controle_concorrencia(max_safe_workers, maximo)
+            # Um navegador aquecido por vaga, reaproveitado entre as tarefas do batch
+            iniciar_pool_drivers(max(max_safe_workers, maximo) if pool_size is None else pool_size)
+        # Uma thread por vaga possível; o controle adaptativo decide quantas
+        # consultam o portal ao mesmo tempo
+        vagas = max(max_safe_workers, CONCURRENCY.max_limit if CONCURRENCY else 0)
+        ex = ThreadPoolExecutor(max_workers=vagas)
+        submeter = lambda args: ex.submit(processar_tarefa_batch, args)
+        print(f"Processando até {batchsize} tarefas em modo batch com {max_safe_workers} workers...")
     
-    # Atualizar o status das tarefas no banco
-    for i, (cnpj_obj, fila_id) in enumerate(tasks):
-        try:
-            result = batch_results[i] if i < len(batch_results) else None
-            
-            if not result:
-                status = "erro"
-                resultado = "[ERRO] Nenhum resultado retornado do processamento em batch"
-                full_result = ""
-            elif result.get("status") == "error":
-                status = "erro"
-                resultado = f"[ERRO] Falha no site: {result.get('message', 'Sem detalhes')}"
-                full_result = result.get("full_result", "")
-            elif result.get("status") == "success":
-                status = "concluido"
-                resultado = result.get("resultado") or result.get("status_divida") or "Processado com sucesso, sem retorno específico"
-                if len(resultado) > 2000:
-                    resultado = resultado[:1997] + "..."
-                full_result = result.get("full_result", "")
-            else:
-                status = "erro"
-                resultado = "[ERRO] Status desconhecido retornado pelo processamento em batch"
-                full_result = str(result)
-                
-            # Atualizar status da tarefa no banco
-            status_divida = result.get("status_divida") if result else None
-            pdf_path = next(iter(result.get("screenshots", [])), None) if result else None
-                
-            update_task_status(
-                fila_id, 
-                status, 
-                resultado, 
-                status_divida, 
-                pdf_path, 
-                full_result
-            )
-                
-            print(f"CNPJ {cnpj_obj.cnpj} (fila_id={fila_id}) processado em batch com status: {status}")
-        except Exception as e:
-            print(f"[ERRO] Falha ao atualizar status da tarefa {fila_id} após processamento em batch: {e}")
+    em_andamento = {}
+    concluidas = 0
+    banco_esgotado = False
+    try:
+        while True:
+            # Mantém todas as vagas ocupadas (no SIGTERM, só termina as em andamento)
+            while len(em_andamento) < vagas and not ENCERRANDO.is_set():
+                if not proximas and not banco_esgotado and len(vistas) < batchsize:
+                    # Inclui as já vistas no limite, que podem voltar a 'pendente' numa retentativa
+                    falta = batchsize - len(vistas)
+                    banco_esgotado = enfileirar(get_pending_tasks(limit=falta + len(vistas))) == 0
+                if not proximas:
+                    break
+                args = proximas.popleft()
+                em_andamento[submeter(args)] = args
+            if not em_andamento:
+                break
+            prontas, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+            for future in prontas:
+                cnpj_obj, fila_id = em_andamento.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[ERRO] Tarefa {fila_id} do batch falhou: {e}")
+                    result = {
+                        "status": "error",
+                        "message": f"Falha no processamento: {str(e)}",
+                        "resultado": f"[ERRO] {str(e)}"
+                    }
+                registrar_resultado_batch(cnpj_obj, fila_id, result, falhas_anteriores.get(fila_id, 0))
+                liberar_reivindicacao(fila_id)
+                concluidas += 1
+    finally:
+        if ex is not None:
+            ex.shutdown(wait=True)
+        encerrar_pool_drivers()
+        encerrar_navegador_abas()
+        encerrar_backend_async()
     
+    print(f"Processamento em batch concluído. Resultados: {concluidas} tarefas processadas.")
+    print(f"Métricas do worker: {WorkerMetrics.get_instance().snapshot()}")
     print("Processamento em batch completo!")
 
-def modo_fila():
+def modo_fila(pool_size=None, abas=0, backend="selenium", sessoes=10, concorrencia_max=None):
+    global executor
     print("Iniciando worker no modo fila...")
+    if backend == "async":
+        # As threads do executor só aguardam as sessões do event loop assíncrono
+        executor = ThreadPoolExecutor(max_workers=sessoes)
+        iniciar_controle_concorrencia(min(MAX_WORKERS, sessoes), sessoes if concorrencia_max is None else min(concorrencia_max, sessoes))
+        iniciar_backend_async(sessoes)
+    elif abas > 0:
+        # Um único Chrome com uma aba por tarefa em andamento
+        executor = ThreadPoolExecutor(max_workers=abas)
+        iniciar_controle_concorrencia(min(MAX_WORKERS, abas), abas if concorrencia_max is None else min(concorrencia_max, abas))
+        iniciar_navegador_abas(abas)
+    else:
+        # O controle adaptativo começa em MAX_WORKERS e pode dobrar; uma
+        # thread e um navegador aquecido por vaga possível
+        maximo = MAX_WORKERS * 2 if concorrencia_max is None else concorrencia_max
+        iniciar_controle_concorrencia(MAX_WORKERS, maximo)
+        vagas = max(MAX_WORKERS, maximo)
+        executor = ThreadPoolExecutor(max_workers=vagas)
+        iniciar_pool_drivers(vagas if pool_size is None else pool_size)
     # Iniciar polling inteligente em thread paralela
     polling_thread = threading.Thread(target=polling_reenfileira_pendentes, args=(60, 30), daemon=True)
     polling_thread.start()
     # Conectar ao RabbitMQ
-    connection, channel = connect_to_rabbitmq()
+    # Prefetch igual à capacidade atual, acompanhando o controle adaptativo
+    prefetch = capacidade_atual()
+    connection, channel = connect_to_rabbitmq(prefetch=prefetch)
     if not connection or not channel:
         print("Falha ao conectar ao RabbitMQ. Encerrando worker.")
+        encerrar_pool_drivers()
+        encerrar_navegador_abas()
+        encerrar_backend_async()
         return
+    acompanhar_prefetch(connection, channel, prefetch)
     try:
         # Bloquear e consumir mensagens da fila
         channel.start_consuming()
+        if ENCERRANDO.is_set():
+            drenar_tarefas_fila(connection)
     except KeyboardInterrupt:
         print("Worker interrompido pelo usuário.")
     except Exception as e:
@@ -524,6 +1224,92 @@ def modo_fila():
                 print("Conexão com RabbitMQ fechada.")
         except Exception as close_error:
             print(f"Erro ao fechar conexão com RabbitMQ: {close_error}")
+        executor.shutdown(wait=True)
+        encerrar_pool_drivers()
+        encerrar_navegador_abas()
+        encerrar_backend_async()
+
+def drenar_tarefas_fila(connection):
+    """
+    Depois do cancelamento do consumo, espera as tarefas em andamento
+    processando os eventos da conexão, para que os acks agendados por elas
+    cheguem ao broker antes de fechar
+    """
+    pendentes = [f for f in list(TAREFAS_FILA) if not f.done()]
+    print(f"Consumo interrompido; aguardando {len(pendentes)} tarefas em andamento.")
+    while any(not f.done() for f in list(TAREFAS_FILA)):
+        connection.process_data_events(time_limit=1)
+    # Acks agendados pelas últimas tarefas
+    connection.process_data_events(time_limit=0)
+    print("Tarefas em andamento concluídas.")
+
+def modo_fila_async(pool_size=None, abas=0, backend="selenium", sessoes=10, concorrencia_max=None):
+    """
+    Modo fila com um único event loop: o consumidor AMQP (aio-pika), as
+    chamadas ao Supabase e as sessões do portal ficam no mesmo loop, e a
+    concorrência é um semáforo do tamanho das vagas em vez de threads por
+    mensagem
+    """
+    print("Iniciando worker no modo fila (runtime assíncrono)...")
+    try:
+        asyncio.run(_modo_fila_async(pool_size, abas, backend, sessoes, concorrencia_max))
+    except KeyboardInterrupt:
+        pass
+
+async def _modo_fila_async(pool_size, abas, backend, sessoes, concorrencia_max):
+    global ASYNC_BACKEND
+    if backend == "async":
+        vagas = sessoes
+        iniciar_controle_concorrencia(min(MAX_WORKERS, sessoes), sessoes if concorrencia_max is None else min(concorrencia_max, sessoes))
+        # O backend roda neste loop, sem thread própria
+        ASYNC_BACKEND = AsyncPortalService(max_sessions=sessoes, headless=True)
+        await ASYNC_BACKEND.start()
+    elif abas > 0:
+        vagas = abas
+        iniciar_controle_concorrencia(min(MAX_WORKERS, abas), abas if concorrencia_max is None else min(concorrencia_max, abas))
+        iniciar_navegador_abas(abas)
+    else:
+        maximo = MAX_WORKERS * 2 if concorrencia_max is None else concorrencia_max
+        iniciar_controle_concorrencia(MAX_WORKERS, maximo)
+        vagas = max(MAX_WORKERS, maximo)
+        iniciar_pool_drivers(vagas if pool_size is None else pool_size)
+    # Threads só para o que bloqueia (Supabase, Selenium e as esperas dos
+    # controles de concorrência e de ritmo)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=vagas * 2 + 4))
+    # O consumidor aio-pika só verifica a fila; a topologia vem de queue_topology
+    await loop.run_in_executor(None, TaskPublisher.get_instance(RABBITMQ_HOST).declare)
+    polling_thread = threading.Thread(target=polling_reenfileira_pendentes, args=(60, 30), daemon=True)
+    polling_thread.start()
+    runtime = AsyncWorkerRuntime(
+        processa_mensagem_async,
+        host=RABBITMQ_HOST,
+        concurrency=vagas,
+        prefetch=vagas
+    )
+    # SIGTERM: o runtime cancela o consumo e termina as tarefas recebidas
+    def _encerrar():
+        solicitar_encerramento()
+        runtime.stop()
+    loop.add_signal_handler(signal.SIGTERM, _encerrar)
+    if ENCERRANDO.is_set():
+        # SIGTERM recebido durante a inicialização dos navegadores
+        runtime.stop()
+    try:
+        await runtime.run()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("Worker interrompido pelo usuário.")
+    except Exception as e:
+        print(f"Erro no modo fila: {e}")
+    finally:
+        if ASYNC_BACKEND is not None:
+            try:
+                await ASYNC_BACKEND.close()
+            except Exception as e:
+                print(f"Erro ao encerrar backend assíncrono: {e}")
+            ASYNC_BACKEND = None
+        encerrar_pool_drivers()
+        encerrar_navegador_abas()
 
 def get_task_by_id(fila_id):
     """
@@ -551,13 +1337,81 @@ if __name__ == '__main__':
     parser.add_argument('--modo', choices=['fila', 'batch'], default='fila', help='Modo de execução: fila (contínuo) ou batch (único)')
     parser.add_argument('--batchsize', type=int, default=30, help='Quantidade de CNPJs a processar em modo batch')
     parser.add_argument('--workers', type=int, default=2, help='Número de workers paralelos em modo batch')
+    parser.add_argument('--pool-size', type=int, default=None, help='Navegadores aquecidos no pool (padrão: um por worker; 0 desativa)')
+    parser.add_argument('--sleeps-fixos', action='store_true', help='Usa os sleeps fixos antigos em vez de esperar por condições no portal')
+    parser.add_argument('--abas', type=int, default=0, help='Processa N CNPJs em abas de um único Chrome (0: um navegador por tarefa)')
+    parser.add_argument('--sem-bloqueio', action='store_true', help='Não bloqueia imagens, fontes e recursos de terceiros no navegador')
+    parser.add_argument('--engine', choices=['auto', 'selenium'], default='auto', help='auto: caminho direto HTTP com fallback Selenium; selenium: sempre navegador')
+    parser.add_argument('--sem-estacionar', action='store_true', help='Não mantém os navegadores do pool estacionados no formulário de CNPJ entre tarefas')
+    parser.add_argument('--backend', choices=['selenium', 'async'], default='selenium', help='selenium: um navegador síncrono por tarefa; async: Playwright com várias sessões em um único event loop')
+    parser.add_argument('--sessoes', type=int, default=10, help='Sessões simultâneas do portal no backend async')
+    parser.add_argument('--sem-perfil-aquecido', action='store_true', help='Inicia cada Chrome com perfil vazio em vez de clonar o perfil modelo com cache do portal')
+    parser.add_argument('--concorrencia-max', type=int, default=None, help='Máximo de consultas simultâneas do controle adaptativo (padrão: o dobro dos workers; 0 mantém a concorrência fixa)')
+    parser.add_argument('--limite-rpm', type=float, default=None, help='Orçamento global de sessões no portal por minuto, somando todos os workers (padrão: GPI_PORTAL_RPM; 0 desativa)')
+    parser.add_argument('--limite-backend', choices=['file', 'rabbitmq'], default=None, help='Onde fica o limite global: file (workers desta máquina) ou rabbitmq (workers em várias máquinas)')
+    parser.add_argument('--runtime', choices=['threads', 'asyncio'], default='threads', help='Modo fila: threads (pika + uma thread por mensagem) ou asyncio (aio-pika e um único event loop)')
+    parser.add_argument('--portal-url', default=None, help='URL inicial do portal (ex.: portal simulado de mock_gpi_portal.py para benchmarks)')
     
     args = parser.parse_args()
     
+    if args.sleeps_fixos:
+        # Lido por WaitPolicy.from_wait_times
+        os.environ["GPI_FIXED_SLEEPS"] = "1"
+    if args.sem_bloqueio:
+        # Lido por RequestBlockingPolicy.from_env
+        os.environ["GPI_REQUEST_BLOCKING"] = "0"
+    if args.sem_estacionar:
+        # Lido por iniciar_pool_drivers
+        os.environ["GPI_PARK_SESSIONS"] = "0"
+    if args.sem_perfil_aquecido:
+        # Lido por ChromeProfileTemplate.enabled
+        os.environ["GPI_PROFILE_CACHE"] = "0"
+    if args.limite_rpm is not None:
+        # Lido por PortalRateLimiter.from_env
+        os.environ["GPI_PORTAL_RPM"] = str(args.limite_rpm)
+    if args.limite_backend:
+        os.environ["GPI_RATE_BACKEND"] = args.limite_backend
+    # Lido por WebService.fetch_certidao
+    os.environ["GPI_ENGINE"] = args.engine
+    if args.portal_url:
+        # Lido por WebService.portal_url
+        os.environ["GPI_PORTAL_URL"] = args.portal_url
+        print(f"Usando portal alternativo: {args.portal_url}")
+    
     print(f"Worker iniciando em modo: {args.modo}")
     
+    # SIGTERM drena o worker em vez de matá-lo no meio das consultas
+    signal.signal(signal.SIGTERM, solicitar_encerramento)
+    
+    # Só os navegadores deste worker são encerrados; órfãos de workers mortos
+    # são varridos em background
+    supervisor = ChromeSupervisor.get_instance()
+    supervisor.sweep_in_background(interval=600)
+    atexit.register(supervisor.reap_owned)
+    # Clones de perfil deixados por workers encerrados
+    ChromeProfileTemplate.get_instance().sweep()
+    
+    # Limites e contagens de reciclagem dos navegadores, entre outras métricas
+    # (GPI_METRICS_FILE grava o snapshot em JSON)
+    WorkerMetrics.get_instance().report_in_background(interval=60)
+    
+    iniciar_limite_portal()
+    # Exclusões feitas pela API chegam a todos os workers em tempo real
+    CancelledTasks.get_instance().listen(RABBITMQ_HOST)
+    # Reivindicações das tarefas em andamento não expiram enquanto o worker vive
+    threading.Thread(target=renovar_reivindicacoes, name="lease-heartbeat", daemon=True).start()
+    
+    if args.backend == 'async' and not AsyncPortalService.available():
+        print("Backend async requer o Playwright: pip install playwright && playwright install chromium")
+        sys.exit(1)
+    if args.modo == 'fila' and args.runtime == 'asyncio' and not AsyncWorkerRuntime.available():
+        print("Runtime asyncio requer o aio-pika: pip install aio-pika")
+        sys.exit(1)
+    
     if args.modo == 'batch':
-        modo_batch(args.batchsize, args.workers)
+        modo_batch(args.batchsize, args.workers, args.pool_size, args.abas, args.backend, args.sessoes, args.concorrencia_max)
+    elif args.runtime == 'asyncio':
+        modo_fila_async(args.pool_size, args.abas, args.backend, args.sessoes, args.concorrencia_max)
     else:
-        modo_fila() 
+        modo_fila(args.pool_size, args.abas, args.backend, args.sessoes, args.concorrencia_max) 
         
\ No newline at end of file